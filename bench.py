@@ -0,0 +1,47 @@
+if __name__ == '__main__':
+    from website.benchmark import compare, format_results, load_baseline, run_benchmark, save_baseline
+    from website.synthetic_db import build_synthetic_db
+    import argparse
+    import logging
+    import sys
+
+    parser = argparse.ArgumentParser(description="Benchmark every route against a synthetic database.")
+    parser.add_argument("--divisions", type=int, default=6)
+    parser.add_argument("--contestants", type=int, default=40, help="contestants per division")
+    parser.add_argument("--matches", type=int, default=5000)
+    parser.add_argument("--titles", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=20, help="timed requests per route")
+    parser.add_argument("--only", default=None, help="only routes containing this text")
+    parser.add_argument("--sqlite", default=None, help="SQLite file standing in for SQL Server")
+    parser.add_argument("--save", default=None, help="store the results as a baseline JSON file")
+    parser.add_argument("--compare", default=None, help="baseline JSON file to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25, help="growth factor counted as a regression")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    fixture = {"divisions": args.divisions, "contestants": args.contestants, "matches": args.matches,
+               "titles": args.titles, "seed": args.seed}
+    db = build_synthetic_db(**fixture)
+    results, missing = run_benchmark(db, iterations=args.iterations, only=args.only, sqlite_path=args.sqlite)
+
+    comparison = None
+    if args.compare:
+        baseline = load_baseline(args.compare)
+        if baseline.get("fixture") != fixture:
+            print(f"warning: baseline fixture {baseline.get('fixture')} differs from {fixture}")
+        comparison = compare(results, baseline, args.threshold)
+
+    print(f"{args.divisions} divisions, {args.contestants} contestants each, {args.matches} matches, "
+          f"{args.titles} titles, {args.iterations} requests per route")
+    print(format_results(results, comparison))
+    for result in results:
+        if result.error:
+            print(f"{result.route}: {result.error}")
+    if missing:
+        print("routes without a scenario: " + ", ".join(missing))
+    if args.save:
+        save_baseline(args.save, results, fixture)
+
+    # Non-zero exit for CI when a route got slower
+    sys.exit(1 if comparison and any(row["regressed"] for row in comparison) else 0)
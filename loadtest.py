@@ -0,0 +1,30 @@
+if __name__ == '__main__':
+    from website.loadtest import format_result, parse_mix, run_load_test, USER_MIXES
+    from website.synthetic_db import build_synthetic_db
+    import argparse
+    import asyncio
+    import logging
+
+    parser = argparse.ArgumentParser(description="Load-test the website offline with SQLite and Discord stand-ins.")
+    parser.add_argument("--mix", default="mixed",
+                        help=f"one of {', '.join(USER_MIXES)}, or action=weight pairs, e.g. rankings=3,submit_ballot=1")
+    parser.add_argument("--rps", type=float, default=20.0, help="requests started per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep starting requests")
+    parser.add_argument("--users", type=int, default=50, help="virtual users, each with their own session")
+    parser.add_argument("--max-in-flight", type=int, default=200)
+    parser.add_argument("--sqlite", default="loadtest.db", help="SQLite file standing in for SQL Server")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="seconds per fake Discord request")
+    parser.add_argument("--divisions", type=int, default=6)
+    parser.add_argument("--contestants", type=int, default=40, help="contestants per division")
+    parser.add_argument("--matches", type=int, default=5000)
+    parser.add_argument("--titles", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    db = build_synthetic_db(divisions=args.divisions, contestants=args.contestants, matches=args.matches,
+                            titles=args.titles, seed=args.seed)
+    result = asyncio.run(run_load_test(db, parse_mix(args.mix), rps=args.rps, duration=args.duration, users=args.users,
+                                       max_in_flight=args.max_in_flight, seed=args.seed, sqlite_path=args.sqlite,
+                                       discord_latency=args.discord_latency))
+    print(format_result(result))
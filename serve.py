@@ -0,0 +1,24 @@
+if __name__ == '__main__':
+    from website.prefork import measure_overhead, RestartPolicy, serve
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Serve the website from pre-forked workers sharing one database.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="defaults to CPU count")
+    parser.add_argument("--max-quick-exits", type=int, default=5,
+                        help="give up after this many workers in a row exit right after starting")
+    parser.add_argument("--measure", action="store_true", help="report per-worker memory overhead and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.measure:
+        for freeze in (False, True):
+            reports = measure_overhead(workers=args.workers or 4, freeze=freeze)
+            print(f"gc.freeze() {'on' if freeze else 'off'} (KiB)")
+            for name, memory in zip(["master", *[f"worker {i}" for i in range(len(reports) - 1)]], reports):
+                print(f"  {name:>9}: rss={memory.get('Rss')} pss={memory.get('Pss')} "
+                      f"private_dirty={memory.get('Private_Dirty')} shared={memory.get('Shared_Clean', 0) + memory.get('Shared_Dirty', 0)}")
+    else:
+        serve(args.host, args.port, args.workers, restart_policy=RestartPolicy(max_quick_exits=args.max_quick_exits))
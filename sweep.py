@@ -0,0 +1,23 @@
+if __name__ == '__main__':
+    from mmr_database.mmrDB import mmrDB
+    from website.backtest import MatchArrays, format_table, parameter_grid, parameter_random, run_sweep
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rank rating parameters by how well they predict results.")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to CPU count")
+    parser.add_argument("--random", type=int, default=0, help="random search samples instead of the grid")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--top", type=int, default=25, help="rows to print")
+    args = parser.parse_args()
+
+    db = mmrDB(DOWNLOAD_DB=False, DISABLE_RANKINGS=True)
+    arrays = MatchArrays.from_db(db)
+
+    if args.random:
+        candidates = parameter_random(args.random, seed=args.seed, k_factor=(8, 64), reset=(0, 1))
+    else:
+        candidates = parameter_grid(k_factor=[8, 16, 24, 32, 48, 64], reset=[0, 0.25, 0.5, 0.75, 1])
+
+    results = run_sweep(arrays, candidates, workers=args.workers)
+    print(f"{len(arrays)} pairings, {len(arrays.names)} contestants, {len(candidates)} parameter sets")
+    print(format_table(results, limit=args.top))
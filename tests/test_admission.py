@@ -0,0 +1,135 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from website.admission import AdmissionLimiter, request_key, run_expensive, SingleFlight
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def request(path: str, query: bytes) -> Request:
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query, "headers": []})
+
+
+@pytest.mark.anyio
+async def test_limiter_queue_full_and_timeout():
+    limiter = AdmissionLimiter("graphs", concurrency=1, queue_size=1, timeout=0.05)
+    slot = await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.waiting == 1
+
+    # The queue is full, turned away at once
+    with pytest.raises(HTTPException) as full:
+        await limiter.acquire()
+    assert full.value.status_code == 429
+    assert full.value.headers["Retry-After"] == "1"
+
+    # Nothing freed up within the timeout
+    with pytest.raises(HTTPException) as busy:
+        await waiter
+    assert busy.value.status_code == 503
+
+    slot.release()
+    slot.release()
+    assert (limiter.running, limiter.waiting, limiter.admitted, limiter.rejected, limiter.timed_out) == (0, 0, 1, 1, 1)
+
+
+@pytest.mark.anyio
+async def test_limiter_hands_the_slot_to_a_waiter():
+    limiter = AdmissionLimiter("stats", concurrency=1, queue_size=4, timeout=5)
+    slot = await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    # Released from another thread, like a streamed download finishing
+    thread = threading.Thread(target=slot.release)
+    thread.start()
+    thread.join()
+    async with await waiter:
+        assert limiter.running == 1
+    assert limiter.running == 0
+
+
+@pytest.mark.anyio
+async def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    runs = []
+
+    def computation(key):
+        async def compute():
+            runs.append(key)
+            await release.wait()
+            return f"{key} {len(runs)}"
+        return compute
+
+    calls = [asyncio.create_task(flight.do("key", computation("key"))) for _ in range(5)]
+    other = asyncio.create_task(flight.do("other", computation("other")))
+    while len(runs) < 2:
+        await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*calls) == ["key 2"] * 5
+    assert await other == "other 2"
+    assert (flight.started, flight.coalesced) == (2, 4)
+
+    # Nothing is kept once it finished
+    assert await flight.do("key", computation("key")) == "key 3"
+
+
+@pytest.mark.anyio
+async def test_single_flight_errors_reach_every_waiter():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def fail():
+        await release.wait()
+        raise ValueError("bad query")
+
+    calls = [asyncio.create_task(flight.do("key", fail)) for _ in range(3)]
+    await asyncio.sleep(0)
+    # A caller that gives up does not cancel the computation for the others
+    calls[0].cancel()
+    release.set()
+
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert all(isinstance(result, ValueError) for result in results[1:])
+
+    async def succeed():
+        return "ok"
+
+    assert await flight.do("key", succeed) == "ok"
+
+
+def test_request_key_ignores_query_order():
+    assert request_key(request("/graphs", b"b=2&a=1")) == request_key(request("/graphs", b"a=1&b=2"))
+    assert request_key(request("/graphs", b"a=1")) != request_key(request("/graphs", b"a=2"))
+    assert request_key(request("/graphs", b"")) != request_key(request("/stats", b""))
+    repeated = request_key(request("/stats", b"range=a:1:&range=b::2"))
+    assert repeated == request_key(request("/stats", b"range=b::2&range=a:1:"))
+
+
+@pytest.mark.anyio
+async def test_run_expensive_runs_once_in_a_thread():
+    threads = []
+    release = threading.Event()
+
+    def render(value):
+        threads.append(threading.get_ident())
+        release.wait(5)
+        return value * 2
+
+    calls = [asyncio.create_task(run_expensive("graphs", ("/graphs_mmr/test", ()), render, 21)) for _ in range(4)]
+    await asyncio.sleep(0.05)
+    release.set()
+    assert await asyncio.gather(*calls) == [42] * 4
+    assert len(threads) == 1 and threads[0] != threading.get_ident()
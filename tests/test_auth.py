@@ -0,0 +1,21 @@
+from website.auth import BasicAuthenticator
+
+
+def test_passwords_hashed_on_first_use(monkeypatch):
+    hashed = []
+    original = BasicAuthenticator._hash
+    monkeypatch.setattr(BasicAuthenticator, "_hash", lambda self, password, salt: hashed.append(password)
+                        or original(self, password, salt))
+    authenticator = BasicAuthenticator({"admin": "secret", b"other": b"pass"}, "key", iterations=1000)
+    assert hashed == []
+
+    assert authenticator.verify("admin", "secret") == "admin"
+    assert hashed == [b"secret", b"secret"]
+    assert authenticator.verify("admin", "wrong") is None
+    assert authenticator.verify("nobody", "secret") is None
+    assert b"pass" not in hashed
+
+    authenticator.prepare()
+    assert hashed.count(b"pass") == 1
+    assert authenticator.verify("other", "pass") == "other"
+    assert hashed.count(b"pass") == 2
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from website import backtest
+from website.backtest import format_table, MatchArrays, parameter_grid, replay, run_sweep
+from website.synthetic_db import build_synthetic_db
+
+
+@pytest.fixture(scope="module")
+def arrays() -> MatchArrays:
+    arrays = MatchArrays.from_db(build_synthetic_db(divisions=2, contestants=10, matches=400, titles=2))
+    # An odd length puts the arrays after the int16 year column at odd offsets unless they are aligned
+    if len(arrays) % 2 == 0:
+        arrays = MatchArrays(names=arrays.names, titles=arrays.titles,
+                             **{field: getattr(arrays, field)[:-1] for field in MatchArrays.ARRAY_FIELDS})
+    return arrays
+
+
+def test_shared_arrays_are_aligned(arrays):
+    shm, layout = backtest._share(arrays)
+    try:
+        for field, dtype, offset, length in layout:
+            assert offset % np.dtype(dtype).alignment == 0
+            view = np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            assert view.flags.aligned
+            np.testing.assert_array_equal(view, getattr(arrays, field))
+            del view
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_sweep_matches_serial_replay(arrays):
+    candidates = parameter_grid(k_factor=[16, 32], reset=[0, 0.5])
+    results = run_sweep(arrays, candidates, workers=2)
+
+    serial = {result.params: result for result in (replay(arrays, params) for params in candidates)}
+    assert len(results) == len(candidates)
+    for result in results:
+        assert result.log_loss == pytest.approx(serial[result.params].log_loss)
+        assert result.accuracy == pytest.approx(serial[result.params].accuracy)
+    assert [result.log_loss for result in results] == sorted(result.log_loss for result in results)
+
+    lines = format_table(results, limit=3).splitlines()
+    assert lines[0].split() == ["rank", "k_factor", "initial", "reset", "scale", "log_loss", "brier", "accuracy",
+                                "runtime_s"]
+    assert len(lines) == 4
+    assert lines[1].split()[0] == "1"
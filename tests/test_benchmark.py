@@ -0,0 +1,18 @@
+from website.benchmark import compare, RouteResult
+
+
+def test_compare_skips_failed_routes():
+    baseline = {"routes": {
+        "GET /ok": {"p50_ms": 1.0, "p95_ms": 2.0, "peak_kib": 10.0, "status": 200, "error": ""},
+        "GET /failing": {"p50_ms": 1.0, "p95_ms": 2.0, "peak_kib": 10.0, "status": 200, "error": ""},
+        "GET /old_500": {"p50_ms": 1.0, "p95_ms": 2.0, "peak_kib": 10.0, "status": 500, "error": ""},
+    }}
+    results = [
+        RouteResult("GET /ok", "/ok", 200, p50_ms=1.0, p95_ms=5.0, peak_kib=10.0),
+        RouteResult("GET /failing", "/failing", 500, p50_ms=0.5, p95_ms=0.6, error="status 500"),
+        RouteResult("GET /old_500", "/old_500", 200, p50_ms=1.0, p95_ms=2.0, peak_kib=10.0),
+    ]
+
+    rows = compare(results, baseline)
+    assert [row["route"] for row in rows] == ["GET /ok"]
+    assert rows[0]["regressed"]
@@ -0,0 +1,246 @@
+import asyncio
+import contextlib
+import types
+import uuid
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from website import discord, session_backends
+from website.session_backends import TTLBackend
+
+GUILD_ID = "100"
+ELITE_ID = "200"
+MOD_ID = "300"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def discord_ids(monkeypatch):
+    monkeypatch.setenv("OAUTHLIB_INSECURE_TRANSPORT", "1")
+    monkeypatch.setattr(discord, "aewfanhub_id", GUILD_ID)
+    monkeypatch.setattr(discord, "elite_id", ELITE_ID)
+    monkeypatch.setattr(discord, "mod_id", MOD_ID)
+    monkeypatch.setattr(discord, "my_user_id", "1")
+
+
+class StubDiscord:
+    """
+    Discord API stand-in: the code of a login is the user id, the access token is "token-<user id>".
+    """
+
+    def __init__(self):
+        self.roles: dict[str, list[str]] = {}
+        self.revoked: set[str] = set()
+        self.requests: dict[str, int] = {}
+        # Cleared to hold member and identify requests until set again
+        self.member_gate = asyncio.Event()
+        self.member_gate.set()
+        self.me_gate = asyncio.Event()
+        self.me_gate.set()
+        self.app = web.Application()
+        self.app.router.add_post("/oauth2/token", self.token)
+        self.app.router.add_get("/users/@me", self.me)
+        self.app.router.add_get("/users/@me/guilds", self.guilds)
+        self.app.router.add_get("/users/@me/guilds/{guild}/member", self.member)
+
+    def _user(self, request: web.Request, name: str) -> str:
+        self.requests[name] = self.requests.get(name, 0) + 1
+        user_id = request.headers["Authorization"].rpartition("token-")[2]
+        if user_id in self.revoked:
+            raise web.HTTPUnauthorized()
+        return user_id
+
+    async def token(self, request: web.Request) -> web.Response:
+        self.requests["token"] = self.requests.get("token", 0) + 1
+        form = await request.post()
+        return web.json_response({"access_token": f"token-{form['code']}", "token_type": "Bearer",
+                                  "expires_in": 604800, "refresh_token": "refresh", "scope": "identify guilds"})
+
+    async def me(self, request: web.Request) -> web.Response:
+        user_id = self._user(request, "me")
+        await self.me_gate.wait()
+        return web.json_response({"id": user_id, "username": f"user{user_id}", "discriminator": "0001",
+                                  "avatar": None, "flags": 0})
+
+    async def guilds(self, request: web.Request) -> web.Response:
+        self._user(request, "guilds")
+        return web.json_response([{"id": GUILD_ID, "name": "AEW", "icon": None, "owner": False,
+                                   "permissions": "0", "features": []}])
+
+    async def member(self, request: web.Request) -> web.Response:
+        user_id = self._user(request, "member")
+        await self.member_gate.wait()
+        return web.json_response({"roles": self.roles.get(user_id, [])})
+
+
+class MemoryBackend:
+    """
+    Session backend with the methods the refresher uses.
+    """
+
+    def __init__(self):
+        self.data: dict[uuid.UUID, object] = {}
+
+    def add(self, roles) -> str:
+        session_id = uuid.uuid4()
+        self.data[session_id] = roles
+        return str(session_id)
+
+    def peek(self, session_id: uuid.UUID):
+        return self.data.get(session_id)
+
+    async def update(self, session_id: uuid.UUID, roles):
+        self.data[session_id] = roles
+
+    async def delete(self, session_id: uuid.UUID):
+        self.data.pop(session_id, None)
+
+
+@contextlib.asynccontextmanager
+async def stub_discord(monkeypatch):
+    stub = StubDiscord()
+    server = TestServer(stub.app)
+    await server.start_server()
+    monkeypatch.setattr(discord, "API_URL", str(server.make_url("")).rstrip("/"))
+    client = discord.CustomDiscordOAuthClient("client", "secret", "http://localhost/callback", ("identify", "guilds"))
+    try:
+        yield stub, client
+    finally:
+        await client.close()
+        await server.close()
+
+
+async def login(cache: discord.DiscordRoleCache, client: discord.CustomDiscordOAuthClient, backend: MemoryBackend,
+                user_id: str):
+    # What /discord/callback does
+    session = client.session(user_id)
+    try:
+        roles = await cache.lookup(session)
+    finally:
+        await session.close()
+    session_id = backend.add(roles) if roles else None
+    cache.store(str(session.cached_user.id), roles, session.token, session_id)
+    return roles, session_id
+
+
+@pytest.mark.anyio
+async def test_fanhub_roles(monkeypatch):
+    async with stub_discord(monkeypatch) as (stub, client):
+        stub.roles = {"1": [ELITE_ID, MOD_ID], "2": [MOD_ID]}
+
+        session = client.session("1")
+        try:
+            roles = await session.get_fanhub_roles()
+        finally:
+            await session.close()
+        assert roles.username == "user1#0001"
+        assert roles.web_admin and roles.fanhub_user and roles.fanhub_elite and roles.fanhub_admin
+
+        session = client.session("2")
+        try:
+            assert await session.get_fanhub_roles() is False
+        finally:
+            await session.close()
+
+
+@pytest.mark.anyio
+async def test_login_requests_run_in_one_round_trip(monkeypatch):
+    async with stub_discord(monkeypatch) as (stub, client):
+        stub.roles = {"5": [ELITE_ID]}
+        cache = discord.DiscordRoleCache(client)
+        backend = MemoryBackend()
+
+        # Member and guilds are requested while identify is still waiting
+        stub.me_gate.clear()
+        first_login = asyncio.create_task(login(cache, client, backend, "5"))
+        while stub.requests.get("member", 0) < 1 or stub.requests.get("guilds", 0) < 1:
+            await asyncio.sleep(0.01)
+        assert not first_login.done()
+        stub.me_gate.set()
+        roles, first = await first_login
+        assert roles.fanhub_elite
+
+        roles, second = await login(cache, client, backend, "5")
+        assert roles.fanhub_elite
+        assert stub.requests == {"token": 2, "me": 2, "guilds": 2, "member": 2}
+        # Cached under the identified user, with both sessions linked
+        assert cache.get("5") == roles
+        assert cache._entries["5"][3] == {first, second}
+
+
+@pytest.mark.anyio
+async def test_refresh_applies_role_changes(monkeypatch):
+    async with stub_discord(monkeypatch) as (stub, client):
+        stub.roles = {"5": [ELITE_ID, MOD_ID], "6": [ELITE_ID]}
+        cache = discord.DiscordRoleCache(client, ttl=0)
+        backend = MemoryBackend()
+        _, moderator = await login(cache, client, backend, "5")
+        _, revoked = await login(cache, client, backend, "6")
+
+        stub.roles["5"] = [ELITE_ID]
+        stub.revoked.add("6")
+        assert await cache.refresh(backend) == 2
+
+        assert not backend.peek(uuid.UUID(moderator)).fanhub_admin
+        assert backend.peek(uuid.UUID(revoked)) is None
+        assert "6" not in cache._entries
+
+
+@pytest.mark.anyio
+async def test_refresh_keeps_sessions_linked_during_the_request(monkeypatch):
+    async with stub_discord(monkeypatch) as (stub, client):
+        stub.roles = {"5": [ELITE_ID, MOD_ID]}
+        cache = discord.DiscordRoleCache(client, ttl=0)
+        backend = MemoryBackend()
+        _, old = await login(cache, client, backend, "5")
+
+        stub.roles["5"] = [ELITE_ID]
+        stub.member_gate.clear()
+        refresh = asyncio.create_task(cache.refresh(backend))
+        while stub.requests.get("member", 0) < 2:
+            await asyncio.sleep(0.01)
+
+        # A login while the refresher waits on Discord, served from the entry being refreshed
+        entry = cache._entries["5"]
+        new = backend.add(entry[0])
+        cache.store("5", entry[0], entry[1], new, fetched=False)
+        stub.member_gate.set()
+        await refresh
+
+        assert cache._entries["5"] is entry
+        assert entry[3] == {old, new}
+        assert not entry[0].fanhub_admin
+        assert not backend.peek(uuid.UUID(new)).fanhub_admin
+
+
+@pytest.mark.anyio
+async def test_refresh_does_not_renew_sessions(monkeypatch):
+    now = [1000.0]
+    # Only the session backend's clock, the event loop keeps the real one
+    monkeypatch.setattr(session_backends, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    async with stub_discord(monkeypatch) as (stub, client):
+        stub.roles = {"5": [ELITE_ID, MOD_ID]}
+        cache = discord.DiscordRoleCache(client, ttl=0)
+        backend = TTLBackend(ttl=10)
+
+        session = client.session("5")
+        try:
+            roles = await cache.lookup(session)
+        finally:
+            await session.close()
+        session_id = uuid.uuid4()
+        await backend.create(session_id, roles)
+        cache.store("5", roles, session.token, str(session_id))
+
+        now[0] += 8
+        stub.roles["5"] = [ELITE_ID]
+        assert await cache.refresh(backend) == 1
+        assert not backend.peek(session_id).fanhub_admin
+        now[0] += 3
+        assert backend.peek(session_id) is None
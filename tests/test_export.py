@@ -0,0 +1,67 @@
+import io
+import json
+
+import pytest
+
+from website import export
+from website.synthetic_db import build_synthetic_db
+
+pyarrow = pytest.importorskip("pyarrow")
+import pyarrow.parquet  # noqa: E402
+
+
+def read_parquet(chunks) -> "pyarrow.Table":
+    return pyarrow.parquet.read_table(io.BytesIO(b"".join(chunks)))
+
+
+@pytest.fixture(scope="module")
+def rows() -> list[dict]:
+    return list(export.match_rows(build_synthetic_db(divisions=2, contestants=10, matches=300, titles=2)))
+
+
+def test_parquet_column_empty_in_first_chunk(monkeypatch):
+    monkeypatch.setattr(export, "CHUNK_ROWS", 2)
+    rows = [{"name": "a", "note": None, "score": 1}, {"name": "b", "note": None, "score": 2},
+            {"name": "c", "note": "late", "score": 3}]
+
+    table = read_parquet(export.encode(iter(rows), ["name", "note", "score"], "parquet"))
+    assert table.schema.field("note").type == pyarrow.string()
+    assert table.schema.field("score").type == pyarrow.int64()
+    assert table.to_pylist() == rows
+
+
+def test_parquet_match_types(monkeypatch, rows):
+    monkeypatch.setattr(export, "CHUNK_ROWS", 50)
+    columns, projected = export.project(rows)
+
+    table = read_parquet(export.encode(projected, columns, "parquet", export.MATCH_TYPES))
+    assert table.schema.field("draw").type == pyarrow.bool_()
+    assert table.to_pylist() == rows
+
+    empty = read_parquet(export.encode(iter(()), ["date", "draw"], "parquet", export.MATCH_TYPES))
+    assert empty.num_rows == 0
+    assert empty.schema.field("draw").type == pyarrow.bool_()
+
+
+def test_csv_and_ndjson(rows):
+    columns, projected = export.project(rows, ["date", "winners"])
+    lines = b"".join(export.encode(projected, columns, "csv")).decode().splitlines()
+    assert lines[0] == "date,winners"
+    assert len(lines) == len(rows) + 1
+
+    columns, projected = export.project(rows)
+    decoded = [json.loads(line) for line in b"".join(export.encode(projected, columns, "ndjson")).splitlines()]
+    assert decoded == rows
+
+
+def test_benchmark(rows):
+    results = export.benchmark(rows, repeat=1)
+    assert set(results) == set(export.MEDIA_TYPES)
+    assert all(rate > 0 for rate in results.values())
+
+
+def test_parquet_without_pyarrow(monkeypatch, rows):
+    monkeypatch.setattr(export, "pyarrow", None)
+    with pytest.raises(ValueError):
+        export.encode(iter(rows), ["date"], "parquet")
+    assert "parquet" not in export.benchmark(rows[:10], repeat=1)
@@ -0,0 +1,99 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from website import metrics
+from website.stand_ins import SQLiteDatabase
+
+
+def samples(text: str) -> dict[str, str]:
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+
+def test_histogram_buckets():
+    histogram = metrics.Histogram("latency_seconds", "Latency.", ("route",), buckets=(1.0, 0.1, 0.5))
+    for value in (0.05, 0.1, 0.3, 0.7, 2.0):
+        histogram.observe(value, "/")
+
+    assert histogram.buckets == (0.1, 0.5, 1.0)
+    assert histogram.count("/") == 5
+    assert histogram.count("/other") == 0
+    # Cumulative, with the bound itself in its bucket
+    assert samples("\n".join(histogram.render())) == {
+        'latency_seconds_bucket{route="/",le="0.1"}': "2",
+        'latency_seconds_bucket{route="/",le="0.5"}': "3",
+        'latency_seconds_bucket{route="/",le="1"}': "4",
+        'latency_seconds_bucket{route="/",le="+Inf"}': "5",
+        'latency_seconds_sum{route="/"}': "3.15",
+        'latency_seconds_count{route="/"}': "5",
+    }
+
+
+def test_label_escaping():
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter("odd_total", "Odd labels.", ("value",)))
+    counter.inc('back\\slash "quoted"\nnewline')
+    registry.add_collector(lambda: [("collected", "gauge", "Collected.", [({"value": 'a"b'}, 1.5)])])
+
+    lines = registry.render().splitlines()
+    assert 'odd_total{value="back\\\\slash \\"quoted\\"\\nnewline"} 1' in lines
+    assert 'collected{value="a\\"b"} 1.5' in lines
+
+
+def test_exposition_format():
+    registry = metrics.Registry()
+    registry.register(metrics.Gauge("idle", "Never set."))
+    jobs = registry.register(metrics.Counter("jobs_total", "Jobs.", ("kind",)))
+    jobs.inc("b", amount=2)
+    jobs.inc("a")
+    registry.add_collector(lambda: [("workers", "gauge", "Workers.", [({}, 3)])])
+
+    assert registry.render() == (
+        "# HELP idle Never set.\n"
+        "# TYPE idle gauge\n"
+        "# HELP jobs_total Jobs.\n"
+        "# TYPE jobs_total counter\n"
+        'jobs_total{kind="a"} 1\n'
+        'jobs_total{kind="b"} 2\n'
+        "# HELP workers Workers.\n"
+        "# TYPE workers gauge\n"
+        "workers 3\n"
+    )
+
+
+def test_middleware_labels_route_templates(monkeypatch):
+    monkeypatch.setattr(metrics, "requests_total", metrics.Counter("r", "", ("method", "route", "status")))
+    monkeypatch.setattr(metrics, "request_seconds", metrics.Histogram("s", "", ("method", "route")))
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.get("/items/{item}")(lambda item: {"item": item})
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/missing")
+
+    assert metrics.requests_total.value("GET", "/items/{item}", "200") == 2
+    assert metrics.requests_total.value("GET", "unmatched", "404") == 1
+    assert metrics.request_seconds.count("GET", "/items/{item}") == 2
+    assert metrics.requests_in_flight.value() == 0
+
+
+def test_sql_methods_recorded(tmp_path):
+    operations = ("connect", "add_user_activity", "create_table", "close")
+    before = {operation: metrics.sql_seconds.count(operation) for operation in operations}
+    errors_before = metrics.sql_errors_total.value("create_table")
+    open_before = metrics.sql_connections_open.value()
+
+    sql = SQLiteDatabase(str(tmp_path / "metrics.db"))
+    assert metrics.sql_connections_open.value() == open_before + 1
+    sql.add_user_activity("127.0.0.1", "guest", "2024-01-01 12:00:00 AM", "/")
+    with pytest.raises(Exception):
+        sql.create_table("UserActivity", [("id", "INTEGER")])
+    sql.close()
+    assert metrics.sql_connections_open.value() == open_before
+
+    # Overridden and inherited methods, once per call (connecting creates the two tables)
+    calls = {operation: metrics.sql_seconds.count(operation) - before[operation] for operation in operations}
+    assert calls == {"connect": 1, "add_user_activity": 1, "create_table": 3, "close": 1}
+    assert metrics.sql_errors_total.value("create_table") == errors_before + 1
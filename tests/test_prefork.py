@@ -0,0 +1,104 @@
+import os
+import signal
+import time
+
+import pytest
+import uvicorn
+
+from website import prefork
+from website.prefork import measure_overhead, request_reload, RestartPolicy, worker_memory
+from website.synthetic_db import build_synthetic_db
+
+pytestmark = pytest.mark.skipif(not worker_memory(), reason="needs /proc/self/smaps_rollup and os.fork")
+
+
+@pytest.fixture(scope="module")
+def db_and_size():
+    before = worker_memory()["Rss"]
+    db = build_synthetic_db(matches=20000, contestants=80)
+    return db, worker_memory()["Rss"] - before
+
+
+def _serve_rankings(db):
+    # What a worker serving rankings and recent matches reads
+    def workload():
+        for division in db.divisions:
+            for contestant in division.contestants:
+                str(contestant)
+        for match in db.matches[-200:]:
+            match.to_json()
+    return workload
+
+
+def test_workers_share_the_database(db_and_size):
+    db, db_kib = db_and_size
+    master, *workers = measure_overhead(workers=2, freeze=True, workload=_serve_rankings(db), prepare=lambda: None)
+
+    assert len(workers) == 2
+    for memory in workers:
+        # Copied pages stay a small fraction of the database, the rest is still shared with the master
+        assert memory["Private_Dirty"] < 0.25 * db_kib
+        assert memory["Shared_Clean"] + memory["Shared_Dirty"] > 0.5 * db_kib
+
+
+def test_failing_workload_does_not_escape_the_child(db_and_size):
+    pid = os.getpid()
+
+    def fail():
+        raise RuntimeError("workload failed")
+
+    reports = measure_overhead(workers=2, workload=fail, prepare=lambda: None)
+    assert os.getpid() == pid
+    assert reports[1:] == [{}, {}]
+
+
+def test_restart_policy_backs_off_and_gives_up():
+    policy = RestartPolicy(quick_exit=5, base_delay=1, max_delay=3, max_quick_exits=4)
+    assert [policy.delay(0.1) for _ in range(3)] == [1, 2, 3]
+    assert policy.delay(60) == 0
+    assert [policy.delay(0.1) for _ in range(4)] == [1, 2, 3, None]
+
+
+def test_request_reload_signals_the_master_only(monkeypatch):
+    signalled = []
+    monkeypatch.setattr(os, "kill", lambda pid, signum: signalled.append((pid, signum)))
+
+    monkeypatch.delenv(prefork.MASTER_PID_VARIABLE, raising=False)
+    assert not request_reload()
+    # A variable left over from another process tree
+    monkeypatch.setenv(prefork.MASTER_PID_VARIABLE, str(os.getpid()))
+    assert not request_reload()
+    assert signalled == []
+
+    monkeypatch.setenv(prefork.MASTER_PID_VARIABLE, str(os.getppid()))
+    assert request_reload()
+    assert signalled == [(os.getppid(), prefork.RELOAD_SIGNAL)]
+
+
+def test_serve_gives_up_on_workers_that_exit_at_once(monkeypatch):
+    monkeypatch.setattr(prefork, "_prepare_master", lambda: None)
+    # Every worker exits as soon as it starts
+    monkeypatch.setattr(uvicorn.Server, "run", lambda self, sockets=None: None)
+    policy = RestartPolicy(base_delay=0.01, max_quick_exits=3)
+
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            prefork.serve("127.0.0.1", 0, workers=2, restart_policy=policy)
+        except RuntimeError:
+            status = 3
+        finally:
+            os._exit(status)
+
+    deadline = time.monotonic() + 20
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            break
+        if time.monotonic() > deadline:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            pytest.fail("serve kept restarting workers")
+        time.sleep(0.05)
+    assert os.waitstatus_to_exitcode(status) == 3
@@ -0,0 +1,60 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from website.rank_history import lttb, RankHistory
+from website.synthetic_db import build_synthetic_db
+
+
+@pytest.fixture(scope="module")
+def history() -> RankHistory:
+    return RankHistory.from_db(build_synthetic_db(divisions=2, contestants=10, matches=300, titles=2))
+
+
+def test_rank_changes_limit(history):
+    start, end = datetime.date(2000, 1, 1), datetime.date.today()
+    everyone = history.rank_changes(start, end)
+    assert len(everyone) > 3
+    assert history.rank_changes(start, end, limit=3) == everyone[:3]
+    assert history.rank_changes(start, end, limit=0) == []
+
+    with pytest.raises(ValueError):
+        history.rank_changes(start, end, limit=-1)
+    with pytest.raises(ValueError):
+        history.rankings(end, limit=-1)
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 5, 10])
+def test_lttb_short_lines_unchanged(n):
+    x = np.arange(n)
+    assert lttb(x, np.sin(x), 10).tolist() == list(range(n))
+
+
+@pytest.mark.parametrize("n, points", [(11, 10), (100, 10), (1000, 37), (1000, 3), (50, 1)])
+def test_lttb_keeps_endpoints_and_length(n, points):
+    rng = np.random.default_rng(n)
+    x = np.cumsum(rng.integers(1, 5, n))
+    kept = lttb(x, rng.normal(size=n), points)
+
+    assert len(kept) == max(points, 3)
+    assert kept[0] == 0 and kept[-1] == n - 1
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    y = np.zeros(1000)
+    y[437] = 50
+    assert 437 in lttb(np.arange(1000), y, 20)
+
+
+def test_trajectory_downsampled(history):
+    name = max(history.names, key=lambda name: history.trajectory(name)["entries"])
+    full = history.trajectory(name)
+    points = full["entries"] // 2
+    assert points >= 3
+
+    downsampled = history.trajectory(name, points=points)
+    assert downsampled["entries"] == full["entries"]
+    assert len(downsampled["dates"]) == len(downsampled["mmr"]) == points
+    assert downsampled["dates"][0] == full["dates"][0] and downsampled["dates"][-1] == full["dates"][-1]
@@ -0,0 +1,15 @@
+import subprocess
+import sys
+
+from website.rankings_card import render_rankings_card
+
+
+def test_import_does_not_load_matplotlib():
+    code = "import sys, website.rankings_card; sys.exit('matplotlib' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+
+
+def test_render():
+    rankings = {"Men": [{"Rank": 1, "Name": '<a href="/wrestlers/A">A</a>', "MMR": 1000}], "Women": []}
+    png = render_rankings_card(rankings, {"date": "2024-01-01", "event": "Dynamite"})
+    assert png.startswith(b"\x89PNG")
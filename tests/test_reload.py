@@ -0,0 +1,41 @@
+import numpy as np
+
+from website.match_store import MatchStore
+from website.rank_history import RankHistory
+from website.reload import DatabaseHolder
+from website.synthetic_db import build_synthetic_db, SyntheticContestant
+from website.title_index import TitleIndex
+from website.util import wrestler_histories
+
+
+def test_structures_share_one_history_read_per_load(monkeypatch):
+    db = build_synthetic_db(divisions=2, contestants=10, matches=300, titles=2)
+    calls = []
+    original = SyntheticContestant.api_wrestlers
+    monkeypatch.setattr(SyntheticContestant, "api_wrestlers", lambda self: calls.append(self) or original(self))
+
+    holder = DatabaseHolder(lambda: db)
+    holder.register("wrestler_histories", wrestler_histories)
+    holder.register("match_store", MatchStore.from_db, requires=("wrestler_histories",))
+    holder.register("rank_history", RankHistory.from_db, requires=("wrestler_histories",))
+    holder.register("title_index", TitleIndex.from_db, requires=("wrestler_histories",))
+    holder.load()
+
+    names = {str(contestant) for division in db.divisions for contestant in division.contestants}
+    assert len(calls) == len(names)
+
+    # Same result as reading the histories in each builder
+    store = holder.derived("match_store")
+    alone = MatchStore.from_db(db)
+    np.testing.assert_array_equal(store.mmr_change, alone.mmr_change)
+    assert holder.derived("title_index").titles_html == TitleIndex.from_db(db).titles_html
+
+
+def test_required_structure_built_on_first_use():
+    db = build_synthetic_db(divisions=1, contestants=5, matches=50, titles=1)
+    holder = DatabaseHolder(lambda: db)
+    holder.load()
+    holder.register("histories", wrestler_histories)
+    holder.register("names", lambda db, histories: sorted(histories), requires=("histories",))
+
+    assert holder.derived("names") == sorted(holder.built()["histories"])
@@ -0,0 +1,189 @@
+import threading
+import uuid
+
+import pytest
+from fastapi_sessions.backends.session_backend import BackendError
+from pydantic import BaseModel
+
+from website import session_backends
+from website.session_backends import SQLiteBackend, TTLBackend
+
+
+class Data(BaseModel):
+    name: str
+
+
+class Clock:
+    """
+    Stand-in for the time module of session_backends, advanced by hand.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(session_backends, "time", clock)
+    return clock
+
+
+@pytest.mark.anyio
+async def test_ttl_sliding_expiry(clock):
+    backend = TTLBackend(ttl=10)
+    renewed, idle = uuid.uuid4(), uuid.uuid4()
+    await backend.create(renewed, Data(name="renewed"))
+    await backend.create(idle, Data(name="idle"))
+
+    clock.now += 8
+    assert backend.get(renewed).name == "renewed"
+    assert backend.peek(idle).name == "idle"
+
+    # The lookup renewed one session, peek did not renew the other
+    clock.now += 8
+    assert backend.get(renewed).name == "renewed"
+    assert backend.get(idle) is None
+    assert backend.peek(idle) is None
+    assert backend.stats()["expired"] == 1
+
+    clock.now += 11
+    assert backend.sweep() == 1
+    assert len(backend) == 0
+
+
+@pytest.mark.anyio
+async def test_ttl_evicts_least_recently_used(clock):
+    backend = TTLBackend(ttl=10, max_entries=3)
+    ids = [uuid.uuid4() for _ in range(4)]
+    for i, session_id in enumerate(ids[:3]):
+        await backend.create(session_id, Data(name=str(i)))
+
+    # The oldest session was used last, the second one is now the least recently used
+    backend.get(ids[0])
+    await backend.create(ids[3], Data(name="3"))
+
+    assert backend.peek(ids[1]) is None
+    assert [backend.peek(session_id).name for session_id in (ids[0], ids[2], ids[3])] == ["0", "2", "3"]
+    assert backend.stats()["evicted"] == 1
+    with pytest.raises(BackendError):
+        await backend.create(ids[0], Data(name="again"))
+
+
+@pytest.mark.anyio
+async def test_ttl_update_keeps_expiry(clock):
+    backend = TTLBackend(ttl=10, max_entries=2)
+    updated, other = uuid.uuid4(), uuid.uuid4()
+    await backend.create(updated, Data(name="old"))
+    await backend.create(other, Data(name="other"))
+
+    clock.now += 8
+    await backend.update(updated, Data(name="new"))
+    assert backend.peek(updated).name == "new"
+
+    # Not renewed and not marked as used
+    await backend.create(uuid.uuid4(), Data(name="third"))
+    assert backend.peek(updated) is None
+    clock.now += 3
+    assert backend.peek(other) is None
+
+    with pytest.raises(BackendError):
+        await backend.update(other, Data(name="expired"))
+    with pytest.raises(BackendError):
+        await backend.update(uuid.uuid4(), Data(name="missing"))
+
+
+@pytest.fixture
+def sqlite_path(tmp_path) -> str:
+    return str(tmp_path / "sessions.db")
+
+
+@pytest.mark.anyio
+async def test_sqlite_crud(clock, sqlite_path):
+    backend = SQLiteBackend(sqlite_path, Data, ttl=10, cache_ttl=0)
+    session_id = uuid.uuid4()
+    await backend.create(session_id, Data(name="old"))
+    with pytest.raises(BackendError):
+        await backend.create(session_id, Data(name="again"))
+
+    assert (await backend.lookup(session_id)).name == "old"
+    assert (await backend.read(session_id)).name == "old"
+    await backend.update(session_id, Data(name="new"))
+    assert backend.peek(session_id).name == "new"
+
+    await backend.delete(session_id)
+    assert await backend.lookup(session_id) is None
+    with pytest.raises(BackendError):
+        await backend.update(session_id, Data(name="deleted"))
+    assert backend.stats()["live"] == 0
+
+
+@pytest.mark.anyio
+async def test_sqlite_lookup_reads_off_the_event_loop(clock, sqlite_path):
+    backend = SQLiteBackend(sqlite_path, Data, ttl=10, cache_ttl=5)
+    session_id = uuid.uuid4()
+    await backend.create(session_id, Data(name="data"))
+    threads = []
+    read = backend._read
+    backend._read = lambda session_id: threads.append(threading.get_ident()) or read(session_id)
+
+    assert (await backend.lookup(session_id)).name == "data"
+    assert (await backend.lookup(session_id)).name == "data"
+    # One read in a worker thread, the second lookup came from the cache
+    assert len(threads) == 1 and threads[0] != threading.get_ident()
+
+
+@pytest.mark.anyio
+async def test_sqlite_expiry(clock, sqlite_path):
+    backend = SQLiteBackend(sqlite_path, Data, ttl=10, cache_ttl=0)
+    renewed, idle, updated = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    for session_id in (renewed, idle, updated):
+        await backend.create(session_id, Data(name="data"))
+
+    clock.now += 8
+    assert await backend.lookup(renewed) is not None
+    await backend.update(updated, Data(name="new"))
+    assert backend.flush() == 1
+
+    # Only the lookup renewed its session
+    clock.now += 8
+    assert backend.get(renewed) is not None
+    assert backend.peek(idle) is None
+    assert backend.peek(updated) is None
+    assert backend.sweep() == 2
+    assert backend.stats()["live"] == 1
+
+
+@pytest.mark.anyio
+async def test_sqlite_shared_between_connections(clock, sqlite_path):
+    first = SQLiteBackend(sqlite_path, Data, ttl=10, cache_ttl=5)
+    second = SQLiteBackend(sqlite_path, Data, ttl=10, cache_ttl=5)
+    session_id = uuid.uuid4()
+    await first.create(session_id, Data(name="shared"))
+
+    assert (await second.lookup(session_id)).name == "shared"
+    await first.update(session_id, Data(name="updated"))
+
+    # The second connection answers from its cache until it expires
+    assert (await second.lookup(session_id)).name == "shared"
+    clock.now += 6
+    assert (await second.lookup(session_id)).name == "updated"
+
+    # A renewal written by one connection is seen by the other
+    second.flush()
+    clock.now += 8
+    assert first.peek(session_id).name == "updated"
+    await first.delete(session_id)
+    clock.now += 6
+    assert await second.lookup(session_id) is None
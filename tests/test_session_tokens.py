@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from website.models import SessionData
+from website.session_tokens import SessionTokenSigner
+
+ADMIN = SessionData(username="admin", web_user=True, web_admin=True, fanhub_user=False, fanhub_elite=False,
+                    fanhub_admin=False)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def test_round_trip():
+    signer = SessionTokenSigner("secret")
+    assert signer.decode(signer.encode(ADMIN)) == ADMIN
+    assert SessionTokenSigner("other").decode(signer.encode(ADMIN)) is None
+
+
+def test_revocation_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    # Two signers on one file stand in for two worker processes
+    worker_a = SessionTokenSigner("secret", revocation_db=path, refresh_interval=0)
+    worker_b = SessionTokenSigner("secret", revocation_db=path, refresh_interval=0)
+    token = worker_a.encode(ADMIN)
+    other = worker_a.encode(ADMIN)
+    assert worker_b.decode(token) == ADMIN
+
+    worker_a.revoke(worker_a.token_id(token))
+    assert worker_a.decode(token) is None
+    # The other worker sees it once its refresher read the table
+    assert worker_b.decode(token) == ADMIN
+    worker_b.refresh()
+    assert worker_b.decode(token) is None
+    assert worker_b.decode(other) == ADMIN
+
+    # A restarted worker still sees the revocation
+    restarted = SessionTokenSigner("secret", revocation_db=path, refresh_interval=0)
+    restarted.refresh()
+    assert restarted.decode(token) is None
+
+
+def test_decode_does_not_read_the_database(tmp_path):
+    signer = SessionTokenSigner("secret", revocation_db=str(tmp_path / "sessions.db"), refresh_interval=0)
+    assert signer.decode(signer.encode(ADMIN)) == ADMIN
+    assert signer._connection is None
+
+
+@pytest.mark.anyio
+async def test_refresher_reads_revocations(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a = SessionTokenSigner("secret", revocation_db=path)
+    worker_b = SessionTokenSigner("secret", revocation_db=path, refresh_interval=0.01)
+    token = worker_a.encode(ADMIN)
+    refresher = asyncio.create_task(worker_b.run_refresher())
+    try:
+        worker_a.revoke(worker_a.token_id(token))
+        for _ in range(200):
+            if worker_b.decode(token) is None:
+                break
+            await asyncio.sleep(0.01)
+        assert worker_b.decode(token) is None
+    finally:
+        refresher.cancel()
+
+    # Nothing to refresh without a database
+    await SessionTokenSigner("secret").run_refresher()
+
+
+def test_revocation_without_database_is_per_process():
+    worker_a = SessionTokenSigner("secret")
+    worker_b = SessionTokenSigner("secret")
+    token = worker_a.encode(ADMIN)
+    worker_a.revoke(worker_a.token_id(token))
+    assert worker_a.decode(token) is None
+    assert worker_b.decode(token) == ADMIN
+
+
+def test_revoked_sessions_environment_variable(monkeypatch, tmp_path):
+    token = SessionTokenSigner("secret").encode(ADMIN)
+    token_id = SessionTokenSigner("secret").token_id(token)
+    monkeypatch.setenv("REVOKED_SESSIONS", f"unused,{token_id}")
+    assert SessionTokenSigner("secret").decode(token) is None
+    signer = SessionTokenSigner("secret", revocation_db=str(tmp_path / "s.db"), refresh_interval=0)
+    signer.refresh()
+    assert signer.decode(token) is None
@@ -0,0 +1,81 @@
+import os
+import threading
+
+import pytest
+
+from website.snapshot import load_snapshot, save_snapshot, source_fingerprint
+
+
+@pytest.fixture
+def db() -> dict:
+    contestants = [{"name": f"wrestler {i}", "mmr": 1000.0 + i} for i in range(50)]
+    return {"contestants": contestants, "matches": [(contestants[i], contestants[i + 1]) for i in range(49)]}
+
+
+def test_round_trip(tmp_path, db):
+    path = str(tmp_path / "db.bin")
+    assert save_snapshot(path, db, "abc", 1.5)
+    loaded = load_snapshot(path, "abc")
+    assert loaded == db
+    # Shared references stay shared
+    assert loaded["matches"][0][1] is loaded["contestants"][1]
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_deep_structure_round_trip(tmp_path):
+    # Deeper than the default recursion limit, saved from a thread like a background reload
+    nested = []
+    for _ in range(30_000):
+        nested = [nested]
+    path = str(tmp_path / "deep.bin")
+    saved = []
+    thread = threading.Thread(target=lambda: saved.append(save_snapshot(path, nested, "abc", 0.0)))
+    thread.start()
+    thread.join()
+    assert saved == [True]
+    loaded, depth = load_snapshot(path, "abc"), 0
+    while loaded:
+        loaded, depth = loaded[0], depth + 1
+    assert depth == 30_000
+
+
+def test_rejected(tmp_path, db):
+    path = str(tmp_path / "db.bin")
+    save_snapshot(path, db, "abc", 1.5)
+    assert load_snapshot(path, "other") is None
+
+    data = bytearray(open(path, "rb").read())
+    corrupt = str(tmp_path / "corrupt.bin")
+    with open(corrupt, "wb") as file:
+        file.write(b"NOTASNAP" + data[8:])
+    assert load_snapshot(corrupt, "abc") is None
+
+    data[-1] ^= 0xFF
+    with open(path, "wb") as file:
+        file.write(data)
+    assert load_snapshot(path, "abc") is None
+
+    with open(path, "wb") as file:
+        file.write(b"AEW")
+    assert load_snapshot(path, "abc") is None
+    assert load_snapshot(str(tmp_path / "missing.bin"), "abc") is None
+
+
+def test_write_error_is_not_raised(tmp_path, db):
+    path = str(tmp_path / "missing_dir" / "db.bin")
+    assert save_snapshot(path, db, "abc", 1.5) is False
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_fingerprint(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "a.csv").write_text("1")
+    first = source_fingerprint([str(data)], "flag=1")
+    assert source_fingerprint([str(data)], "flag=1") == first
+    assert source_fingerprint([str(data)], "flag=0") != first
+
+    (data / "b.csv").write_text("2")
+    assert source_fingerprint([str(data)], "flag=1") != first
+    assert source_fingerprint([str(data), str(tmp_path / "missing")], "flag=1") == \
+        source_fingerprint([str(data)], "flag=1")
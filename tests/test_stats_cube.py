@@ -0,0 +1,45 @@
+import pytest
+
+from website.stats_cube import StatsCube
+from website.synthetic_db import build_synthetic_db
+
+
+@pytest.fixture(scope="module")
+def db():
+    return build_synthetic_db(divisions=2, contestants=12, matches=400, titles=2)
+
+
+@pytest.fixture(scope="module")
+def cube(db) -> StatsCube:
+    return StatsCube.from_db(db)
+
+
+def test_cells_match_api_stats_get(db, cube):
+    divisions, years, mmr_keys, stat_divisions = db.api_stats_keys()
+    assert len(cube) == len(divisions) * len(years) * len(mmr_keys) * len(stat_divisions)
+
+    cells = [(divisions[0], years[0], mmr_keys[0], stat_divisions[0]),
+             (divisions[-1], years[-1], mmr_keys[-1], stat_divisions[-1]),
+             (divisions[0], years[1], mmr_keys[-1], stat_divisions[0]),
+             (divisions[-1], years[0], mmr_keys[0], stat_divisions[-1])]
+    for division, year, mmr_key, stat_division in cells:
+        expected = db.api_stats_get(division, year, mmr_key, stat_division)
+        # Years arrive as path strings
+        table = cube.table(division, str(year), mmr_key, stat_division)
+        assert list(table.rows()) == expected
+
+
+def test_select_matches_sorting_the_rows(db, cube):
+    division, year, mmr_key, stat_division = (axis[0] for axis in db.api_stats_keys())
+    expected = db.api_stats_get(division, year, mmr_key, stat_division)
+    table = cube.table(division, year, mmr_key, stat_division)
+
+    rows = list(table.rows(table.select("MMR", descending=False)))
+    assert rows == sorted(expected, key=lambda row: row["MMR"])
+
+    low = sorted(row["MMR"] for row in expected)[len(expected) // 2]
+    rows = list(table.rows(table.select(ranges={"MMR": (low, None)})))
+    assert rows == [row for row in expected if row["MMR"] >= low]
+
+    with pytest.raises(KeyError):
+        cube.table("missing", year, mmr_key, stat_division)
@@ -0,0 +1,71 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+from website.synthetic_db import build_synthetic_db
+from website.title_index import OPEN_END, ReignIndex, TitleIndex
+
+FIRST = datetime.date(2020, 1, 1)
+
+
+def day(offset: int) -> datetime.date:
+    return FIRST + datetime.timedelta(days=offset)
+
+
+@pytest.fixture
+def reigns() -> ReignIndex:
+    start = FIRST.toordinal()
+    # A for ten days, vacant for five, B until C takes over, C still champion
+    return ReignIndex.from_reigns("Title", [(start + 20, OPEN_END, "C"), (start, start + 10, "A"),
+                                            (start + 15, start + 20, "B")])
+
+
+def test_holder_on_boundaries(reigns):
+    assert reigns.holder_on(day(-1)) is None
+    assert reigns.holder_on(day(0)) == {"holder": "A", "reign": 1, "start": "2020-01-01", "end": "2020-01-11"}
+    assert reigns.holder_on(day(9))["holder"] == "A"
+    # The end is the day after the last day
+    assert reigns.holder_on(day(10)) is None
+    assert reigns.holder_on(day(14)) is None
+    assert reigns.holder_on(day(15))["holder"] == "B"
+    assert reigns.holder_on(day(19))["holder"] == "B"
+    assert reigns.holder_on(day(20)) == {"holder": "C", "reign": 3, "start": "2020-01-21", "end": None}
+    assert reigns.holder_on(datetime.date.today())["holder"] == "C"
+
+
+def test_days_held(reigns):
+    assert reigns.days_held(day(0), day(19)) == [{"holder": "A", "days": 10, "reigns": 1},
+                                                 {"holder": "B", "days": 5, "reigns": 1}]
+    assert reigns.days_held(day(5), day(16)) == [{"holder": "A", "days": 5, "reigns": 1},
+                                                 {"holder": "B", "days": 2, "reigns": 1}]
+    assert reigns.days_held(day(10), day(14)) == []
+
+    # The current reign counts until today, also for a range ending in the future
+    today = datetime.date.today()
+    current = (today - day(20)).days + 1
+    far = today + datetime.timedelta(days=365)
+    assert reigns.days_held(day(20), far) == [{"holder": "C", "days": current, "reigns": 1}]
+    assert reigns.days_held(today, today) == [{"holder": "C", "days": 1, "reigns": 1}]
+
+
+def test_page_rendered_once_across_threads(monkeypatch):
+    db = build_synthetic_db(divisions=1, contestants=6, matches=60, titles=1)
+    index = TitleIndex(reigns={}, titles_html={}, pages={})
+    title = db.titles[0]
+    calls = []
+    api_title = type(title).api_title
+    # Slow enough that the threads ask while the first one is still rendering
+    monkeypatch.setattr(type(title), "api_title", lambda self: calls.append(self) or time.sleep(0.02) or api_title(self))
+
+    pages = []
+    threads = [threading.Thread(target=lambda: pages.append(index.page(db, title.name))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(page is pages[0] for page in pages)
+    assert index.page(db, "missing") is None
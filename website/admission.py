@@ -0,0 +1,251 @@
+"""
+admission.py
+
+This module keeps expensive endpoints from starving the rest of the site.
+
+Admission control:
+    Every expensive endpoint group has an `AdmissionLimiter` that runs at most `concurrency`
+    requests at once. Up to `queue_size` more wait for a slot, for at most `timeout` seconds.
+    A request that finds the queue full gets 429, one that waited too long gets 503, both with a
+    Retry-After header. Limits are per worker process.
+
+Single-flight:
+    `SingleFlight` runs one computation for concurrent requests with the same key and hands its
+    result (or exception) to all of them. The computation runs in its own task, so a leader whose
+    client disconnects does not cancel it for the others. Nothing is cached once it finishes.
+
+`run_expensive` combines both: identical requests are coalesced first, so a burst of one URL takes
+a single slot, and the computation runs in the thread pool to keep the event loop free.
+
+Classes:
+    - AdmissionLimiter: Concurrency limit with a bounded, timed wait queue.
+    - Slot: A held slot of an AdmissionLimiter.
+    - SingleFlight: Coalesces concurrent computations with the same key.
+
+Functions:
+    - request_key: Single-flight key of a request, its path and sorted query parameters.
+    - run_expensive: Run a blocking computation coalesced and under a limiter.
+
+Global Variables:
+    - limiters: Limiter of every endpoint group, by name.
+    - single_flight: SingleFlight shared by all endpoint groups.
+
+Dependencies:
+    - fastapi
+    - starlette
+    - Local modules: website.metrics
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from fastapi import HTTPException, Request
+from starlette import status
+from starlette.concurrency import run_in_threadpool
+
+from website.metrics import compute_seconds
+
+
+class Slot:
+    """
+    A held slot of an AdmissionLimiter.
+
+    `release` may be called more than once and from any thread, only the first call frees the slot.
+    """
+
+    def __init__(self, limiter: "AdmissionLimiter"):
+        self._limiter = limiter
+        self._loop = asyncio.get_running_loop()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._limiter._release()
+        else:
+            self._loop.call_soon_threadsafe(self._limiter._release)
+
+    async def __aenter__(self) -> "Slot":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionLimiter:
+    """
+    Concurrency limit with a bounded, timed wait queue.
+
+    Attributes:
+        name (str): Endpoint group name, used in error messages.
+        concurrency (int): Requests running at once.
+        queue_size (int): Requests waiting at most.
+        timeout (float): Seconds a request waits at most.
+        running (int): Requests holding a slot.
+        waiting (int): Requests waiting for a slot.
+        admitted (int): Requests that got a slot.
+        rejected (int): Requests turned away because the queue was full.
+        timed_out (int): Requests that waited too long.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> Slot:
+        """
+        Wait for a slot.
+
+        Use as `async with await limiter.acquire():`, or call `release` on the slot when done.
+
+        Returns:
+            Slot: The held slot.
+
+        Raises:
+            HTTPException: 429 if the queue is full, 503 if no slot freed up within `timeout`.
+        """
+        if self._semaphore is None:
+            # Created lazily so it binds to the running event loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        if self._semaphore.locked():
+            if self.waiting >= self.queue_size:
+                self.rejected += 1
+                raise self._error(status.HTTP_429_TOO_MANY_REQUESTS, f"Too many {self.name} requests queued")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise self._error(status.HTTP_503_SERVICE_UNAVAILABLE, f"{self.name.capitalize()} are busy")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.running += 1
+        self.admitted += 1
+        return Slot(self)
+
+    def _release(self):
+        self.running -= 1
+        self._semaphore.release()
+
+    def _error(self, status_code: int, reason: str) -> HTTPException:
+        return HTTPException(status_code=status_code, detail=f"{reason}, try again shortly",
+                             headers={"Retry-After": str(max(int(self.timeout), 1))})
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent computations with the same key.
+
+    Attributes:
+        started (int): Computations started.
+        coalesced (int): Calls that joined a computation already running.
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.coalesced = 0
+        self._flights: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `compute`, or wait for the run already in progress for `key`.
+
+        Args:
+            key (Hashable): Identifies identical computations.
+            compute (Callable[[], Awaitable[Any]]): Starts the computation.
+
+        Returns:
+            Any: The result of the computation.
+
+        Raises:
+            Exception: Whatever the computation raised.
+        """
+        task = self._flights.get(key)
+        if task is None:
+            self.started += 1
+            task = self._flights[key] = asyncio.ensure_future(compute())
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so a cancelled caller does not cancel the computation for the others
+        return await asyncio.shield(task)
+
+
+# (concurrency, queue size, timeout in seconds)
+# util_matlib draws through pyplot, which is not thread safe, so graphs render one at a time
+LIMITS = {
+    "graphs": (1, 32, 30.0),
+    "stats": (4, 32, 10.0),
+    "exports": (4, 8, 10.0),
+}
+
+limiters = {name: AdmissionLimiter(name, *limits) for name, limits in LIMITS.items()}
+single_flight = SingleFlight()
+
+
+def request_key(request: Request) -> tuple[str, tuple[tuple[str, str], ...]]:
+    """
+    Single-flight key of a request: its path and query parameters, sorted so the order they were
+    sent in does not matter.
+
+    Args:
+        request (Request): The request.
+
+    Returns:
+        tuple[str, tuple[tuple[str, str], ...]]: The key.
+    """
+    return request.url.path, tuple(sorted(request.query_params.multi_items()))
+
+
+async def run_expensive(group: str, key: Hashable, function: Callable, *args) -> Any:
+    """
+    Run a blocking computation in the thread pool, coalesced with identical calls and under the
+    limiter of its endpoint group.
+
+    Args:
+        group (str): Endpoint group, a key of `limiters`.
+        key (Hashable): Identifies identical computations, e.g. the path and its parameters.
+        function (Callable): The blocking computation.
+        *args: Arguments for `function`.
+
+    Returns:
+        Any: The result of `function`.
+
+    Raises:
+        HTTPException: 429 or 503 from the limiter.
+    """
+    limiter = limiters[group]
+
+    def timed():
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            compute_seconds.observe(time.perf_counter() - start, group)
+
+    async def compute():
+        async with await limiter.acquire():
+            return await run_in_threadpool(timed)
+
+    return await single_flight.do((group, key), compute)
@@ -18,9 +18,10 @@ TODO:
 """
 
 # Standard Library Imports
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Callable
-from uuid import uuid4
 
 # Third-party Imports
 from fastapi import FastAPI
@@ -32,17 +33,51 @@ from starlette.staticfiles import StaticFiles
 
 # Local / Custom Imports
 from website import sql_db
+from website.metrics import MetricsMiddleware
+from website.profiler import ProfilerMiddleware
 from website.resources import *
-from website.routes import admin, fanhub, stats, titles, wrestlers
-from website.session import get_session_info, COOKIE_NAME, SECRET_KEY
+from website.routes import admin, export, fanhub, matches, metrics, stats, titles, wrestlers
+from website.session import (create_session, get_session_info, restore_local_sessions, session_cookie, token_signer,
+                             SECRET_KEY)
+from website.session_backends import TTLBackend
+from website.timing import ServerTimingMiddleware
 
 # TODO: reach out to AEW metrics on Twitter
 # TODO: Support Page: contact info, bug reports, feature requests, patreon, allelitedatabase info/patreon
 # TODO: setup reddit, patreon
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application lifespan.
+
+    The database is loaded in a background thread so the server accepts connections immediately,
+    /readyz reports when it can serve pages. Expired sessions are swept and the Discord roles of
+    logged in users are revalidated in the background, and the Basic auth passwords are hashed in a
+    thread. In signed session mode the revoked token ids shared by the workers are read in the background.
+    """
+    if not db_holder.ready:
+        load_db(background=True)
+    restore_local_sessions()
+    tasks = [
+        asyncio.create_task(asyncio.to_thread(authenticator.prepare)),
+        asyncio.create_task(backend.run_sweeper()),
+        asyncio.create_task(discord_roles.run_refresher(backend)),
+    ]
+    if token_signer is not None:
+        tasks.append(asyncio.create_task(token_signer.run_refresher()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await discord_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="website/static"), name="static")
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ServerTimingMiddleware)
 
 
 @app.exception_handler(StarletteHTTPException)
@@ -70,10 +105,10 @@ async def log_middleware(request: Request, call_next: Callable) -> Response:
     This middleware logs user activities if the server is not running locally
     and if the ENABLE_LOGGING flag is set to True in the resources.
     """
-    if SERVER_IP != MY_IP and ENABLE_LOGGING:
+    if ENABLE_LOGGING and get_public_IP() != MY_IP:
         time_str = datetime.now().strftime("%Y-%m-%d %I:%M:%S %p")
         sql = sql_db.SQLDatabase()
-        sql.add_user_activity(SERVER_IP, "guest", time_str, request.url.path)
+        sql.add_user_activity(get_public_IP(), "guest", time_str, request.url.path)
         sql.close()
 
     # Call the next middleware or route handler
@@ -86,7 +121,7 @@ async def read_current_user(request: Request, username: str = Depends(get_curren
     """
     Route for user login.
 
-    Authenticates the user, creates a new session, and saves it in the backend.
+    Authenticates the user, creates a new session, and saves it in the backend or a signed cookie.
     If running locally, saves the backend state to avoid re-login on every server reload.
     """
     session_data = SessionData(
@@ -97,20 +132,18 @@ async def read_current_user(request: Request, username: str = Depends(get_curren
         fanhub_elite=username in ADMIN_USERS,
         fanhub_admin=username in ADMIN_USERS,
     )
-    session_id = uuid4()
-    await backend.create(session_id, session_data)
+    cookie = session_cookie(await create_session(session_data))
 
     # If running locally, save the backend so I don't have to login every server reload
-    if SERVER_IP == MY_IP:
+    if isinstance(backend, TTLBackend) and get_public_IP() == MY_IP:
         pickle_save("backend", backend)
 
-    cookie = f"{COOKIE_NAME}={session_id}; HttpOnly; Max-Age=1209600; Path=/; SameSite=Lax"
     headers = {"Set-Cookie": cookie}
     results = {
         "request": request,
         "current_page": "home",
         "session": session_data,
-        "date_last_updated": db.date_last_updated,
+        "date_last_updated": get_db().date_last_updated,
     }
 
     return TemplateResponse("base.html", results, headers=headers)
@@ -132,19 +165,20 @@ async def callback(request: Request, code: str) -> RedirectResponse:
     Validates the Discord session and creates a cookie for the session if valid.
     """
     discord_session = discord_client.session(code)
-    session_data = await discord_session.get_fanhub_roles()
+    try:
+        session_data = await discord_roles.lookup(discord_session)
+    finally:
+        await discord_session.close()
 
     if not session_data:
         error = {"error": "User does not have permissions"}
         return await return_error(request, error)
 
-    # Create a session cookie
-    session_id = uuid4()
-    await backend.create(session_id, session_data)
-
-    headers = {
-        "Set-Cookie": f"{COOKIE_NAME}={session_id}; HttpOnly; Max-Age=1209600; Path=/; SameSite=Lax"
-    }
+    # Create a session cookie, signed cookies can't be updated so only backend sessions are revalidated
+    session_id = await create_session(session_data)
+    discord_roles.store(str(discord_session.cached_user.id), session_data, discord_session.token,
+                        session_id if token_signer is None else None)
+    headers = {"Set-Cookie": session_cookie(session_id)}
     return RedirectResponse(url="/", headers=headers)
 
 
@@ -162,11 +196,30 @@ async def root(request: Request, session_info: dict = Depends(get_session_info))
         "request": request,
         "current_page": "home",
         "session": session_data,
-        "date_last_updated": db.date_last_updated,
+        "date_last_updated": get_db().date_last_updated,
     }
     return TemplateResponse("base.html", results)
 
 
+@app.get("/healthz")
+async def healthz() -> JSONResponse:
+    """
+    Liveness probe, the process is up and serving requests.
+    """
+    return JSONResponse({"status": "ok"})
+
+
+@app.get("/readyz")
+async def readyz() -> JSONResponse:
+    """
+    Readiness probe, 200 once the database is loaded, 503 before that.
+
+    Load balancers should only route to workers that return 200 here.
+    """
+    status_code = 200 if db_holder.ready else 503
+    return JSONResponse({"ready": db_holder.ready, "database": db_holder.status()}, status_code=status_code)
+
+
 @app.get("/faq/")
 async def faq(request: Request, session_info: dict = Depends(get_session_info)):
     """
@@ -194,3 +247,6 @@ app.include_router(stats.router)
 app.include_router(titles.router)
 app.include_router(admin.router)
 app.include_router(fanhub.router)
+app.include_router(export.router)
+app.include_router(matches.router)
+app.include_router(metrics.router)
@@ -0,0 +1,132 @@
+"""
+auth.py
+
+This module verifies HTTP Basic credentials against the configured users.
+
+Passwords are stored as salted PBKDF2 hashes in a dict keyed by an HMAC of the username, so a
+lookup is one dict access no matter how many users there are. Unknown usernames are checked
+against a dummy hash, a request does the same work whether the user exists or not. Successful
+verifications are cached for a short time per credentials digest, so the PBKDF2 work is not
+repeated for every request of a logged in browser.
+
+Nothing is hashed when the authenticator is created, a password is hashed on the first
+verification of its user, or all at once by prepare() which the application lifespan runs in a
+thread. Importing the module that builds the authenticator stays cheap.
+
+Classes:
+    - BasicAuthenticator: Verifies username and password pairs.
+
+Usage:
+    authenticator = BasicAuthenticator(USER_DB, SECRET_KEY)
+    authenticator.prepare()  # optional, hashes every password now
+    authenticator.verify("admin", "password")  # "admin" or None
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from typing import Optional, Union
+
+
+class BasicAuthenticator:
+    """
+    Verifies HTTP Basic credentials in constant time.
+
+    Attributes:
+        iterations (int): PBKDF2 iterations per password hash.
+        cache_ttl (float): Seconds a successful verification is cached.
+        cache_hits (int): Verifications answered from the cache.
+        cache_misses (int): Verifications that hashed the password.
+    """
+
+    def __init__(self, users: dict[Union[str, bytes], Union[str, bytes]], secret_key: Optional[str] = None,
+                 iterations: int = 100_000, cache_ttl: float = 60, cache_size: int = 1024):
+        """
+        Args:
+            users (dict): Username to plain text password.
+            secret_key (Optional[str]): Key for the username HMAC, a random key is used if not set.
+            iterations (int, optional): PBKDF2 iterations. Defaults to 100000.
+            cache_ttl (float, optional): Seconds to cache a successful verification. Defaults to 60.
+            cache_size (int, optional): Maximum number of cached verifications. Defaults to 1024.
+        """
+        self.iterations = iterations
+        self.cache_ttl = cache_ttl
+        self._cache_size = cache_size
+        self._key = secret_key.encode() if secret_key else secrets.token_bytes(32)
+        self._cache: dict[bytes, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self._users: dict[bytes, tuple[str, bytes, bytes]] = {}
+        self._plain: dict[bytes, tuple[str, bytes]] = {}
+        self._hash_lock = threading.Lock()
+        for username, password in users.items():
+            username = username.decode() if isinstance(username, bytes) else username
+            password = password if isinstance(password, bytes) else password.encode()
+            self._plain[self._user_key(username)] = (username, password)
+        self._dummy = (None, os.urandom(16), os.urandom(32))
+
+    def prepare(self) -> None:
+        """
+        Hash the passwords not hashed yet. Takes tens of milliseconds per user, run it in a thread.
+        """
+        for user_key in list(self._plain):
+            self._stored(user_key)
+
+    def _stored(self, user_key: bytes) -> tuple[Optional[str], bytes, bytes]:
+        """
+        Get the stored username, salt and hash of a user, hashing the password on first use.
+        """
+        stored = self._users.get(user_key)
+        if stored is not None or user_key not in self._plain:
+            return stored or self._dummy
+        with self._hash_lock:
+            if user_key in self._plain:
+                username, password = self._plain[user_key]
+                salt = os.urandom(16)
+                self._users[user_key] = (username, salt, self._hash(password, salt))
+                del self._plain[user_key]
+        return self._users[user_key]
+
+    def verify(self, username: str, password: str) -> Optional[str]:
+        """
+        Check a username and password.
+
+        Hashing takes tens of milliseconds, call it from a thread rather than the event loop.
+
+        Args:
+            username (str): The username.
+            password (str): The password.
+
+        Returns:
+            Optional[str]: The stored username if the credentials match, None otherwise.
+        """
+        digest = hmac.new(self._key, f"{len(username)}:{username}:{password}".encode(), hashlib.sha256).digest()
+        now = time.monotonic()
+        cached = self._cache.get(digest)
+        if cached is not None and cached[1] > now:
+            self.cache_hits += 1
+            return cached[0]
+        self.cache_misses += 1
+
+        stored_username, salt, stored_hash = self._stored(self._user_key(username))
+        matches = hmac.compare_digest(self._hash(password.encode(), salt), stored_hash)
+        if not matches or stored_username is None:
+            return None
+
+        with self._lock:
+            if len(self._cache) >= self._cache_size:
+                self._cache = {k: v for k, v in self._cache.items() if v[1] > now}
+                if len(self._cache) >= self._cache_size:
+                    self._cache.clear()
+            self._cache[digest] = (stored_username, now + self.cache_ttl)
+        return stored_username
+
+    def _user_key(self, username: str) -> bytes:
+        return hmac.new(self._key, username.encode(), hashlib.sha256).digest()
+
+    def _hash(self, password: bytes, salt: bytes) -> bytes:
+        return hashlib.pbkdf2_hmac("sha256", password, salt, self.iterations)
@@ -0,0 +1,365 @@
+"""
+backtest.py
+
+This module replays the chronological match history with a configurable rating model
+so that rating parameters can be scored on how well they predict results.
+
+Module Components:
+- MatchArrays: Chronological match history packed into NumPy arrays.
+- RatingParams: A set of rating parameters to evaluate.
+- BacktestResult: The score and final ratings of a single replay.
+- replay: Function to replay the match history with a set of parameters.
+- parameter_grid: Function to expand a grid of parameter values.
+- parameter_random: Function to draw random parameter sets from ranges.
+- run_sweep: Function to evaluate many parameter sets in parallel worker processes.
+- format_table: Function to render sweep results as a ranked text table.
+
+The match arrays are built once and copied into a single shared memory block,
+worker processes attach to it instead of receiving a pickled copy per task.
+
+Dependencies:
+- numpy
+"""
+import itertools
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+from multiprocessing import shared_memory, util
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+@dataclass
+class MatchArrays:
+    """
+    Chronological match history as parallel NumPy arrays, one row per winner/loser pairing.
+
+    Multi-person matches are expanded into one row for every winner against every loser,
+    draws are expanded into one row for every pair of opposing sides.
+
+    Attributes:
+        names (list[str]): Contestant names, indexed by the values in `winner` and `loser`.
+        titles (list[str]): Title names, indexed by the values in `title`.
+        day (np.ndarray): Match date as days since 0001-01-01 (int32).
+        year (np.ndarray): Match year (int16).
+        winner (np.ndarray): Index of the winning contestant (int32).
+        loser (np.ndarray): Index of the losing contestant (int32).
+        draw (np.ndarray): 1 if the pairing was a draw, otherwise 0 (int8).
+        title (np.ndarray): Index of the title defended in the match, -1 if none (int16).
+    """
+    names: list[str]
+    titles: list[str]
+    day: np.ndarray
+    year: np.ndarray
+    winner: np.ndarray
+    loser: np.ndarray
+    draw: np.ndarray
+    title: np.ndarray
+
+    ARRAY_FIELDS = ("day", "year", "winner", "loser", "draw", "title")
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    @classmethod
+    def from_matches(cls, matches: Iterable) -> "MatchArrays":
+        """
+        Build the arrays from `mmrDB.matches`, which is kept in chronological order.
+
+        Args:
+            matches (Iterable[Match]): The matches to pack.
+
+        Returns:
+            MatchArrays: The packed match history.
+        """
+        index: dict[str, int] = {}
+        names: list[str] = []
+        title_index: dict[str, int] = {}
+        titles: list[str] = []
+        rows: list[tuple[int, int, int, int, int, int]] = []
+
+        def contestant_id(contestant) -> int:
+            name = str(contestant)
+            if name not in index:
+                index[name] = len(names)
+                names.append(name)
+            return index[name]
+
+        def title_id(title) -> int:
+            if not title:
+                return -1
+            name = getattr(title, "name", title)
+            if name not in title_index:
+                title_index[name] = len(titles)
+                titles.append(name)
+            return title_index[name]
+
+        for match in matches:
+            day = match.date.toordinal()
+            year = match.date.year
+            winners = [contestant_id(c) for c in match.winners]
+            losers = [contestant_id(c) for c in match.losers]
+            draw = int(bool(match.draw))
+            title = title_id(match.title)
+            for w in winners:
+                for l in losers:
+                    rows.append((day, year, w, l, draw, title))
+
+        columns = list(zip(*rows)) if rows else [()] * len(cls.ARRAY_FIELDS)
+        return cls(
+            names=names,
+            titles=titles,
+            day=np.array(columns[0], dtype=np.int32),
+            year=np.array(columns[1], dtype=np.int16),
+            winner=np.array(columns[2], dtype=np.int32),
+            loser=np.array(columns[3], dtype=np.int32),
+            draw=np.array(columns[4], dtype=np.int8),
+            title=np.array(columns[5], dtype=np.int16),
+        )
+
+    @classmethod
+    def from_db(cls, db) -> "MatchArrays":
+        """
+        Build the arrays from a loaded mmrDB.
+
+        Args:
+            db (mmrDB): The loaded database.
+
+        Returns:
+            MatchArrays: The packed match history.
+        """
+        return cls.from_matches(db.matches)
+
+
+@dataclass(frozen=True)
+class RatingParams:
+    """
+    A set of rating parameters.
+
+    Attributes:
+        k_factor (float): Maximum rating change for a single result.
+        initial (float): Rating every contestant starts with.
+        reset (float): Fraction of the distance to `initial` removed at each new year,
+            0 matches the `mmr_noreset` behaviour and 1 is a full reset.
+        scale (float): Rating difference that makes one side 10 times more likely to win.
+    """
+    k_factor: float = 32.0
+    initial: float = 1000.0
+    reset: float = 0.0
+    scale: float = 400.0
+
+
+@dataclass
+class BacktestResult:
+    """
+    The outcome of replaying the match history with one set of parameters.
+
+    Attributes:
+        params (RatingParams): The parameters that were replayed.
+        log_loss (float): Mean log loss of the pre-match win probability, lower is better.
+        brier (float): Mean squared error of the pre-match win probability.
+        accuracy (float): Fraction of decisive results where the favourite won.
+        runtime (float): Seconds spent replaying.
+        ratings (Optional[np.ndarray]): Final ratings, indexed like `MatchArrays.names`.
+    """
+    params: RatingParams
+    log_loss: float
+    brier: float
+    accuracy: float
+    runtime: float
+    ratings: Optional[np.ndarray] = None
+
+
+def replay(arrays: MatchArrays, params: RatingParams, keep_ratings: bool = False) -> BacktestResult:
+    """
+    Replay the match history in order, scoring each prediction before applying the result.
+
+    Args:
+        arrays (MatchArrays): The match history.
+        params (RatingParams): The parameters to replay with.
+        keep_ratings (bool, optional): Include the final ratings in the result. Defaults to False.
+
+    Returns:
+        BacktestResult: The score of the parameters.
+    """
+    start = time.perf_counter()
+    ratings = [params.initial] * len(arrays.names)
+    k, initial, reset, scale = params.k_factor, params.initial, params.reset, params.scale
+
+    log_loss = brier = 0.0
+    correct = decisive = 0
+    current_year = None
+    for year, w, l, draw in zip(arrays.year.tolist(), arrays.winner.tolist(),
+                                arrays.loser.tolist(), arrays.draw.tolist()):
+        if year != current_year:
+            if current_year is not None and reset:
+                ratings = [r - (r - initial) * reset for r in ratings]
+            current_year = year
+
+        expected = 1.0 / (1.0 + math.pow(10.0, (ratings[l] - ratings[w]) / scale))
+        actual = 0.5 if draw else 1.0
+        clipped = min(max(expected, 1e-12), 1 - 1e-12)
+        log_loss -= actual * math.log(clipped) + (1.0 - actual) * math.log(1.0 - clipped)
+        brier += (expected - actual) ** 2
+        if not draw:
+            decisive += 1
+            correct += expected > 0.5
+
+        change = k * (actual - expected)
+        ratings[w] += change
+        ratings[l] -= change
+
+    total = max(len(arrays), 1)
+    return BacktestResult(
+        params=params,
+        log_loss=log_loss / total,
+        brier=brier / total,
+        accuracy=correct / max(decisive, 1),
+        runtime=time.perf_counter() - start,
+        ratings=np.array(ratings, dtype=np.float64) if keep_ratings else None,
+    )
+
+
+def parameter_grid(**values: Iterable[float]) -> list[RatingParams]:
+    """
+    Expand every combination of the given parameter values.
+
+    Example:
+        parameter_grid(k_factor=[16, 24, 32], reset=[0, 0.25, 0.5])
+
+    Returns:
+        list[RatingParams]: One parameter set per combination.
+    """
+    keys = list(values)
+    return [RatingParams(**dict(zip(keys, combo))) for combo in itertools.product(*values.values())]
+
+
+def parameter_random(samples: int, seed: Optional[int] = None,
+                     **ranges: tuple[float, float]) -> list[RatingParams]:
+    """
+    Draw parameter sets uniformly from the given (low, high) ranges.
+
+    Example:
+        parameter_random(50, k_factor=(8, 64), reset=(0, 1))
+
+    Returns:
+        list[RatingParams]: `samples` random parameter sets.
+    """
+    rng = random.Random(seed)
+    return [RatingParams(**{k: rng.uniform(low, high) for k, (low, high) in ranges.items()})
+            for _ in range(samples)]
+
+
+# Shared memory transport #
+
+_worker_arrays: Optional[MatchArrays] = None
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+# Every array starts at a multiple of this, numpy views of int32 data after int16 data would be misaligned
+_ALIGNMENT = 8
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _share(arrays: MatchArrays) -> tuple[shared_memory.SharedMemory, list[tuple[str, str, int, int]]]:
+    """
+    Copy the match arrays into one shared memory block.
+
+    Returns:
+        tuple: The shared memory block and a layout of (field, dtype, offset, length) entries.
+    """
+    offsets, size = [], 0
+    for field in MatchArrays.ARRAY_FIELDS:
+        offsets.append(_aligned(size))
+        size = offsets[-1] + getattr(arrays, field).nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    layout = []
+    for field, offset in zip(MatchArrays.ARRAY_FIELDS, offsets):
+        array = getattr(arrays, field)
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=offset)
+        view[:] = array
+        layout.append((field, array.dtype.str, offset, len(array)))
+    return shm, layout
+
+
+def _attach(shm_name: str, layout: list[tuple[str, str, int, int]], names: list[str], titles: list[str]):
+    """
+    Worker initializer, attach to the shared match arrays.
+    """
+    global _worker_arrays, _worker_shm
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    columns = {
+        field: np.ndarray((length,), dtype=np.dtype(dtype), buffer=_worker_shm.buf, offset=offset)
+        for field, dtype, offset, length in layout
+    }
+    _worker_arrays = MatchArrays(names=names, titles=titles, **columns)
+    # Run when the worker process exits
+    util.Finalize(None, _detach, exitpriority=10)
+
+
+def _detach():
+    """
+    Worker finalizer, drop the views and close the shared memory block.
+    """
+    global _worker_arrays, _worker_shm
+    _worker_arrays = None
+    if _worker_shm is not None:
+        _worker_shm.close()
+        _worker_shm = None
+
+
+def _evaluate(params: RatingParams) -> BacktestResult:
+    """
+    Worker task, replay the shared match arrays with one set of parameters.
+    """
+    return replay(_worker_arrays, params)
+
+
+def run_sweep(arrays: MatchArrays, candidates: list[RatingParams],
+              workers: Optional[int] = None) -> list[BacktestResult]:
+    """
+    Evaluate parameter sets in parallel and rank them by predictive score.
+
+    Args:
+        arrays (MatchArrays): The match history.
+        candidates (list[RatingParams]): The parameter sets to evaluate.
+        workers (Optional[int]): Number of worker processes, defaults to the CPU count.
+
+    Returns:
+        list[BacktestResult]: Results sorted by log loss, best first.
+    """
+    shm, layout = _share(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                 initargs=(shm.name, layout, arrays.names, arrays.titles)) as pool:
+            results = list(pool.map(_evaluate, candidates))
+    finally:
+        shm.close()
+        shm.unlink()
+    return sorted(results, key=lambda r: (r.log_loss, r.runtime))
+
+
+def format_table(results: list[BacktestResult], limit: Optional[int] = None) -> str:
+    """
+    Render sweep results as a ranked text table.
+
+    Args:
+        results (list[BacktestResult]): Results from `run_sweep`.
+        limit (Optional[int]): Only include the best `limit` results.
+
+    Returns:
+        str: The table.
+    """
+    param_names = [f.name for f in fields(RatingParams)]
+    header = ["rank", *param_names, "log_loss", "brier", "accuracy", "runtime_s"]
+    lines = [header]
+    for rank, result in enumerate(results[:limit], start=1):
+        params = [f"{getattr(result.params, name):g}" for name in param_names]
+        lines.append([str(rank), *params, f"{result.log_loss:.5f}", f"{result.brier:.5f}",
+                      f"{result.accuracy:.4f}", f"{result.runtime:.3f}"])
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in lines)
@@ -0,0 +1,384 @@
+"""
+benchmark.py
+
+This module benchmarks every route of the website in process against a synthetic database, so
+performance changes show up before they are deployed.
+
+The database from website.synthetic_db is swapped into `db_holder`, an admin session is created
+and every scenario is requested through Starlette's TestClient, which runs the ASGI app in
+process without a server. Every scenario is first requested a few times untimed, so caches that
+fill on first use (title pages, the rankings card) are measured warm. Latency is measured in a
+pass without tracing, allocations in a separate pass under tracemalloc.
+
+Routes of website.routes without a scenario are reported, so new routes do not go unmeasured.
+Routes that change state (clearing tables, reloading the database, fan hub submissions) are
+skipped. A scenario answered with a status of 500 or more failed like one that raised: it has
+no allocation figures and is left out of the comparison with a baseline, as an error page is no
+measure of the route. Routes that need SQL Server fail unless `sqlite_path` swaps in the SQLite
+stand-in of website.stand_ins. The memory diff compares two snapshots taken untimed before the
+scenarios run, tracemalloc is stopped again afterwards so it does not slow down the other routes.
+
+Module Components:
+- Scenario: One request to benchmark.
+- RouteResult: Latency and allocation figures of one scenario.
+- scenarios: Function to build the scenarios for a database.
+- uncovered: Function to list the routes without a scenario.
+- run_benchmark: Function to run the scenarios against a database.
+- compare: Function to compare results with a baseline.
+- save_baseline / load_baseline: Functions to store results as JSON.
+- format_results: Function to render results as a text table.
+
+Dependencies:
+- numpy
+- starlette
+- Local modules: website.api, website.memory, website.models, website.resources, website.session,
+  website.stand_ins, website.synthetic_db
+"""
+import json
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from typing import Any, Optional
+
+import numpy as np
+
+# Routes that change state, with the reason they are not benchmarked
+SKIPPED = {
+    "GET /admin/access_logs/clear": "clears the access log",
+    "GET /admin/reload": "rebuilds the database",
+    "GET /admin/memory/snapshot": "starts tracemalloc and stores a snapshot",
+    "GET /admin/memory/tracing/stop": "stops tracemalloc and drops the snapshots",
+    "POST /admin/sessions/revoke": "revokes a session",
+    "GET /admin/profiles/{profile_id}": "needs a stored profile",
+    "GET /fanhub/rankings/results/clear": "clears the submissions",
+    "POST /fanhub/rankings/current/submit": "writes a submission",
+    "POST /fanhub/rankings/submit/submit": "writes a submission",
+}
+# Growth below these is noise, not a regression
+NOISE_FLOOR_MS = 1.0
+NOISE_FLOOR_KIB = 64.0
+
+
+@dataclass
+class Scenario:
+    """
+    One request to benchmark.
+
+    Attributes:
+        route (str): Method and route template, e.g. "GET /wrestlers/{name:path}".
+        url (str): The URL requested.
+        method (str): The request method.
+        data (Optional[dict]): Form data for POST requests.
+    """
+    route: str
+    url: str
+    method: str = "GET"
+    data: Optional[dict] = None
+
+
+@dataclass
+class RouteResult:
+    """
+    Latency and allocation figures of one scenario.
+
+    Attributes:
+        route (str): Method and route template.
+        url (str): The URL requested.
+        status (int): Highest status of the timed responses, 0 if a request raised.
+        p50_ms (float): Median latency.
+        p95_ms (float): 95th percentile latency.
+        peak_kib (float): Largest rise of traced memory during one request.
+        error (str): The exception of a failed request, or the status if it was 500 or more.
+    """
+    route: str
+    url: str
+    status: int = 0
+    p50_ms: float = 0.0
+    p95_ms: float = 0.0
+    peak_kib: float = 0.0
+    error: str = field(default="", repr=False)
+
+
+def scenarios(db, snapshot_ids: tuple[int, int] = (1, 2)) -> list[Scenario]:
+    """
+    Build the scenarios for a database, one per route.
+
+    Args:
+        db (mmrDB): The database, real or synthetic.
+        snapshot_ids (tuple[int, int]): Stored memory snapshots the memory diff compares.
+
+    Returns:
+        list[Scenario]: The scenarios.
+    """
+    division = db.divisions[0]
+    contestant = max(division.contestants, key=lambda c: len(getattr(c, "matches", [])))
+    title = db.titles[0].name if getattr(db, "titles", None) else "unknown"
+    stats_division, years, mmr_keys, stat_divisions = db.api_stats_keys()
+    year = years[0]
+    stats_path = f"{stats_division[0]}/{year}/{mmr_keys[0]}/{stat_divisions[0]}"
+    (graph_divisions, graph_stats, graph_division_keys, mmr_types, mmr_divisions, mmr_stats,
+     mmr_division_keys) = db.api_graphs_keys()
+    last_date = str(db.rankings_updated.get("date", ""))
+
+    get = [
+        ("/", "/"),
+        ("/faq/", "/faq/"),
+        ("/healthz", "/healthz"),
+        ("/readyz", "/readyz"),
+        ("/divisions/{abr}", f"/divisions/{division.abr}"),
+        ("/wrestlers/{name:path}", f"/wrestlers/{contestant.name}"),
+        ("/rankings", "/rankings"),
+        ("/rankings/card.png", "/rankings/card.png"),
+        ("/rankings/cards", "/rankings/cards"),
+        ("/rankings/extended/", "/rankings/extended/"),
+        ("/api/rankings", f"/api/rankings?date={last_date}"),
+        ("/api/rankings/diff", "/api/rankings/diff?start=2020-01-01"),
+        ("/api/mmr_history", f"/api/mmr_history?contestant={contestant.name}"),
+        ("/stats/", "/stats/"),
+        ("/stats/{wrestler_division}/{year_key}/{mmr_key}/{stat_division}", f"/stats/{stats_path}"),
+        ("/stats/data/{wrestler_division}/{year_key}/{mmr_key}/{stat_division}",
+         f"/stats/data/{stats_path}?sort=MMR&limit=50"),
+        ("/graphs/", "/graphs/"),
+        ("/graphs_stat/{wrestler_division}/{stat_key}/{division_key}/{winless}",
+         f"/graphs_stat/{graph_divisions[0]}/{graph_stats[0]}/{graph_division_keys[0]}/on"),
+        ("/graphs_mmr/{wrestler_division}/{mmr_type}/{division_key}/{stat_key}/{winless}",
+         f"/graphs_mmr/{mmr_divisions[0]}/{mmr_types[0]}/{mmr_division_keys[0]}/{mmr_stats[0]}/on"),
+        ("/titles/", "/titles/"),
+        ("/titles/{title_name}/", f"/titles/{title}/"),
+        ("/api/titles/{title_name}/holder", f"/api/titles/{title}/holder?date={last_date}"),
+        ("/api/titles/{title_name}/days", f"/api/titles/{title}/days?start=2020-01-01&end={last_date}"),
+        ("/admin/test", "/admin/test"),
+        ("/admin/debug/", "/admin/debug/"),
+        ("/admin/access_logs/", "/admin/access_logs/"),
+        ("/admin/rankings_helper", "/admin/rankings_helper"),
+        ("/admin/matches/", "/admin/matches/"),
+        ("/admin/db_debug/", "/admin/db_debug/"),
+        ("/admin/reload/status", "/admin/reload/status"),
+        ("/admin/sessions/", "/admin/sessions/"),
+        ("/admin/timing/", "/admin/timing/"),
+        ("/admin/profiles/", "/admin/profiles/"),
+        ("/admin/memory/", "/admin/memory/"),
+        ("/admin/memory/diff/{first_id}/{second_id}", "/admin/memory/diff/{}/{}".format(*snapshot_ids)),
+        ("/fanhub/", "/fanhub/"),
+        ("/fanhub/rankings/current", "/fanhub/rankings/current"),
+        ("/fanhub/rankings/submit", "/fanhub/rankings/submit"),
+        ("/fanhub/rankings/results", "/fanhub/rankings/results"),
+        ("/fanhub/predictions/admin", "/fanhub/predictions/admin"),
+        ("/export/matches", "/export/matches?format=csv"),
+        ("/export/stats/{wrestler_division}/{year_key}/{mmr_key}/{stat_division}",
+         f"/export/stats/{stats_path}?format=ndjson"),
+        ("/matches/data", f"/matches/data?contestant={contestant.name}&limit=50"),
+        ("/metrics", "/metrics"),
+    ]
+    return [
+        *(Scenario(f"GET {route}", url) for route, url in get),
+        Scenario("POST /admin/rankings_helper", "/admin/rankings_helper", "POST", {"wrestler_name": contestant.name}),
+    ]
+
+
+def uncovered(app, covered: list[Scenario]) -> list[str]:
+    """
+    List the routes of website.routes without a scenario that are not skipped on purpose.
+
+    Args:
+        app (FastAPI): The application.
+        covered (list[Scenario]): The scenarios.
+
+    Returns:
+        list[str]: Method and route template of every uncovered route.
+    """
+    names = {scenario.route for scenario in covered} | set(SKIPPED)
+    missing = []
+    for route in app.routes:
+        endpoint = getattr(route, "endpoint", None)
+        if endpoint is None or not endpoint.__module__.startswith("website.routes"):
+            continue
+        for method in sorted(route.methods or ()):
+            if method != "HEAD" and f"{method} {route.path}" not in names:
+                missing.append(f"{method} {route.path}")
+    return missing
+
+
+def run_benchmark(db, iterations: int = 20, warmup: int = 2, alloc_iterations: int = 3,
+                  only: Optional[str] = None, sqlite_path: Optional[str] = None
+                  ) -> tuple[list[RouteResult], list[str]]:
+    """
+    Run the scenarios against a database.
+
+    Args:
+        db (mmrDB): The database to swap into `db_holder`.
+        iterations (int): Timed requests per scenario.
+        warmup (int): Untimed requests per scenario before timing.
+        alloc_iterations (int): Requests per scenario under tracemalloc.
+        only (Optional[str]): Only run scenarios whose route contains this text.
+        sqlite_path (Optional[str]): SQLite file standing in for SQL Server, SQL Server is used if None.
+
+    Returns:
+        tuple[list[RouteResult], list[str]]: The results and the uncovered routes.
+    """
+    from starlette.testclient import TestClient
+
+    from website.api import app
+    from website.models import SessionData
+    from website.resources import db_holder
+    from website.session import COOKIE_NAME, create_session
+
+    if sqlite_path is not None:
+        from website.stand_ins import install
+        install(sqlite_path)
+    db_holder.load(lambda: db)
+
+    results = []
+    with TestClient(app, raise_server_exceptions=False) as client:
+        admin = SessionData(username="benchmark", web_user=True, web_admin=True, fanhub_user=True,
+                            fanhub_elite=True, fanhub_admin=True)
+        client.cookies.set(COOKIE_NAME, client.portal.call(create_session, admin))
+        selected = [scenario for scenario in scenarios(db, _memory_snapshots(client))
+                    if only is None or only in scenario.route]
+
+        for scenario in selected:
+            result = RouteResult(scenario.route, scenario.url)
+            try:
+                for _ in range(warmup):
+                    _request(client, scenario)
+                timings = []
+                for _ in range(iterations):
+                    start = time.perf_counter()
+                    result.status = max(result.status, _request(client, scenario))
+                    timings.append((time.perf_counter() - start) * 1000)
+                result.p50_ms, result.p95_ms = (round(float(value), 3) for value in np.percentile(timings, [50, 95]))
+                if result.status >= 500:
+                    result.error = f"status {result.status}"
+            except Exception as e:
+                result.status, result.error = 0, repr(e)
+            results.append(result)
+
+        tracemalloc.start()
+        try:
+            for result, scenario in zip(results, selected):
+                if result.error:
+                    continue
+                peaks = []
+                for _ in range(alloc_iterations):
+                    current = tracemalloc.get_traced_memory()[0]
+                    tracemalloc.reset_peak()
+                    _request(client, scenario)
+                    peaks.append(tracemalloc.get_traced_memory()[1] - current)
+                result.peak_kib = round(max(peaks) / 1024, 1)
+        finally:
+            tracemalloc.stop()
+
+    return results, uncovered(app, selected if only is None else scenarios(db))
+
+
+def _memory_snapshots(client) -> tuple[int, int]:
+    """Store two memory snapshots for the diff scenario, leaving tracemalloc as it was."""
+    from website import memory
+
+    tracing = tracemalloc.is_tracing()
+    for _ in range(2):
+        client.get("/admin/memory/snapshot", follow_redirects=False)
+    if not tracing:
+        # The snapshots stay stored, only new allocations are no longer traced
+        tracemalloc.stop()
+    stored = memory.snapshots.list()
+    return (stored[1].id, stored[0].id) if len(stored) >= 2 else (0, 0)
+
+
+def _request(client, scenario: Scenario) -> int:
+    response = client.request(scenario.method, scenario.url, data=scenario.data, follow_redirects=False)
+    # Streaming responses are read completely, like a client would
+    response.read()
+    return response.status_code
+
+
+def compare(results: list[RouteResult], baseline: dict[str, Any], threshold: float = 1.25) -> list[dict[str, Any]]:
+    """
+    Compare results with a baseline.
+
+    A route regressed if its p95 latency or peak allocation grew by more than `threshold` times and
+    by more than NOISE_FLOOR_MS or NOISE_FLOOR_KIB. Routes that failed in either run are left out.
+
+    Args:
+        results (list[RouteResult]): The new results.
+        baseline (dict[str, Any]): A baseline from `load_baseline`.
+        threshold (float): Allowed growth factor.
+
+    Returns:
+        list[dict[str, Any]]: route, p50/p95 ratios, peak ratio and regressed for every route in both.
+    """
+    base_routes = baseline.get("routes", {})
+    rows = []
+    for result in results:
+        base = base_routes.get(result.route)
+        # Baselines saved before 5xx counted as errors only have the status
+        if base is None or result.error or base.get("error") or base.get("status", 0) >= 500:
+            continue
+        p50 = _ratio(result.p50_ms, base["p50_ms"])
+        p95 = _ratio(result.p95_ms, base["p95_ms"])
+        peak = _ratio(result.peak_kib, base["peak_kib"])
+        slower = p95 > threshold and result.p95_ms - base["p95_ms"] > NOISE_FLOOR_MS
+        larger = peak > threshold and result.peak_kib - base["peak_kib"] > NOISE_FLOOR_KIB
+        rows.append({"route": result.route, "p50": p50, "p95": p95, "peak": peak, "regressed": slower or larger})
+    return rows
+
+
+def _ratio(new: float, old: float) -> float:
+    return round(new / old, 2) if old else (1.0 if not new else float("inf"))
+
+
+def save_baseline(file_name: str, results: list[RouteResult], fixture: dict[str, Any]):
+    """
+    Store results as JSON.
+
+    Args:
+        file_name (str): The file.
+        results (list[RouteResult]): The results.
+        fixture (dict[str, Any]): The synthetic database parameters, stored for reference.
+    """
+    with open(file_name, "w") as f:
+        json.dump({"fixture": fixture, "routes": {result.route: asdict(result) for result in results}}, f, indent=2)
+
+
+def load_baseline(file_name: str) -> dict[str, Any]:
+    """
+    Load results stored with `save_baseline`.
+
+    Args:
+        file_name (str): The file.
+
+    Returns:
+        dict[str, Any]: fixture and routes.
+    """
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def format_results(results: list[RouteResult], comparison: Optional[list[dict[str, Any]]] = None) -> str:
+    """
+    Render results as a text table, slowest first.
+
+    Args:
+        results (list[RouteResult]): The results.
+        comparison (Optional[list[dict[str, Any]]]): Ratios from `compare` to add as columns.
+
+    Returns:
+        str: The table.
+    """
+    ratios = {row["route"]: row for row in comparison or []}
+    header = ["route", "status", "p50_ms", "p95_ms", "peak_kib"]
+    if comparison is not None:
+        header += ["p95_vs_base", "peak_vs_base", ""]
+    lines = [header]
+    for result in sorted(results, key=lambda r: -r.p95_ms):
+        line = [result.route, str(result.status) if result.status else "error",
+                f"{result.p50_ms:.2f}", f"{result.p95_ms:.2f}", f"{result.peak_kib:.1f}"]
+        if comparison is not None:
+            row = ratios.get(result.route)
+            line += [f"{row['p95']:.2f}x", f"{row['peak']:.2f}x", "REGRESSED" if row["regressed"] else ""] \
+                if row else ["", "", ""]
+        lines.append(line)
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    return "\n".join("  ".join(cell.ljust(width) if i == 0 else cell.rjust(width)
+                               for i, (cell, width) in enumerate(zip(line, widths))).rstrip()
+                     for line in lines)
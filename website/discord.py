@@ -3,22 +3,42 @@ discord.py
 
 This module provides custom classes for Discord OAuth session and client.
 
+All sessions created by the client share one pooled connector, so the connections and DNS lookups
+to Discord are reused across logins. After the token exchange the member, identify and guilds
+requests are sent concurrently, a login takes the exchange and one round trip. The role results
+are cached per Discord user and revalidated in the background for as long as the user has an
+active session.
+
 Classes:
-    - CustomDiscordOAuthSession: Custom session class for Discord OAuth, extending DiscordOAuthSession.
+    - CustomDiscordOAuthSession: Discord OAuth session of one user on the shared connector.
     - CustomDiscordOAuthClient: Custom client class for Discord OAuth, extending DiscordOAuthClient.
+    - DiscordRoleCache: TTL cache of fanhub roles per Discord user with a background refresher.
+
+Configuration:
+    - DISCORD_API_URL: Base URL of the Discord API, e.g. a local stub server for testing.
+      oauthlib refuses plain http token URLs unless OAUTHLIB_INSECURE_TRANSPORT=1 is set.
 
 Third-party libraries used:
 - aiohttp
 - dotenv
+- oauthlib
 - starlette_discord
 """
 
+import asyncio
+import logging
 import os
-from typing import Union
+import time
+import uuid
+from typing import Optional, Union
 
-from aiohttp import ClientResponseError
+from aiohttp import BasicAuth, ClientError, ClientResponseError, ClientSession, TCPConnector
 from dotenv import load_dotenv
-from starlette_discord import DiscordOAuthClient, DiscordOAuthSession
+from oauthlib.common import urldecode
+from oauthlib.oauth2 import InsecureTransportError, is_secure_transport, WebApplicationClient
+from starlette_discord import DiscordOAuthClient
+from starlette_discord import client as discord_api
+from starlette_discord.models import Guild, User
 
 from website.models import SessionData
 
@@ -28,31 +48,139 @@ aewfanhub_id = os.environ.get("AEWFANHUB_ID")
 mod_id = os.environ.get("MOD_ROLE_ID")
 elite_id = os.environ.get("ELITE_ROLE_ID")
 my_user_id = os.environ.get("MY_USER_ID")
+API_URL = os.environ.get("DISCORD_API_URL", discord_api.API_URL).rstrip("/")
 
 
-class CustomDiscordOAuthSession(DiscordOAuthSession):
+class CustomDiscordOAuthSession:
     """
-    Custom session class for Discord OAuth.
+    Discord OAuth session of one user.
 
-    Adds the `get_fanhub_roles` method to retrieve fanhub discord server roles.
+    Wraps an aiohttp ClientSession on the client's shared connector rather than subclassing it,
+    aiohttp discourages subclassing ClientSession. The token exchange and refresh follow
+    starlette_discord's DiscordOAuthSession, `get_fanhub_roles` retrieves the fanhub discord server
+    roles and every request goes to `API_URL`.
+
+    Attributes:
+        token (Optional[dict]): The OAuth token, set by the code exchange.
+        cached_user (Optional[User]): The user, set by `identify`.
     """
 
-    async def get_fanhub_roles(self) -> Union[SessionData, bool]:
+    def __init__(self, client_id: str, client_secret: str, scope: str, redirect_uri: str, *,
+                 code: Optional[str] = None, token: Optional[dict] = None, connector: Optional[TCPConnector] = None):
         """
-        Get fanhub roles for the user.
+        Args:
+            client_id (str): Discord application client ID.
+            client_secret (str): Discord application client secret.
+            scope (str): Authorization scopes separated by spaces.
+            redirect_uri (str): Discord application redirect URI.
+            code (Optional[str]): Authorization code of the login, either it or `token` must be given.
+            token (Optional[dict]): An existing token to use instead of the code exchange.
+            connector (Optional[TCPConnector]): Shared connector, the session does not close it.
+        """
+        if bool(code) == bool(token):
+            raise ValueError("Either 'code' or 'token' parameter must be provided, but not both.")
+        self.client_id = client_id
+        self.scope = scope
+        self.redirect_uri = redirect_uri
+        self.token = token
+        self.cached_user: Optional[User] = None
+        self._code = code
+        self._client_secret = client_secret
+        self._oauth = WebApplicationClient(client_id)
+        self._http = ClientSession(connector=connector, connector_owner=connector is None)
+
+    async def close(self):
+        """
+        Close the HTTP session, a shared connector stays open.
+        """
+        await self._http.close()
+
+    @property
+    def session_expired(self) -> bool:
+        """True if the token has expired."""
+        return self.token["expires_at"] < time.time()
+
+    async def _token_request(self, body: str, auth: Optional[BasicAuth] = None) -> dict:
+        url = API_URL + "/oauth2/token"
+        if not is_secure_transport(url):
+            raise InsecureTransportError()
+        headers = {"Accept": "application/json", "Content-Type": "application/x-www-form-urlencoded;charset=UTF-8"}
+        async with self._http.post(url, data=dict(urldecode(body)), auth=auth, headers=headers) as resp:
+            text = await resp.text()
+        return dict(self._oauth.parse_request_body_response(text, scope=self.scope))
+
+    async def ensure_token(self):
+        """
+        Exchange the authorization code for a token if the session has none yet.
+        """
+        if not self.token:
+            body = self._oauth.prepare_request_body(code=self._code, redirect_uri=self.redirect_uri,
+                                                    include_client_id=False)
+            self.token = await self._token_request(body, BasicAuth(self.client_id, self._client_secret))
+
+    async def refresh(self):
+        """
+        Refresh the token if it has expired.
 
         Returns:
-            Union[SessionData, bool]: The session data if the user has the required roles, otherwise False.
+            dict: The current token.
+        """
+        if self.session_expired:
+            refresh_token = self.token.get("refresh_token")
+            body = self._oauth.prepare_refresh_body(refresh_token=refresh_token, client_id=self.client_id,
+                                                    client_secret=self._client_secret)
+            token = await self._token_request(body)
+            token.setdefault("refresh_token", refresh_token)
+            self.token = token
+        return self.token
+
+    async def _discord_request(self, url_fragment: str, method: str = "GET"):
+        await self.ensure_token()
+
+        headers = {"Authorization": "Bearer " + self.token["access_token"]}
+        async with self._http.request(method, API_URL + url_fragment, headers=headers) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def identify(self) -> User:
+        """
+        Identify the user.
+
+        Returns:
+            User: The user who authorized the application.
         """
+        self.cached_user = User(data=await self._discord_request("/users/@me"))
+        return self.cached_user
+
+    async def guilds(self) -> list[Guild]:
+        """
+        Fetch the user's guild list.
+
+        Returns:
+            list[Guild]: The guilds of the user.
+        """
+        return [Guild(data=guild) for guild in await self._discord_request("/users/@me/guilds")]
+
+    async def _fanhub_member(self) -> dict:
         try:
             # Attempt to request user roles from the Discord API
-            data = await self._discord_request(f"/users/@me/guilds/{aewfanhub_id}/member")
+            return await self._discord_request(f"/users/@me/guilds/{aewfanhub_id}/member")
         except ClientResponseError:
             # Handle response error by setting empty roles
-            data = {"roles": []}
+            return {"roles": []}
 
-        user = await self.identify()
-        guilds = await self.guilds()
+    async def get_fanhub_roles(self) -> Union[SessionData, bool]:
+        """
+        Get fanhub roles for the user.
+
+        The code exchange runs first, the member, identify and guilds requests then share its token
+        and run concurrently. The user is left in `cached_user`.
+
+        Returns:
+            Union[SessionData, bool]: The session data if the user has the required roles, otherwise False.
+        """
+        await self.ensure_token()
+        data, user, guilds = await asyncio.gather(self._fanhub_member(), self.identify(), self.guilds())
 
         # elite contributors only, remove to allow more sign ins
         # Check if the user is an elite contributor, if not, return False
@@ -75,10 +203,37 @@ class CustomDiscordOAuthClient(DiscordOAuthClient):
     Custom client class for Discord OAuth.
 
     Overrides the `session` and `session_from_token` methods to return the CustomDiscordOAuthSession class.
+    The sessions share the client's connector, closing a session leaves the connector open.
     """
+
+    def __init__(self, *args, pool_size: int = 100, **kwargs):
+        """
+        Args:
+            pool_size (int, optional): Maximum number of open connections to Discord. Defaults to 100.
+            Other arguments are passed to DiscordOAuthClient.
+        """
+        super().__init__(*args, **kwargs)
+        self._pool_size = pool_size
+        self._connector: Optional[TCPConnector] = None
+
+    @property
+    def connector(self) -> TCPConnector:
+        """The shared connector, created on first use because it needs the running event loop."""
+        if self._connector is None or self._connector.closed:
+            self._connector = TCPConnector(limit=self._pool_size, ttl_dns_cache=300)
+        return self._connector
+
+    async def close(self):
+        """
+        Close the shared connector.
+        """
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+
     def session(self, code: str) -> CustomDiscordOAuthSession:
         """
-        Create a new DiscordOAuthSession from an authorization code.
+        Create a new session from an authorization code.
 
         Args:
             code (str): The OAuth2 code provided by the Discord API.
@@ -93,11 +248,12 @@ class CustomDiscordOAuthClient(DiscordOAuthClient):
             client_secret=self.client_secret,
             scope=self.scope,
             redirect_uri=self.redirect_uri,
+            connector=self.connector,
         )
 
     def session_from_token(self, token) -> CustomDiscordOAuthSession:
         """
-        Create a new DiscordOAuthSession from an existing token.
+        Create a new session from an existing token.
 
         Args:
             token (dict): An existing (valid) access token to use instead of the OAuth code exchange.
@@ -112,4 +268,156 @@ class CustomDiscordOAuthClient(DiscordOAuthClient):
             client_secret=self.client_secret,
             scope=self.scope,
             redirect_uri=self.redirect_uri,
+            connector=self.connector,
         )
+
+
+class DiscordRoleCache:
+    """
+    Caches the fanhub roles of Discord users and revalidates them for users with active sessions.
+
+    Each entry keeps the user's OAuth token so the refresher can ask Discord again without the user.
+    When the roles change the linked sessions are updated, when the user loses access or the token
+    is revoked they are deleted.
+
+    Attributes:
+        ttl (float): Seconds before cached roles are revalidated.
+    """
+
+    def __init__(self, client: CustomDiscordOAuthClient, ttl: float = 900):
+        """
+        Args:
+            client (CustomDiscordOAuthClient): Client used to create sessions from the stored tokens.
+            ttl (float, optional): Seconds before cached roles are revalidated. Defaults to 900.
+        """
+        self.ttl = ttl
+        self._client = client
+        # user id -> [roles, token, fetched at, linked session ids]
+        self._entries: dict[str, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: str) -> Optional[Union[SessionData, bool]]:
+        """
+        Get the cached roles of a user.
+
+        Args:
+            user_id (str): The Discord user id.
+
+        Returns:
+            Optional[Union[SessionData, bool]]: The roles, or None if not cached or older than the TTL.
+        """
+        entry = self._entries.get(user_id)
+        if entry is None or time.monotonic() - entry[2] > self.ttl:
+            return None
+        return entry[0]
+
+    async def lookup(self, discord_session: CustomDiscordOAuthSession) -> Union[SessionData, bool]:
+        """
+        Get the roles of the user logging in with a session.
+
+        After the code exchange the identify, member and guilds requests run in one gather, waiting
+        for identify before asking for the rest would add a round trip to every login. The roles
+        are then cached under the identified user, `discord_session.cached_user`, by `store`.
+
+        Args:
+            discord_session (CustomDiscordOAuthSession): The session of the login.
+
+        Returns:
+            Union[SessionData, bool]: Result of `get_fanhub_roles`.
+        """
+        return await discord_session.get_fanhub_roles()
+
+    def store(self, user_id: str, roles: Union[SessionData, bool], token: dict, session_id: Optional[str] = None,
+              fetched: bool = True):
+        """
+        Cache the roles of a user and link a session to them.
+
+        Args:
+            user_id (str): The Discord user id.
+            roles (Union[SessionData, bool]): Result of `get_fanhub_roles`.
+            token (dict): The user's OAuth token.
+            session_id (Optional[str]): Session created for the user, kept up to date by `refresh`.
+            fetched (bool, optional): False if `roles` came from this cache, the entry then keeps its age.
+        """
+        entry = self._entries.setdefault(user_id, [roles, token, 0.0, set()])
+        entry[0], entry[1] = roles, token
+        if fetched:
+            entry[2] = time.monotonic()
+        if session_id is not None:
+            entry[3].add(session_id)
+
+    async def refresh(self, backend) -> int:
+        """
+        Revalidate every entry older than the TTL and apply changes to the linked sessions.
+
+        Entries without a live session are dropped instead of refreshed.
+
+        Args:
+            backend (SessionStore): The session backend holding the linked sessions.
+
+        Returns:
+            int: Number of entries refreshed.
+        """
+        now = time.monotonic()
+        refreshed = 0
+        for user_id, entry in list(self._entries.items()):
+            if now - entry[2] <= self.ttl:
+                continue
+
+            # Neither peek nor update renews, refreshing must not keep idle sessions alive
+            sessions = {sid for sid in entry[3] if backend.peek(uuid.UUID(sid)) is not None}
+            entry[3] -= entry[3] - sessions
+            if not sessions:
+                del self._entries[user_id]
+                continue
+
+            discord_session = self._client.session_from_token(entry[1])
+            try:
+                await discord_session.refresh()
+                roles = await discord_session.get_fanhub_roles()
+            except ClientResponseError as e:
+                if e.status != 401:
+                    continue
+                # Token revoked, the user has to log in again
+                roles = False
+            except (ClientError, asyncio.TimeoutError):
+                logging.warning("Could not revalidate Discord roles of %s", user_id)
+                continue
+            finally:
+                await discord_session.close()
+
+            # Logins may have stored the user again while Discord was asked, their result is newer
+            if self._entries.get(user_id) is not entry or entry[2] > now:
+                continue
+
+            # Including the sessions linked by logins since the refresh started
+            sessions = set(entry[3])
+            for sid in sessions:
+                if not roles:
+                    await backend.delete(uuid.UUID(sid))
+                elif roles != entry[0]:
+                    await backend.update(uuid.UUID(sid), roles)
+
+            if roles:
+                self.store(user_id, roles, discord_session.token)
+            else:
+                del self._entries[user_id]
+            refreshed += 1
+        return refreshed
+
+    async def run_refresher(self, backend, interval: float = 60):
+        """
+        Run `refresh` every `interval` seconds until cancelled.
+
+        Args:
+            backend (SessionStore): The session backend holding the linked sessions.
+            interval (float, optional): Seconds between runs. Defaults to 60.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh(backend)
+            except Exception:
+                logging.exception("Discord role refresh failed")
@@ -0,0 +1,260 @@
+"""
+export.py
+
+This module turns match history and stats into CSV, NDJSON or Parquet streams.
+
+Every step is a generator: rows are produced one at a time, filtered and projected on the way
+and encoded in chunks of `CHUNK_ROWS`, so a response holds at most one chunk in memory no matter
+how many rows it has.
+
+Formats:
+    - csv: Header line and one line per row.
+    - ndjson: One JSON object per line.
+    - parquet: One row group per chunk, requires the optional pyarrow package. Column types come
+      from `types` where given, otherwise from the first chunk, with columns that are only None
+      there written as strings.
+
+Functions:
+    - match_rows: Rows for `mmrDB.matches`, filtered by date range and division.
+    - project: Keep only the requested columns.
+    - encode: Encode rows in one of the formats.
+    - benchmark: Measure the encoding throughput in rows per second.
+
+Dependencies:
+    - pyarrow (optional, Parquet only)
+"""
+import csv
+import io
+import itertools
+import json
+import time
+from datetime import date
+from typing import Any, Iterable, Iterator, Optional
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+CHUNK_ROWS = 1000
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Column types of `match_rows`, the Parquet schema does not depend on which values come first
+MATCH_TYPES: dict[str, type] = {"date": str, "event": str, "winners": str, "losers": str, "draw": bool, "title": str}
+
+
+def match_rows(db, start: Optional[date] = None, end: Optional[date] = None,
+               division: Optional[str] = None) -> Iterator[dict[str, Any]]:
+    """
+    Rows for the match history, oldest first.
+
+    Args:
+        db (mmrDB): The database.
+        start (Optional[date]): First date to include.
+        end (Optional[date]): Last date to include.
+        division (Optional[str]): Division abbreviation, only matches with a contestant of it are included.
+
+    Yields:
+        dict[str, Any]: One row per match, with the contestants joined by ", ".
+
+    Raises:
+        ValueError: If the division does not exist.
+    """
+    names = None
+    if division:
+        found = db.get_division(division)
+        if not found:
+            raise ValueError(f"{division} not found")
+        names = {str(contestant) for contestant in found.contestants}
+
+    for match in db.matches:
+        if start and match.date < start:
+            continue
+        if end and match.date > end:
+            # Matches are kept in chronological order
+            break
+
+        winners = [str(contestant) for contestant in match.winners]
+        losers = [str(contestant) for contestant in match.losers]
+        if names is not None and names.isdisjoint(winners) and names.isdisjoint(losers):
+            continue
+
+        yield {
+            "date": match.date.isoformat(),
+            "event": str(match.event),
+            "winners": ", ".join(winners),
+            "losers": ", ".join(losers),
+            "draw": bool(match.draw),
+            "title": getattr(match.title, "name", match.title) or "",
+        }
+
+
+def project(rows: Iterable[dict[str, Any]], columns: Optional[list[str]] = None
+            ) -> tuple[list[str], Iterator[dict[str, Any]]]:
+    """
+    Keep only the requested columns, all columns of the first row if none are requested.
+
+    Args:
+        rows (Iterable[dict[str, Any]]): The rows.
+        columns (Optional[list[str]]): Columns to keep, in output order.
+
+    Returns:
+        tuple[list[str], Iterator[dict[str, Any]]]: The columns and the projected rows.
+
+    Raises:
+        ValueError: If a requested column is not in the rows.
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return list(columns or ()), iter(())
+
+    if not columns:
+        columns = list(first)
+    unknown = [column for column in columns if column not in first]
+    if unknown:
+        raise ValueError(f"unknown columns: {', '.join(unknown)}, available: {', '.join(first)}")
+
+    projected = ({column: row.get(column) for column in columns} for row in itertools.chain((first,), rows))
+    return columns, projected
+
+
+def encode(rows: Iterable[dict[str, Any]], columns: list[str], fmt: str,
+           types: Optional[dict[str, type]] = None) -> Iterator[bytes]:
+    """
+    Encode rows in chunks of `CHUNK_ROWS`.
+
+    Args:
+        rows (Iterable[dict[str, Any]]): The rows, already projected to `columns`.
+        columns (list[str]): The columns.
+        fmt (str): "csv", "ndjson" or "parquet".
+        types (Optional[dict[str, type]]): Python type (str, int, float or bool) of columns, used for
+            the Parquet schema, e.g. MATCH_TYPES.
+
+    Returns:
+        Iterator[bytes]: The encoded chunks.
+
+    Raises:
+        ValueError: If the format is unknown or pyarrow is missing for parquet.
+    """
+    if fmt == "csv":
+        return _encode_csv(rows, columns)
+    if fmt == "ndjson":
+        return _encode_ndjson(rows)
+    if fmt == "parquet":
+        if pyarrow is None:
+            raise ValueError("parquet export requires pyarrow")
+        return _encode_parquet(rows, columns, types or {})
+    raise ValueError(f"unknown format {fmt}, use one of {', '.join(MEDIA_TYPES)}")
+
+
+def _chunks(rows: Iterable[dict[str, Any]]) -> Iterator[list[dict[str, Any]]]:
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, CHUNK_ROWS)):
+        yield chunk
+
+
+def _encode_csv(rows: Iterable[dict[str, Any]], columns: list[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for chunk in _chunks(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _encode_ndjson(rows: Iterable[dict[str, Any]]) -> Iterator[bytes]:
+    for chunk in _chunks(rows):
+        yield "".join(json.dumps(row, default=str) + "\n" for row in chunk).encode()
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file the Parquet writer writes into, emptied after every row group."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _parquet_schema(columns: list[str], types: dict[str, type], chunk: Optional[list[dict[str, Any]]] = None):
+    arrow_types = {str: pyarrow.string(), int: pyarrow.int64(), float: pyarrow.float64(), bool: pyarrow.bool_()}
+    inferred = pyarrow.Table.from_pylist(chunk).schema if chunk else None
+    fields = []
+    for column in columns:
+        if column in types:
+            arrow_type = arrow_types[types[column]]
+        elif inferred is not None and not pyarrow.types.is_null(inferred.field(column).type):
+            arrow_type = inferred.field(column).type
+        else:
+            # No values to tell the type, a null column would reject the values of later chunks
+            arrow_type = pyarrow.string()
+        fields.append((column, arrow_type))
+    return pyarrow.schema(fields)
+
+
+def _encode_parquet(rows: Iterable[dict[str, Any]], columns: list[str], types: dict[str, type]) -> Iterator[bytes]:
+    sink = _DrainableSink()
+    writer = None
+    for chunk in _chunks(rows):
+        if writer is None:
+            schema = _parquet_schema(columns, types, chunk)
+            writer = pyarrow.parquet.ParquetWriter(sink, schema)
+        writer.write_table(pyarrow.Table.from_pylist(chunk, schema=schema))
+        yield sink.drain()
+
+    if writer is None:
+        writer = pyarrow.parquet.ParquetWriter(sink, _parquet_schema(columns, types))
+    writer.close()
+    yield sink.drain()
+
+
+def benchmark(rows: list[dict[str, Any]], formats: Iterable[str] = MEDIA_TYPES, repeat: int = 3) -> dict[str, float]:
+    """
+    Measure how many rows per second each format encodes.
+
+    Args:
+        rows (list[dict[str, Any]]): Rows to encode, e.g. `list(match_rows(db))`.
+        formats (Iterable[str], optional): Formats to measure. Defaults to all.
+        repeat (int, optional): Runs per format, the best is kept. Defaults to 3.
+
+    Returns:
+        dict[str, float]: Rows per second for each format that could run.
+    """
+    results = {}
+    for fmt in formats:
+        if fmt == "parquet" and pyarrow is None:
+            continue
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            columns, projected = project(rows)
+            for _ in encode(projected, columns, fmt):
+                pass
+            best = min(best, time.perf_counter() - start)
+        results[fmt] = round(len(rows) / best) if best else float("inf")
+    return results
@@ -0,0 +1,317 @@
+"""
+loadtest.py
+
+This module replays a mix of user actions against the website at a target request rate and
+reports throughput and tail latency, with SQL Server and Discord replaced by the local stand-ins
+of website.stand_ins and the database by one from website.synthetic_db.
+
+Virtual users log in through /discord/callback like real fan hub members, so the session backend
+and the Discord role check are part of the load. Requests are started open loop: one every
+1/rps seconds whether earlier ones finished or not, so a slow server shows up as latency rather
+than as a lower request rate. Requests that could not start on time because `max_in_flight`
+requests were running are counted as dropped, starts delayed by the event loop as late.
+
+The app runs in process through httpx's ASGI transport, route handlers and the thread pool
+compete with the load generator for the same interpreter, so absolute numbers are lower than
+against a served worker. Use it to compare changes and mixes.
+
+Module Components:
+- ACTIONS: Action name to the function building its request.
+- USER_MIXES: Named mixes of action weights.
+- ActionResult: Latency figures of one action.
+- LoadTestResult: Figures of a whole run.
+- parse_mix: Function to read a mix name or `action=weight,...` list.
+- run_load_test: Function to run a mix against a database.
+- format_result: Function to render a run as text.
+
+Dependencies:
+- httpx
+- numpy
+- Local modules: website.api, website.resources, website.session, website.sql_db, website.stand_ins
+"""
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import numpy as np
+
+
+def _rankings(db, rng: random.Random) -> tuple[str, str, Optional[dict]]:
+    return "GET", rng.choice(["/rankings", "/rankings/extended/", "/api/rankings"]), None
+
+
+def _wrestler(db, rng: random.Random) -> tuple[str, str, Optional[dict]]:
+    division = rng.choice(db.divisions)
+    if rng.random() < 0.3:
+        return "GET", f"/divisions/{division.abr}", None
+    return "GET", f"/wrestlers/{rng.choice(division.contestants).name}", None
+
+
+def _titles(db, rng: random.Random) -> tuple[str, str, Optional[dict]]:
+    if not db.titles or rng.random() < 0.3:
+        return "GET", "/titles/", None
+    return "GET", f"/titles/{rng.choice(db.titles).name}/", None
+
+
+def _stats(db, rng: random.Random) -> tuple[str, str, Optional[dict]]:
+    stats_divisions, years, mmr_keys, stat_divisions = db.api_stats_keys()
+    path = f"{rng.choice(stats_divisions)}/{rng.choice(years)}/{rng.choice(mmr_keys)}/{rng.choice(stat_divisions)}"
+    return "GET", f"/stats/data/{path}?sort=MMR&limit=50", None
+
+
+def _graphs(db, rng: random.Random) -> tuple[str, str, Optional[dict]]:
+    (graph_divisions, graph_stats, graph_division_keys, mmr_types, mmr_divisions, mmr_stats,
+     mmr_division_keys) = db.api_graphs_keys()
+    winless = rng.choice(["on", "off"])
+    if rng.random() < 0.5:
+        return "GET", (f"/graphs_stat/{rng.choice(graph_divisions)}/{rng.choice(graph_stats)}/"
+                       f"{rng.choice(graph_division_keys)}/{winless}"), None
+    return "GET", (f"/graphs_mmr/{rng.choice(mmr_divisions)}/{rng.choice(mmr_types)}/"
+                   f"{rng.choice(mmr_division_keys)}/{rng.choice(mmr_stats)}/{winless}"), None
+
+
+def _ballot_form(db, rng: random.Random) -> tuple[str, str, Optional[dict]]:
+    return "GET", "/fanhub/rankings/submit", None
+
+
+def _submit_ballot(db, rng: random.Random) -> tuple[str, str, Optional[dict]]:
+    from website.sql_db import SQLDatabase
+
+    names = [contestant.name for division in db.divisions for contestant in division.contestants]
+    # Form keys as the submit page names its selects, "form_data[AEW World Title 1]"
+    data = {f"form_data[{column.replace('_', ' ')}]": rng.choice(names)
+            for column, _ in SQLDatabase.rcv_cols[2:]}
+    return "POST", "/fanhub/rankings/submit/submit", data
+
+
+def _results(db, rng: random.Random) -> tuple[str, str, Optional[dict]]:
+    return "GET", "/fanhub/rankings/results", None
+
+
+ACTIONS: dict[str, Callable] = {
+    "rankings": _rankings,
+    "wrestler": _wrestler,
+    "titles": _titles,
+    "stats": _stats,
+    "graphs": _graphs,
+    "ballot_form": _ballot_form,
+    "submit_ballot": _submit_ballot,
+    "results": _results,
+}
+
+USER_MIXES: dict[str, dict[str, float]] = {
+    "browse": {"rankings": 4, "wrestler": 4, "titles": 2, "stats": 1},
+    "fanhub": {"ballot_form": 3, "submit_ballot": 2, "results": 3, "rankings": 2},
+    "graphs": {"graphs": 1},
+    "mixed": {"rankings": 4, "wrestler": 4, "titles": 2, "stats": 1, "graphs": 1,
+              "ballot_form": 1, "submit_ballot": 1, "results": 1},
+}
+
+
+@dataclass
+class ActionResult:
+    """
+    Latency figures of one action.
+
+    Attributes:
+        action (str): The action name.
+        requests (int): Requests completed.
+        errors (int): Requests answered with a status of 400 or more, or that raised.
+        p50_ms (float): Median latency.
+        p95_ms (float): 95th percentile latency.
+        p99_ms (float): 99th percentile latency.
+        max_ms (float): Slowest request.
+    """
+    action: str
+    requests: int = 0
+    errors: int = 0
+    p50_ms: float = 0.0
+    p95_ms: float = 0.0
+    p99_ms: float = 0.0
+    max_ms: float = 0.0
+
+
+@dataclass
+class LoadTestResult:
+    """
+    Figures of a whole run.
+
+    Attributes:
+        mix (dict[str, float]): The action weights.
+        target_rps (float): The requested rate.
+        duration_s (float): Seconds from the first start to the last completion.
+        scheduled (int): Requests the schedule asked for.
+        dropped (int): Requests not started because `max_in_flight` requests were running.
+        late (int): Requests started more than 10 ms after their slot.
+        login_ms (float): Median latency of the virtual user logins.
+        total (ActionResult): All actions together.
+        actions (list[ActionResult]): Per action.
+        errors (dict[str, int]): Error status or exception to its count.
+    """
+    mix: dict[str, float]
+    target_rps: float
+    duration_s: float = 0.0
+    scheduled: int = 0
+    dropped: int = 0
+    late: int = 0
+    login_ms: float = 0.0
+    total: ActionResult = field(default_factory=lambda: ActionResult("total"))
+    actions: list[ActionResult] = field(default_factory=list)
+    errors: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        """Completed requests per second."""
+        return self.total.requests / self.duration_s if self.duration_s else 0.0
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """
+    Read a mix name or `action=weight,...` list.
+
+    Args:
+        mix (str): A key of USER_MIXES, or e.g. "rankings=3,submit_ballot=1".
+
+    Returns:
+        dict[str, float]: Action name to weight.
+
+    Raises:
+        ValueError: If the mix or one of its actions is unknown.
+    """
+    if mix in USER_MIXES:
+        return USER_MIXES[mix]
+    weights = {}
+    for part in mix.split(","):
+        action, _, weight = part.partition("=")
+        action = action.strip()
+        if action not in ACTIONS:
+            raise ValueError(f"unknown action {action!r}, expected one of {', '.join(ACTIONS)} "
+                             f"or a mix of {', '.join(USER_MIXES)}")
+        weights[action] = float(weight or 1)
+    return weights
+
+
+def _summarise(action: str, timings: list[float], errors: int) -> ActionResult:
+    result = ActionResult(action, len(timings), errors)
+    if timings:
+        result.p50_ms, result.p95_ms, result.p99_ms = (
+            round(float(value), 1) for value in np.percentile(timings, [50, 95, 99]))
+        result.max_ms = round(max(timings), 1)
+    return result
+
+
+async def run_load_test(db, mix: dict[str, float], rps: float = 20.0, duration: float = 30.0, users: int = 50,
+                        max_in_flight: int = 200, seed: int = 1, sqlite_path: str = "loadtest.db",
+                        discord_latency: float = 0.05) -> LoadTestResult:
+    """
+    Run a mix against a database.
+
+    Args:
+        db (mmrDB): The database to swap into `db_holder`.
+        mix (dict[str, float]): Action name to weight.
+        rps (float): Requests started per second.
+        duration (float): Seconds to keep starting requests.
+        users (int): Virtual users the requests are spread over, each with their own session.
+        max_in_flight (int): Requests running at once before further starts are dropped.
+        seed (int): Seed of the action and parameter choices.
+        sqlite_path (str): The SQLite file standing in for SQL Server.
+        discord_latency (float): Seconds one fake Discord request takes.
+
+    Returns:
+        LoadTestResult: The figures of the run.
+    """
+    import httpx
+
+    from website.api import app
+    from website.resources import db_holder
+    from website.stand_ins import install
+
+    install(sqlite_path, discord_latency)
+    db_holder.load(lambda: db)
+
+    rng = random.Random(seed)
+    actions = list(mix)
+    weights = [mix[action] for action in actions]
+    result = LoadTestResult(mix=mix, target_rps=rps)
+    timings: dict[str, list[float]] = {action: [] for action in actions}
+    errors: dict[str, int] = {action: 0 for action in actions}
+
+    transport = httpx.ASGITransport(app=app)
+    clients = [httpx.AsyncClient(transport=transport, base_url="http://loadtest") for _ in range(users)]
+    try:
+        # Log every virtual user in, as fan hub elite members
+        logins = []
+        for i, client in enumerate(clients):
+            start = time.perf_counter()
+            response = await client.get(f"/discord/callback?code=loaduser{i}:elite")
+            logins.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400 or not client.cookies:
+                raise RuntimeError(f"login of loaduser{i} failed with status {response.status_code}")
+        result.login_ms = round(float(np.median(logins)), 1)
+
+        async def request(action: str, client: httpx.AsyncClient, method: str, url: str, data: Optional[dict]):
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, data=data)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            timings[action].append((time.perf_counter() - start) * 1000)
+            if not isinstance(status, int) or status >= 400:
+                errors[action] += 1
+                key = f"{action} {status}"
+                result.errors[key] = result.errors.get(key, 0) + 1
+
+        tasks: set[asyncio.Task] = set()
+        result.scheduled = int(rps * duration)
+        begin = time.perf_counter()
+        for i in range(result.scheduled):
+            delay = begin + i / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -0.01:
+                result.late += 1
+            if len(tasks) >= max_in_flight:
+                result.dropped += 1
+                continue
+            action = rng.choices(actions, weights)[0]
+            task = asyncio.create_task(request(action, rng.choice(clients), *ACTIONS[action](db, rng)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+        result.duration_s = round(time.perf_counter() - begin, 2)
+    finally:
+        for client in clients:
+            await client.aclose()
+
+    result.actions = [_summarise(action, timings[action], errors[action]) for action in actions]
+    result.total = _summarise("total", [t for action in actions for t in timings[action]], sum(errors.values()))
+    return result
+
+
+def format_result(result: LoadTestResult) -> str:
+    """
+    Render a run as text.
+
+    Args:
+        result (LoadTestResult): The run.
+
+    Returns:
+        str: Summary lines and a table with a row per action.
+    """
+    lines = [
+        f"target {result.target_rps:g} rps, achieved {result.throughput:.1f} rps over {result.duration_s:g} s",
+        f"scheduled {result.scheduled}, completed {result.total.requests}, errors {result.total.errors}, "
+        f"dropped {result.dropped}, late starts {result.late}, login p50 {result.login_ms:g} ms",
+        "",
+        f"{'action':<14} {'requests':>8} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}",
+    ]
+    for row in [*result.actions, result.total]:
+        lines.append(f"{row.action:<14} {row.requests:>8} {row.errors:>6} {row.p50_ms:>9.1f} {row.p95_ms:>9.1f} "
+                     f"{row.p99_ms:>9.1f} {row.max_ms:>9.1f}")
+    for key, count in sorted(result.errors.items()):
+        lines.append(f"error {key}: {count}")
+    return "\n".join(lines)
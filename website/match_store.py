@@ -0,0 +1,278 @@
+"""
+match_store.py
+
+This module holds the match history in a columnar store so pages can filter and page through it
+without converting every match to JSON.
+
+The store is built once per database load. Matches stay in chronological order, one entry per
+match in the match columns, and the participants of all matches are stored back to back in the
+participant columns, with `offsets` marking where each match starts. Filtering is done with
+vectorized masks over those arrays and only the rows of the requested page are converted to dicts.
+
+MMR changes:
+    The change of a participant is the difference between their MMR in the rank history entry
+    of the match date and in their previous entry. It is NaN when the contestant has no rank
+    history entry for that date. The rank history has one entry per day, so this is a daily
+    change: every match of a contestant on one day carries the same value, and pages label it so.
+
+Classes:
+    - MatchStore: Columnar match history with filtering and pagination.
+
+Dependencies:
+    - numpy
+    - Local modules: website.util
+"""
+import datetime
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+from website.util import day_number, wrestler_histories
+
+# Rank history keys in the order they are used for the MMR change
+MMR_KEYS = ("total_mmr", "solo_mmr", "duos_mmr", "trios_mmr")
+
+
+@dataclass
+class MatchStore:
+    """
+    Columnar match history.
+
+    Attributes:
+        names (list[str]): Contestant names, indexed by `participant`.
+        name_index (dict[str, int]): Contestant name to index.
+        divisions (list[str]): Division abbreviations, indexed by `contestant_division`.
+        events (list[str]): Event names, indexed by `event`.
+        titles (list[str]): Title names, indexed by `title`.
+        contestant_division (np.ndarray): Division of each contestant (int16), -1 if unknown.
+        day (np.ndarray): Match date as days since 0001-01-01 (int32).
+        event (np.ndarray): Index of the event (int32).
+        title (np.ndarray): Index of the title defended, -1 if none (int32).
+        draw (np.ndarray): 1 if the match was a draw (int8).
+        offsets (np.ndarray): Start of each match in the participant columns, plus the total at the end (int64).
+        participant (np.ndarray): Index of the contestant (int32).
+        winner (np.ndarray): True for the winning side (bool).
+        mmr_change (np.ndarray): MMR change of the participant on the match date (float32).
+        participant_match (np.ndarray): Index of the match of each participant (int32).
+        build_seconds (float): Time it took to build the store.
+    """
+    names: list[str]
+    name_index: dict[str, int]
+    divisions: list[str]
+    events: list[str]
+    titles: list[str]
+    contestant_division: np.ndarray
+    day: np.ndarray
+    event: np.ndarray
+    title: np.ndarray
+    draw: np.ndarray
+    offsets: np.ndarray
+    participant: np.ndarray
+    winner: np.ndarray
+    mmr_change: np.ndarray
+    participant_match: np.ndarray
+    build_seconds: float = 0.0
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    @classmethod
+    def from_db(cls, db, wrestlers: Optional[dict[str, dict]] = None) -> "MatchStore":
+        """
+        Build the store from a loaded database.
+
+        Args:
+            db (mmrDB): The database.
+            wrestlers (Optional[dict[str, dict]]): `wrestler_histories(db)`, computed if not given.
+
+        Returns:
+            MatchStore: The columnar match history.
+        """
+        start = time.perf_counter()
+        names: list[str] = []
+        name_index: dict[str, int] = {}
+        divisions: list[str] = []
+        contestant_division: list[int] = []
+        changes: dict[tuple[str, int], float] = {}
+        if wrestlers is None:
+            wrestlers = wrestler_histories(db)
+
+        def contestant_id(contestant, division: int = -1) -> int:
+            name = str(contestant)
+            if name not in name_index:
+                name_index[name] = len(names)
+                names.append(name)
+                contestant_division.append(division)
+            return name_index[name]
+
+        for division in db.divisions:
+            divisions.append(division.abr)
+            for contestant in division.contestants:
+                contestant_id(contestant, len(divisions) - 1)
+        for name, data in wrestlers.items():
+            changes.update(_mmr_changes(name, data.get("rank_history", {})))
+
+        events: list[str] = []
+        event_index: dict[str, int] = {}
+        titles: list[str] = []
+        title_index: dict[str, int] = {}
+
+        day, event, title, draw, offsets = [], [], [], [], [0]
+        participant, winner, mmr_change = [], [], []
+        for match in db.matches:
+            match_day = match.date.toordinal()
+            day.append(match_day)
+
+            event_name = str(match.event)
+            if event_name not in event_index:
+                event_index[event_name] = len(events)
+                events.append(event_name)
+            event.append(event_index[event_name])
+
+            title_name = getattr(match.title, "name", match.title)
+            if not title_name:
+                title.append(-1)
+            else:
+                if title_name not in title_index:
+                    title_index[title_name] = len(titles)
+                    titles.append(title_name)
+                title.append(title_index[title_name])
+
+            draw.append(int(bool(match.draw)))
+            for side, contestants in ((True, match.winners), (False, match.losers)):
+                for contestant in contestants:
+                    participant.append(contestant_id(contestant))
+                    winner.append(side)
+                    mmr_change.append(changes.get((str(contestant), match_day), math.nan))
+            offsets.append(len(participant))
+
+        offsets = np.array(offsets, dtype=np.int64)
+        return cls(
+            names=names,
+            name_index=name_index,
+            divisions=divisions,
+            events=events,
+            titles=titles,
+            contestant_division=np.array(contestant_division, dtype=np.int16),
+            day=np.array(day, dtype=np.int32),
+            event=np.array(event, dtype=np.int32),
+            title=np.array(title, dtype=np.int32),
+            draw=np.array(draw, dtype=np.int8),
+            offsets=offsets,
+            participant=np.array(participant, dtype=np.int32),
+            winner=np.array(winner, dtype=bool),
+            mmr_change=np.array(mmr_change, dtype=np.float32),
+            participant_match=np.repeat(np.arange(len(day), dtype=np.int32), np.diff(offsets)),
+            build_seconds=time.perf_counter() - start,
+        )
+
+    def filter(self, start: Optional[datetime.date] = None, end: Optional[datetime.date] = None,
+               contestant: Optional[str] = None, division: Optional[str] = None, title: Optional[str] = None,
+               search: Optional[str] = None) -> np.ndarray:
+        """
+        Find the matches that pass every given filter.
+
+        Args:
+            start (Optional[date]): First date to include.
+            end (Optional[date]): Last date to include.
+            contestant (Optional[str]): Only matches of this contestant.
+            division (Optional[str]): Only matches with a contestant of this division.
+            title (Optional[str]): Only matches for this title.
+            search (Optional[str]): Case-insensitive text the event or a participant name must contain.
+
+        Returns:
+            np.ndarray: Indices of the matching matches in chronological order.
+        """
+        # Matches are in chronological order, the date range is a slice
+        low = int(np.searchsorted(self.day, start.toordinal(), "left")) if start else 0
+        high = int(np.searchsorted(self.day, end.toordinal(), "right")) if end else len(self)
+        mask = np.zeros(len(self), dtype=bool)
+        mask[low:high] = True
+
+        if contestant is not None:
+            mask &= self._with_participants(np.array([self.name_index.get(contestant, -1)]))
+        if division is not None:
+            ids = np.flatnonzero(self.contestant_division == (self.divisions.index(division)
+                                                              if division in self.divisions else -2))
+            mask &= self._with_participants(ids)
+        if title is not None:
+            mask &= self.title == (self.titles.index(title) if title in self.titles else -2)
+        if search:
+            search = search.lower()
+            events = np.array([i for i, name in enumerate(self.events) if search in name.lower()], dtype=np.int32)
+            ids = np.array([i for i, name in enumerate(self.names) if search in name.lower()], dtype=np.int32)
+            mask &= np.isin(self.event, events) | self._with_participants(ids)
+        return np.flatnonzero(mask)
+
+    def page(self, indices: np.ndarray, offset: int = 0, limit: int = 50, newest_first: bool = True,
+             contestant: Optional[str] = None) -> list[dict[str, Any]]:
+        """
+        Convert one page of matches to dicts.
+
+        Args:
+            indices (np.ndarray): Match indices from `filter`.
+            offset (int, optional): Rows to skip. Defaults to 0.
+            limit (int, optional): Maximum number of rows. Defaults to 50.
+            newest_first (bool, optional): Page through the matches newest first. Defaults to True.
+            contestant (Optional[str]): Add a `result` and `mmr_change` from this contestant's perspective.
+
+        Returns:
+            list[dict[str, Any]]: date, event, title, draw, winners and losers with their MMR change per row.
+        """
+        if newest_first:
+            indices = indices[::-1]
+        contestant_id = self.name_index.get(contestant)
+
+        rows = []
+        for match in indices[offset:offset + limit].tolist():
+            sides = {True: [], False: []}
+            row = {
+                "date": datetime.date.fromordinal(int(self.day[match])).isoformat(),
+                "event": self.events[self.event[match]],
+                "title": self.titles[self.title[match]] if self.title[match] >= 0 else "",
+                "draw": bool(self.draw[match]),
+            }
+            for i in range(self.offsets[match], self.offsets[match + 1]):
+                change = float(self.mmr_change[i])
+                change = None if math.isnan(change) else round(change, 1)
+                sides[bool(self.winner[i])].append({"name": self.names[self.participant[i]], "mmr_change": change})
+                if self.participant[i] == contestant_id:
+                    row["result"] = "Draw" if row["draw"] else "Win" if self.winner[i] else "Loss"
+                    row["mmr_change"] = change
+            row["winners"], row["losers"] = sides[True], sides[False]
+            rows.append(row)
+        return rows
+
+    def _with_participants(self, ids: np.ndarray) -> np.ndarray:
+        """Mask of the matches that have any of the given contestants."""
+        mask = np.zeros(len(self), dtype=bool)
+        if len(ids):
+            mask[self.participant_match[np.isin(self.participant, ids)]] = True
+        return mask
+
+
+def _mmr_changes(name: str, rank_history: dict) -> dict[tuple[str, int], float]:
+    """
+    MMR change of a contestant per rank history date.
+
+    Args:
+        name (str): The contestant name.
+        rank_history (dict): Date to {"event", "<key>_mmr": {"rank", "mmr", "division"}}.
+
+    Returns:
+        dict[tuple[str, int], float]: (name, day) to the change since the previous entry with the same MMR key.
+    """
+    changes = {}
+    previous: dict[str, float] = {}
+    for date_key, entry in sorted(rank_history.items(), key=lambda item: day_number(item[0])):
+        for key in MMR_KEYS:
+            if entry.get(key):
+                mmr = float(entry[key]["mmr"])
+                if key in previous:
+                    changes[(name, day_number(date_key))] = mmr - previous[key]
+                previous[key] = mmr
+                break
+    return changes
@@ -0,0 +1,284 @@
+"""
+memory.py
+
+This module reports the memory of the worker: the process RSS, the deep size of the structures
+behind the database and the caches, and the top allocators seen by tracemalloc. Snapshots of
+all three can be taken and diffed, to see what grows across /admin/reload, with the number of
+sessions or with the caches.
+
+Deep sizes:
+    The size of an object and everything reachable from it, by `sys.getsizeof` of every object
+    found through `gc.get_referents`. Types, modules, functions and code objects are shared and
+    not followed. The entries of structures that are lists (matches, titles, contestants,
+    divisions) are boundaries: reaching the entry of another structure stops there, so a match
+    does not include the contestants it references nor a division its contestants. Other shared
+    objects are counted for the first structure they are reachable from, so the rows add up
+    without double counting.
+
+tracemalloc:
+    Only allocations made while tracing are seen, so tracing starts with the first snapshot
+    (or at startup with PYTHONTRACEMALLOC=1) and costs memory and CPU until it is stopped.
+
+Classes:
+    - StructureSize: Deep size of one structure.
+    - MemorySnapshot: A stored snapshot.
+    - SnapshotStore: The most recent snapshots.
+
+Functions:
+    - deep_size: Deep size of an object.
+    - measure: Deep sizes of structures, with shared objects counted once.
+    - top_allocators: Largest allocation sites of the current tracemalloc trace.
+    - take_snapshot: Measure the process and store a snapshot.
+    - diff: Compare two snapshots.
+    - stop_tracing: Stop tracemalloc.
+
+Environment Variables:
+    - MEMORY_SNAPSHOTS: Snapshots kept, defaults to 5.
+    - TRACEMALLOC_FRAMES: Frames stored per allocation, defaults to 1.
+
+Global Variables:
+    - snapshots: The SnapshotStore of this process.
+
+Dependencies:
+    - Local modules: website.prefork
+"""
+import collections
+import gc
+import itertools
+import os
+import sys
+import time
+import tracemalloc
+import types
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from website.prefork import worker_memory
+
+MEMORY_SNAPSHOTS = int(os.environ.get("MEMORY_SNAPSHOTS", "5"))
+TRACEMALLOC_FRAMES = int(os.environ.get("TRACEMALLOC_FRAMES", "1"))
+# Shared by everything that uses them, never part of a structure
+_NOT_FOLLOWED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.CodeType,
+                 types.FrameType)
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+@dataclass
+class StructureSize:
+    """
+    Deep size of one structure.
+
+    Attributes:
+        name (str): The structure.
+        kib (float): Size of the objects counted for it.
+        objects (int): Number of objects counted for it.
+        items (Optional[int]): Number of entries (matches, sessions...) if it has any.
+    """
+    name: str
+    kib: float
+    objects: int
+    items: Optional[int] = None
+
+    @property
+    def per_item_kib(self) -> Optional[float]:
+        """Size per entry."""
+        return round(self.kib / self.items, 3) if self.items else None
+
+
+@dataclass
+class MemorySnapshot:
+    """
+    A stored snapshot.
+
+    Attributes:
+        id (int): Sequence number, used in the diff URL.
+        time (str): When it was taken.
+        generation (int): Database generation at the time, changes with every reload.
+        memory (dict[str, int]): RSS and the other figures of `worker_memory`, in KiB.
+        structures (list[StructureSize]): Deep sizes.
+        types (collections.Counter): Type name to number of objects tracked by the garbage collector.
+        trace (Optional[tracemalloc.Snapshot]): The tracemalloc snapshot.
+    """
+    id: int
+    time: str
+    generation: int
+    memory: dict[str, int]
+    structures: list[StructureSize]
+    types: collections.Counter = field(repr=False)
+    trace: Optional[tracemalloc.Snapshot] = field(default=None, repr=False)
+
+
+class SnapshotStore:
+    """
+    The most recent snapshots.
+    """
+
+    def __init__(self, size: int = MEMORY_SNAPSHOTS):
+        self._snapshots: collections.deque = collections.deque(maxlen=size)
+        self._ids = itertools.count(1)
+
+    def add(self, **kwargs) -> MemorySnapshot:
+        snapshot = MemorySnapshot(id=next(self._ids), **kwargs)
+        self._snapshots.append(snapshot)
+        return snapshot
+
+    def get(self, snapshot_id: int) -> Optional[MemorySnapshot]:
+        return next((snapshot for snapshot in self._snapshots if snapshot.id == snapshot_id), None)
+
+    def list(self) -> list[MemorySnapshot]:
+        """
+        The stored snapshots, newest first.
+
+        Returns:
+            list[MemorySnapshot]: The snapshots.
+        """
+        return list(reversed(self._snapshots))
+
+    def clear(self):
+        self._snapshots.clear()
+
+
+snapshots = SnapshotStore()
+
+
+def deep_size(obj: Any, seen: Optional[set[int]] = None, stop: frozenset[int] = frozenset()) -> tuple[int, int]:
+    """
+    Deep size of an object.
+
+    Args:
+        obj (Any): The object.
+        seen (Optional[set[int]]): Ids of objects already counted, updated with the ones counted now.
+        stop (frozenset[int]): Ids of objects that are not counted or followed.
+
+    Returns:
+        tuple[int, int]: Bytes and number of objects not in `seen` before.
+    """
+    seen = set() if seen is None else seen
+    size = count = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or id(item) in stop or isinstance(item, _NOT_FOLLOWED):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        count += 1
+        stack.extend(gc.get_referents(item))
+    return size, count
+
+
+def measure(structures: list[tuple[str, Any, Optional[int]]]) -> list[StructureSize]:
+    """
+    Deep sizes of structures, with shared objects counted once.
+
+    Args:
+        structures (list[tuple[str, Any, Optional[int]]]): Name, object and number of entries, in
+            the order shared objects are attributed.
+
+    Returns:
+        list[StructureSize]: A size per structure, in the same order.
+    """
+    entries = {name: frozenset(map(id, obj)) for name, obj, _ in structures if isinstance(obj, list)}
+    boundaries = frozenset().union(*entries.values())
+    seen: set[int] = set()
+    sizes = []
+    for name, obj, items in structures:
+        size, count = deep_size(obj, seen, boundaries - entries.get(name, frozenset()))
+        sizes.append(StructureSize(name, round(size / 1024, 1), count, items))
+    return sizes
+
+
+def top_allocators(limit: int = 25) -> list[dict[str, Any]]:
+    """
+    Largest allocation sites of the current tracemalloc trace.
+
+    Args:
+        limit (int): Sites returned.
+
+    Returns:
+        list[dict[str, Any]]: Site, KiB and blocks still allocated, empty if not tracing.
+    """
+    if not tracemalloc.is_tracing():
+        return []
+    trace = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+    return [{"site": _site(stat.traceback), "kib": round(stat.size / 1024, 1), "blocks": stat.count}
+            for stat in trace.statistics("lineno")[:limit]]
+
+
+def take_snapshot(structures: list[tuple[str, Any, Optional[int]]], generation: int) -> MemorySnapshot:
+    """
+    Measure the process and store a snapshot, starting tracemalloc if it is not running.
+
+    Args:
+        structures (list[tuple[str, Any, Optional[int]]]): The structures, see `measure`.
+        generation (int): The database generation.
+
+    Returns:
+        MemorySnapshot: The stored snapshot.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    gc.collect()
+    sizes = measure(structures)
+    type_counts = collections.Counter(type(obj).__name__ for obj in gc.get_objects())
+    trace = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+    return snapshots.add(time=time.strftime("%Y-%m-%d %H:%M:%S"), generation=generation, memory=worker_memory(),
+                         structures=sizes, types=type_counts, trace=trace)
+
+
+def diff(first: MemorySnapshot, second: MemorySnapshot, limit: int = 25) -> dict[str, list[dict[str, Any]]]:
+    """
+    Compare two snapshots.
+
+    Args:
+        first (MemorySnapshot): The older snapshot.
+        second (MemorySnapshot): The newer snapshot.
+        limit (int): Rows per table, the largest changes.
+
+    Returns:
+        dict[str, list[dict[str, Any]]]: Tables of the changes in memory, structures, object types
+            and allocation sites, by absolute change.
+    """
+    memory = [{"field": key, "before_kib": first.memory.get(key, 0), "after_kib": second.memory.get(key, 0),
+               "change_kib": second.memory.get(key, 0) - first.memory.get(key, 0)}
+              for key in dict.fromkeys([*first.memory, *second.memory])]
+
+    before = {size.name: size for size in first.structures}
+    structures = []
+    for size in second.structures:
+        old = before.get(size.name, StructureSize(size.name, 0.0, 0))
+        structures.append({"structure": size.name, "before_kib": old.kib, "after_kib": size.kib,
+                           "change_kib": round(size.kib - old.kib, 1), "change_objects": size.objects - old.objects,
+                           "change_items": (size.items or 0) - (old.items or 0)})
+
+    type_changes = second.types.copy()
+    type_changes.subtract(first.types)
+    object_types = [{"type": name, "before": first.types[name], "after": second.types[name], "change": change}
+                    for name, change in sorted(type_changes.items(), key=lambda item: -abs(item[1]))[:limit]
+                    if change]
+
+    allocators = []
+    if first.trace is not None and second.trace is not None:
+        allocators = [{"site": _site(stat.traceback), "change_kib": round(stat.size_diff / 1024, 1),
+                       "kib": round(stat.size / 1024, 1), "change_blocks": stat.count_diff, "blocks": stat.count}
+                      for stat in second.trace.compare_to(first.trace, "lineno")[:limit] if stat.size_diff]
+
+    return {"memory": memory, "structures": structures, "types": object_types, "allocators": allocators}
+
+
+def stop_tracing():
+    """
+    Stop tracemalloc and drop the stored snapshots, whose traces can no longer be compared.
+    """
+    tracemalloc.stop()
+    snapshots.clear()
+
+
+def _site(traceback: tracemalloc.Traceback) -> str:
+    frame = traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
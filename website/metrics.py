@@ -0,0 +1,294 @@
+"""
+metrics.py
+
+This module keeps in-process metrics and renders them in the Prometheus text format.
+
+Metrics are plain counters, gauges and histograms in a registry. Recording is a dict lookup and
+an increment (plus a bisect for histograms), so it can run on every request. Values that already
+live elsewhere (session counters, cache statistics, limiter queues) are read by collectors when
+/metrics is scraped instead of being mirrored on every change.
+
+Every worker process has its own registry, scrape each worker or aggregate with the usual
+Prometheus tooling.
+
+Classes:
+    - Counter: Monotonic counter with labels.
+    - Gauge: Value that goes up and down, with labels.
+    - Histogram: Cumulative bucket counts, sum and count, with labels.
+    - Registry: Metrics and collectors rendered together.
+    - MetricsMiddleware: ASGI middleware recording latency, status counts and in-flight requests.
+
+Functions:
+    - instrument: Record the duration and failures of the public methods of a class.
+
+Global Variables:
+    - registry: The registry of this process.
+    - requests_total, request_seconds, requests_in_flight: Request metrics of MetricsMiddleware.
+    - compute_seconds: Duration of expensive computations (graphs, stats queries), by group.
+    - sql_seconds, sql_errors_total: Duration and failures of SQL Server operations, by method.
+    - sql_connections_open: SQL Server connections opened and not yet closed.
+
+Dependencies:
+    - starlette (only for typing the ASGI interface)
+"""
+import bisect
+import functools
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (name, type, help, [(labels, value)]) as returned by collectors
+Family = tuple[str, str, str, list[tuple[dict[str, str], float]]]
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _label_text(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{label}="{_escape(str(value))}"' for label, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", *self._samples()]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    Monotonic counter with labels.
+    """
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down, with labels.
+    """
+    type = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    """
+    Cumulative bucket counts, sum and count, with labels.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (last is +Inf), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def count(self, *label_values) -> int:
+        entry = self._values.get(label_values)
+        return sum(entry[0]) if entry else 0
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = 'le="{}"'.format(bound if bound == "+Inf" else _number(bound))
+                lines.append(f"{self.name}_bucket{self._label_text(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Metrics and collectors rendered together.
+    """
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]):
+        """
+        Add a function that is called on every scrape.
+
+        Args:
+            collector (Callable[[], Iterable[Family]]): Returns (name, type, help, [(labels, value)]) families.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text format.
+
+        Returns:
+            str: The exposition, ending with a newline.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, metric_type, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    label_text = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+                    label_text = "{" + label_text + "}" if label_text else ""
+                    lines.append(f"{name}{label_text} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+requests_total = registry.register(Counter(
+    "http_requests_total", "Requests by method, route and status.", ("method", "route", "status")))
+request_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency until the response is sent, by method and route.",
+    ("method", "route")))
+requests_in_flight = registry.register(Gauge("http_requests_in_flight", "Requests being handled."))
+compute_seconds = registry.register(Histogram(
+    "compute_duration_seconds", "Duration of expensive computations in the thread pool, by group.", ("group",),
+    (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)))
+sql_seconds = registry.register(Histogram(
+    "sql_duration_seconds", "Duration of SQL Server operations, including connecting, by operation.", ("operation",)))
+sql_errors_total = registry.register(Counter(
+    "sql_errors_total", "Failed SQL Server operations by operation.", ("operation",)))
+sql_connections_open = registry.register(Gauge(
+    "sql_connections_open", "SQL Server connections opened and not yet closed."))
+
+
+def instrument(cls: type, histogram: Histogram, errors: Optional[Counter] = None,
+               names: Optional[dict[str, str]] = None):
+    """
+    Record the duration and failures of the public methods of a class, labeled with the method name.
+
+    Only methods defined on the class itself are patched, inherited ones are patched with their class.
+
+    Args:
+        cls (type): The class, patched in place.
+        histogram (Histogram): Histogram with one label, the operation.
+        errors (Optional[Counter]): Counter with one label, incremented when a method raises.
+        names (Optional[dict[str, str]]): Operation names of private methods to record as well,
+            e.g. {"__init__": "connect"}.
+    """
+    names = names or {}
+    for attribute, value in list(vars(cls).items()):
+        operation = names.get(attribute, None if attribute.startswith("_") else attribute)
+        if operation is None or not callable(value) or hasattr(value, "_metrics_operation"):
+            continue
+        setattr(cls, attribute, _recorded(value, operation, histogram, errors))
+
+
+def _recorded(function: Callable, operation: str, histogram: Histogram, errors: Optional[Counter]) -> Callable:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            if errors is not None:
+                errors.inc(operation)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start, operation)
+
+    wrapper._metrics_operation = operation
+    return wrapper
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status counts and in-flight requests.
+
+    Requests are labeled with the route template (e.g. /wrestlers/{name:path}), not the path, so the
+    number of series stays bounded. Requests that match no route are labeled "unmatched".
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            requests_in_flight.dec()
+            route = _route(scope)
+            requests_total.inc(scope["method"], route, str(status))
+            request_seconds.observe(time.perf_counter() - start, scope["method"], route)
+
+
+def _route(scope: Scope) -> str:
+    """Route template the router matched, set in the scope by FastAPI."""
+    route = scope.get("route")
+    path: Optional[str] = getattr(route, "path", None)
+    if path is not None:
+        return path
+    if scope.get("root_path", "").endswith("/static") or scope["path"].startswith("/static/"):
+        return "/static"
+    return "unmatched"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,408 @@
+"""
+prefork.py
+
+This module serves the website from several worker processes that share one loaded database.
+
+The master loads the database and imports the app once, moves every object that exists at that
+point into the permanent GC generation with `gc.freeze()`, binds the listening socket and forks
+the workers. The workers inherit the database through copy-on-write pages. Freezing matters
+because a GC pass writes to the header of every object it visits, which would copy most of the
+database into every worker the first time the collector ran.
+
+Per-worker memory overhead:
+    Use `measure_overhead` (python serve.py --measure) to see it on the real database. It forks
+    workers that read through the database and reports, per worker, the private dirty memory
+    (copied pages only this worker owns) and the shared memory still backed by the master.
+    `gc.freeze()` stops the collector from dirtying pages, reference count updates still copy the
+    pages of objects a worker actually reads, so the overhead grows with how much of the database
+    each worker touches rather than with its total size.
+
+Reloading:
+    /admin/reload calls `request_reload`, which sends SIGHUP to the master. The master rebuilds the
+    database while the workers keep serving the old one, then replaces the workers one at a time,
+    so every worker serves the new database and shares it with the master again.
+
+Restarts:
+    A worker that exits is restarted. Workers that die right after starting, e.g. on a broken
+    deployment, are restarted with an exponential backoff, and the master gives up after
+    `RestartPolicy.max_quick_exits` such deaths in a row instead of forking in a tight loop.
+
+Caveats:
+    - Linux/macOS only, workers are created with os.fork.
+    - State created after the fork is per worker: sessions are per worker and lost when a worker is
+      replaced unless SESSION_BACKEND=sqlite or SESSION_MODE=signed, and /admin/reload/status shows
+      the build of the worker that handled the request, not the one running in the master.
+
+Classes:
+    - RestartPolicy: Decides how long to wait before restarting a worker that exited.
+
+Functions:
+    - serve: Load the database, fork the workers and supervise them.
+    - request_reload: Ask the master to rebuild the database and replace the workers.
+    - worker_memory: Memory breakdown of a process from /proc/<pid>/smaps_rollup.
+    - read_database: Touch the parts of a database the routes read.
+    - measure_overhead: Fork workers that read the database and report their memory.
+"""
+import gc
+import json
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Callable, Optional
+
+_MEMORY_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+# Set in the workers to the pid of the master, and the signal that asks it for a reload
+MASTER_PID_VARIABLE = "PREFORK_MASTER_PID"
+RELOAD_SIGNAL = signal.SIGHUP
+# Seconds between checks for exited workers, and given to a replaced worker to finish its requests
+SUPERVISE_INTERVAL = 0.2
+STOP_TIMEOUT = 30.0
+
+
+class RestartPolicy:
+    """
+    Decides how long to wait before restarting a worker that exited.
+
+    A worker that exits less than `quick_exit` seconds after it started counts as a quick exit.
+    Each quick exit in a row doubles the delay, starting at `base_delay` and capped at `max_delay`,
+    and the `max_quick_exits`-th one in a row gives up. A worker that ran longer resets the count
+    and is restarted at once.
+
+    Attributes:
+        quick_exits (int): Quick exits in a row so far.
+    """
+
+    def __init__(self, quick_exit: float = 5.0, base_delay: float = 0.5, max_delay: float = 30.0,
+                 max_quick_exits: int = 5):
+        """
+        Args:
+            quick_exit (float, optional): Lifetime in seconds below which an exit counts as quick. Defaults to 5.
+            base_delay (float, optional): Delay after the first quick exit. Defaults to 0.5.
+            max_delay (float, optional): Longest delay. Defaults to 30.
+            max_quick_exits (int, optional): Quick exits in a row after which to give up. Defaults to 5.
+        """
+        self.quick_exit = quick_exit
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_quick_exits = max_quick_exits
+        self.quick_exits = 0
+
+    def delay(self, lifetime: float) -> Optional[float]:
+        """
+        Record a worker exit.
+
+        Args:
+            lifetime (float): Seconds the worker ran.
+
+        Returns:
+            Optional[float]: Seconds to wait before restarting it, None to give up.
+        """
+        if lifetime >= self.quick_exit:
+            self.quick_exits = 0
+            return 0.0
+        self.quick_exits += 1
+        if self.quick_exits >= self.max_quick_exits:
+            return None
+        return min(self.base_delay * 2 ** (self.quick_exits - 1), self.max_delay)
+
+
+def request_reload() -> bool:
+    """
+    Ask the prefork master to rebuild the database and replace the workers.
+
+    Returns:
+        bool: True if this process is a worker of `serve` and the master was signalled, False if the
+            server runs in a single process and should reload itself.
+    """
+    master = os.environ.get(MASTER_PID_VARIABLE)
+    if not master or int(master) != os.getppid():
+        return False
+    os.kill(int(master), RELOAD_SIGNAL)
+    return True
+
+
+def worker_memory(pid: Optional[int] = None) -> dict[str, int]:
+    """
+    Memory breakdown of a process in KiB, read from /proc/<pid>/smaps_rollup.
+
+    Args:
+        pid (Optional[int]): The process, defaults to the current one.
+
+    Returns:
+        dict[str, int]: Rss, Pss, shared and private clean/dirty sizes, empty if unavailable.
+    """
+    path = f"/proc/{pid or 'self'}/smaps_rollup"
+    memory = {}
+    try:
+        with open(path) as file:
+            for line in file:
+                key, _, value = line.partition(":")
+                if key in _MEMORY_FIELDS:
+                    memory[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return memory
+
+
+def _prepare_master():
+    """
+    Load the database and import the app in the master, then freeze the heap.
+    """
+    from website.resources import load_db, db_holder
+    if not db_holder.ready:
+        load_db()
+
+    from website.api import app
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def _rebuild_master() -> bool:
+    """
+    Rebuild the database in the master for a reload, then freeze the heap again.
+
+    Returns:
+        bool: True if the new database was swapped in.
+    """
+    from website.resources import db_holder
+    gc.unfreeze()
+    try:
+        db_holder.load()
+        return True
+    except Exception:
+        return False
+    finally:
+        gc.collect()
+        gc.freeze()
+
+
+def _stop_worker(pid: int, timeout: float = STOP_TIMEOUT):
+    """
+    Send SIGTERM to a worker and wait for it to exit, killing it after `timeout` seconds.
+    """
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if os.waitpid(pid, os.WNOHANG)[0]:
+                return
+        except ChildProcessError:
+            return
+        if time.monotonic() > deadline:
+            logging.warning("Worker %d did not stop in %.0fs, killing it", pid, timeout)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            return
+        time.sleep(SUPERVISE_INTERVAL)
+
+
+def serve(host: str = "0.0.0.0", port: int = 8000, workers: Optional[int] = None, log_level: str = "info",
+          restart_policy: Optional[RestartPolicy] = None):
+    """
+    Load the database once, fork `workers` uvicorn workers on a shared socket and supervise them.
+
+    Workers that exit unexpectedly are restarted according to `restart_policy`. SIGINT and SIGTERM
+    are forwarded to the workers, SIGHUP rebuilds the database and replaces the workers one at a time.
+
+    Args:
+        host (str, optional): Address to bind. Defaults to "0.0.0.0".
+        port (int, optional): Port to bind. Defaults to 8000.
+        workers (Optional[int]): Number of workers, defaults to the CPU count.
+        log_level (str, optional): Uvicorn log level. Defaults to "info".
+        restart_policy (Optional[RestartPolicy]): Backoff for restarting workers, defaults to `RestartPolicy()`.
+
+    Raises:
+        RuntimeError: If workers kept exiting right after starting and the master gave up.
+    """
+    import uvicorn
+
+    workers = workers or os.cpu_count() or 1
+    restart_policy = restart_policy or RestartPolicy()
+    app = _prepare_master()
+    os.environ[MASTER_PID_VARIABLE] = str(os.getpid())
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Worker pid to the time it started
+    children: dict[int, float] = {}
+
+    def start_worker():
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGINT, signal.SIGTERM, RELOAD_SIGNAL):
+                signal.signal(signum, signal.SIG_DFL)
+            server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan="on"))
+            try:
+                server.run(sockets=[sock])
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+
+    for _ in range(workers):
+        start_worker()
+    logging.warning("Serving on %s:%d with %d workers (master pid %d)", host, port, workers, os.getpid())
+
+    stopping = False
+    gave_up = False
+    reload_requested = False
+    # Times at which to start a worker in place of one that exited
+    restarts: list[float] = []
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def request(signum, frame):
+        nonlocal reload_requested
+        reload_requested = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(RELOAD_SIGNAL, request)
+
+    while children or (restarts and not stopping):
+        if reload_requested and not stopping:
+            reload_requested = False
+            logging.warning("Rebuilding the database, the workers keep serving the old one")
+            if _rebuild_master():
+                for old in list(children):
+                    if stopping:
+                        break
+                    start_worker()
+                    _stop_worker(old)
+                    children.pop(old, None)
+                logging.warning("Replaced the workers after a reload")
+
+        now = time.monotonic()
+        while restarts and restarts[0] <= now and not stopping:
+            restarts.pop(0)
+            start_worker()
+
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid, status = 0, 0
+        if pid == 0:
+            time.sleep(SUPERVISE_INTERVAL)
+            continue
+
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        delay = restart_policy.delay(time.monotonic() - started)
+        if delay is None:
+            logging.error("Workers exited %d times in a row right after starting, giving up",
+                          restart_policy.quick_exits)
+            gave_up = True
+            stop(None, None)
+            continue
+        logging.warning("Worker %d exited with status %d, restarting in %.1fs", pid, status, delay)
+        restarts.append(time.monotonic() + delay)
+        restarts.sort()
+    sock.close()
+    if gave_up:
+        raise RuntimeError("Workers kept exiting right after starting")
+
+
+def _load_database():
+    """
+    Load the database of website.resources if it is not loaded yet.
+    """
+    from website.resources import load_db, db_holder
+    if not db_holder.ready:
+        load_db()
+
+
+def _read_database():
+    """
+    Read the database of website.resources, see `read_database`.
+    """
+    from website.resources import get_db
+    read_database(get_db())
+
+
+def read_database(db):
+    """
+    Touch the parts of a database the routes read, like a worker serving traffic would.
+
+    Args:
+        db (mmrDB): The database.
+    """
+    for division in db.divisions:
+        for contestant in division.contestants:
+            str(contestant)
+    for match in db.matches:
+        match.to_json()
+
+
+def measure_overhead(workers: int = 4, freeze: bool = True, workload: Callable[[], None] = _read_database,
+                     prepare: Callable[[], None] = _load_database) -> list[dict[str, int]]:
+    """
+    Fork workers that run a workload over the shared database and report their memory.
+
+    Args:
+        workers (int, optional): Number of workers to fork. Defaults to 4.
+        freeze (bool, optional): Call gc.freeze() before forking. Defaults to True.
+        workload (Callable[[], None], optional): What each worker does before measuring.
+            Defaults to reading every contestant and match.
+        prepare (Callable[[], None], optional): Loads the database in the master before forking.
+            Defaults to loading the database of website.resources.
+
+    Returns:
+        list[dict[str, int]]: The master's memory first, then one entry per worker, in KiB.
+            A worker whose workload raised reports an empty dict.
+    """
+    prepare()
+
+    gc.collect()
+    if freeze:
+        gc.freeze()
+
+    reports = [worker_memory()]
+    pipes = []
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # The child must never return into the caller, it would carry on as a second master
+            status = 1
+            try:
+                os.close(read_end)
+                workload()
+                gc.collect()
+                time.sleep(0.1)
+                memory = worker_memory()
+                os.write(write_end, json.dumps(memory).encode())
+                status = 0
+            except BaseException:
+                logging.exception("Measuring worker failed")
+            finally:
+                os._exit(status)
+        os.close(write_end)
+        pipes.append((pid, read_end))
+
+    for pid, read_end in pipes:
+        with os.fdopen(read_end) as file:
+            data = file.read()
+        os.waitpid(pid, 0)
+        reports.append(json.loads(data) if data else {})
+
+    if freeze:
+        gc.unfreeze()
+    return reports
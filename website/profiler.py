@@ -0,0 +1,271 @@
+"""
+profiler.py
+
+This module profiles single requests on demand for web_admin sessions.
+
+Adding `?profile=collapsed` (or the header `X-Profile: collapsed`) to any URL runs the request
+under a sampling profiler and returns its stacks in the collapsed format read by flamegraph.pl
+and speedscope, instead of the page. `?profile=html` runs it under cProfile and returns the
+pstats report as an HTML page. Requests from anyone else are served normally.
+
+Sampling:
+    A thread takes the Python stack of every other thread every SAMPLE_INTERVAL seconds, so the
+    route on the event loop and its work in the thread pool both show up. Threads that are idle
+    (the event loop waiting in select, pool threads waiting for work) are left out. Concurrent
+    requests of other clients are sampled as well, the stacks show which route they belong to.
+
+cProfile:
+    Deterministic, but only sees the event loop thread, work handed to the thread pool shows up
+    as the time spent awaiting it.
+
+Only one request is profiled at a time, others asking for a profile wait for their turn. The last
+PROFILE_STORE_SIZE profiles are kept for /admin/profiles/.
+
+Classes:
+    - Profile: A stored profile.
+    - StackSampler: Thread sampling the stacks of all other threads.
+    - ProfileStore: The most recent profiles.
+    - ProfilerMiddleware: ASGI middleware running requests that ask for it under a profiler.
+
+Environment Variables:
+    - PROFILE_STORE_SIZE: Profiles kept, defaults to 20.
+
+Global Variables:
+    - profiles: The ProfileStore of this process.
+
+Dependencies:
+    - starlette
+    - Local modules: website.session
+"""
+import asyncio
+import collections
+import cProfile
+import html
+import io
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, PlainTextResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from website.session import get_session_info
+
+PROFILE_STORE_SIZE = int(os.environ.get("PROFILE_STORE_SIZE", "20"))
+SAMPLE_INTERVAL = 0.001
+MODES = ("collapsed", "html")
+# Files whose frames on top of a stack mean the thread is waiting, not working
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+
+@dataclass
+class Profile:
+    """
+    A stored profile.
+
+    Attributes:
+        id (int): Sequence number, used in the URL of the profile.
+        time (str): When the request was made.
+        method (str): Request method.
+        path (str): Request path with the query string.
+        mode (str): collapsed or html.
+        status (int): Status of the normal response.
+        duration_ms (float): Duration of the request under the profiler.
+        samples (int): Stacks sampled, 0 for cProfile.
+        output (str): The collapsed stacks or the HTML report.
+    """
+    id: int
+    time: str
+    method: str
+    path: str
+    mode: str
+    status: int
+    duration_ms: float
+    samples: int = 0
+    output: str = field(default="", repr=False)
+
+    def response(self) -> Response:
+        """
+        The profile as it is returned to the client.
+
+        Returns:
+            Response: A collapsed stack file download or the HTML report.
+        """
+        if self.mode == "collapsed":
+            return PlainTextResponse(self.output, headers={
+                "Content-Disposition": f'attachment; filename="profile-{self.id}.folded"'})
+        return HTMLResponse(self.output)
+
+
+class StackSampler(threading.Thread):
+    """
+    Thread sampling the stacks of all other threads.
+
+    Attributes:
+        interval (float): Seconds between samples.
+        stacks (collections.Counter): Collapsed stack to the number of samples it was seen in.
+        samples (int): Samples taken.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident or frame.f_code.co_filename.endswith(IDLE_FILES):
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                frames = []
+                while frame is not None:
+                    frames.append(_frame_name(frame))
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def stop(self) -> str:
+        """
+        Stop sampling.
+
+        Returns:
+            str: The stacks in the collapsed format, one `frame;frame;frame count` line per stack.
+        """
+        self._stop_event.set()
+        self.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """
+    The most recent profiles.
+    """
+
+    def __init__(self, size: int = PROFILE_STORE_SIZE):
+        self._profiles: collections.deque = collections.deque(maxlen=size)
+        self._ids = itertools.count(1)
+
+    def add(self, **kwargs) -> Profile:
+        profile = Profile(id=next(self._ids), **kwargs)
+        self._profiles.append(profile)
+        return profile
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        return next((profile for profile in self._profiles if profile.id == profile_id), None)
+
+    def list(self) -> list[Profile]:
+        """
+        The stored profiles, newest first.
+
+        Returns:
+            list[Profile]: The profiles.
+        """
+        return list(reversed(self._profiles))
+
+
+profiles = ProfileStore()
+
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware running requests that ask for it under a profiler.
+
+    The normal response is discarded, the client gets the profile instead.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        mode = self._mode(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        session_info = await get_session_info(request, Response())
+        if session_info["error"] is not None or not session_info["data"].web_admin:
+            await self.app(scope, receive, send)
+            return
+
+        if self._lock is None:
+            # Created lazily so it binds to the running event loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            profile = await self._profile(mode, scope, receive)
+        await profile.response()(scope, receive, send)
+
+    async def _profile(self, mode: str, scope: Scope, receive: Receive) -> Profile:
+        status = 500
+
+        async def discard(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        path = scope["path"] + ("?" + scope["query_string"].decode() if scope["query_string"] else "")
+        start = time.perf_counter()
+        if mode == "collapsed":
+            sampler = StackSampler()
+            sampler.start()
+            try:
+                await self.app(scope, receive, discard)
+            finally:
+                output = sampler.stop()
+            samples = sampler.samples
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, discard)
+            finally:
+                profiler.disable()
+            output = _html_report(profiler, path)
+            samples = 0
+
+        return profiles.add(time=time.strftime("%Y-%m-%d %H:%M:%S"), method=scope["method"], path=path,
+                            mode=mode, status=status, duration_ms=round((time.perf_counter() - start) * 1000, 1),
+                            samples=samples, output=output)
+
+    @staticmethod
+    def _mode(scope: Scope) -> Optional[str]:
+        """Profiler the request asks for, from ?profile= or the X-Profile header."""
+        if scope["type"] != "http":
+            return None
+        mode = Request(scope).query_params.get("profile")
+        if mode is None:
+            mode = dict(scope["headers"]).get(b"x-profile", b"").decode() or None
+        if mode is None:
+            return None
+        return mode if mode in MODES else "collapsed"
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _html_report(profiler: cProfile.Profile, path: str, limit: int = 100) -> str:
+    """pstats report of a cProfile run as an HTML page, by cumulative time."""
+    buffer = io.StringIO()
+    stats = pstats.Stats(profiler, stream=buffer)
+    stats.sort_stats("cumulative").print_stats(limit)
+    buffer.write("\n\nCallers\n")
+    stats.print_callers(limit // 4)
+    return (f"<!DOCTYPE html><html><head><title>Profile {html.escape(path)}</title></head>"
+            f"<body style=\"background-color: black; color: white;\"><h3>{html.escape(path)}</h3>"
+            f"<pre>{html.escape(buffer.getvalue())}</pre></body></html>")
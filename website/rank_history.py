@@ -0,0 +1,377 @@
+"""
+rank_history.py
+
+This module answers "what were the rankings on this date" from the rank history of every contestant.
+
+The rank history entries (date, MMR) of all contestants are merged into one chronological log per
+MMR key, stored as NumPy arrays. A full snapshot of every contestant's MMR is taken after every
+`SNAPSHOT_INTERVAL` log entries. The MMR of everybody at a date is the last snapshot before it plus
+the at most `SNAPSHOT_INTERVAL` log entries after the snapshot, found with a bisect on the log dates,
+so a query never replays the match history.
+
+Ranks are computed by MMR among the contestants of a division that have a rank history entry on
+or before the date.
+
+MMR trajectories:
+    The entries of one contestant are found through a contestant-sorted index of the log. Long
+    trajectories are downsampled with Largest-Triangle-Three-Buckets (`lttb`) to a point budget,
+    which keeps the peaks and drops that shape the line.
+
+Classes:
+    - RatingLog: Chronological MMR log of one MMR key with periodic snapshots.
+    - RankHistory: Rating logs of every MMR key with as-of-date rankings, rank changes and trajectories.
+
+Functions:
+    - lttb: Pick the points of a line to keep with Largest-Triangle-Three-Buckets.
+
+Dependencies:
+    - numpy
+    - Local modules: website.match_store, website.util
+"""
+import datetime
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+from website.match_store import MMR_KEYS
+from website.util import day_number, wrestler_histories
+
+SNAPSHOT_INTERVAL = 2048
+
+
+@dataclass
+class RatingLog:
+    """
+    Chronological MMR log of one MMR key.
+
+    Attributes:
+        day (np.ndarray): Date of each entry as days since 0001-01-01, sorted (int32).
+        contestant (np.ndarray): Index of the contestant (int32).
+        mmr (np.ndarray): MMR after the entry (float32).
+        change (np.ndarray): Change since the contestant's previous entry, NaN for their first (float32).
+        snapshots (np.ndarray): MMR of every contestant after every SNAPSHOT_INTERVAL entries,
+            NaN if not rated yet (float32, snapshots x contestants).
+        by_contestant (np.ndarray): Entry positions sorted by contestant, chronological per contestant (int32).
+        offsets (np.ndarray): Start of each contestant in `by_contestant`, one extra for the end (int64).
+    """
+    day: np.ndarray
+    contestant: np.ndarray
+    mmr: np.ndarray
+    change: np.ndarray
+    snapshots: np.ndarray
+    by_contestant: np.ndarray
+    offsets: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    @classmethod
+    def from_entries(cls, entries: list[tuple[int, int, float]], contestants: int) -> "RatingLog":
+        """
+        Build the log from (day, contestant, mmr) entries.
+
+        Args:
+            entries (list[tuple[int, int, float]]): The entries, in any order.
+            contestants (int): Number of contestants.
+
+        Returns:
+            RatingLog: The log with its snapshots.
+        """
+        entries.sort(key=lambda entry: (entry[0], entry[1]))
+        day = np.array([entry[0] for entry in entries], dtype=np.int32)
+        contestant = np.array([entry[1] for entry in entries], dtype=np.int32)
+        mmr = np.array([entry[2] for entry in entries], dtype=np.float32)
+
+        change = np.full(len(entries), np.nan, dtype=np.float32)
+        previous = np.full(contestants, np.nan, dtype=np.float32)
+        snapshots = []
+        for start in range(0, len(entries), SNAPSHOT_INTERVAL):
+            end = min(start + SNAPSHOT_INTERVAL, len(entries))
+            for i in range(start, end):
+                change[i] = mmr[i] - previous[contestant[i]]
+                previous[contestant[i]] = mmr[i]
+            if end - start == SNAPSHOT_INTERVAL:
+                snapshots.append(previous.copy())
+
+        snapshots = np.array(snapshots, dtype=np.float32).reshape(len(snapshots), contestants)
+        by_contestant = np.argsort(contestant, kind="stable").astype(np.int32)
+        offsets = np.searchsorted(contestant[by_contestant], np.arange(contestants + 1))
+        return cls(day=day, contestant=contestant, mmr=mmr, change=change, snapshots=snapshots,
+                   by_contestant=by_contestant, offsets=offsets)
+
+    def ratings_at(self, day: int) -> np.ndarray:
+        """
+        MMR of every contestant at the end of a day.
+
+        Args:
+            day (int): Days since 0001-01-01.
+
+        Returns:
+            np.ndarray: MMR per contestant, NaN for contestants without an entry yet (float32).
+        """
+        end = int(np.searchsorted(self.day, day, "right"))
+        snapshot = end // SNAPSHOT_INTERVAL - 1
+        if snapshot >= 0:
+            ratings = self.snapshots[snapshot].copy()
+            start = (snapshot + 1) * SNAPSHOT_INTERVAL
+        else:
+            ratings = np.full(self.snapshots.shape[1], np.nan, dtype=np.float32)
+            start = 0
+
+        # Keep the last entry of every contestant in the remaining range
+        contestant = self.contestant[start:end][::-1]
+        found, last = np.unique(contestant, return_index=True)
+        ratings[found] = self.mmr[start:end][::-1][last]
+        return ratings
+
+    def trajectory(self, contestant: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        All entries of one contestant.
+
+        Args:
+            contestant (int): Index of the contestant.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Days and MMR of the entries, oldest first.
+        """
+        positions = self.by_contestant[self.offsets[contestant]:self.offsets[contestant + 1]]
+        return self.day[positions], self.mmr[positions]
+
+
+@dataclass
+class RankHistory:
+    """
+    Rating logs of every MMR key.
+
+    Attributes:
+        names (list[str]): Contestant names, indexed by the logs.
+        name_index (dict[str, int]): Contestant name to index.
+        divisions (list[str]): Division abbreviations, indexed by `contestant_division`.
+        contestant_division (np.ndarray): Division of each contestant (int16).
+        logs (dict[str, RatingLog]): MMR key to its log, only keys with entries.
+        build_seconds (float): Time it took to build the logs.
+    """
+    names: list[str]
+    name_index: dict[str, int]
+    divisions: list[str]
+    contestant_division: np.ndarray
+    logs: dict[str, RatingLog]
+    build_seconds: float = 0.0
+
+    @classmethod
+    def from_db(cls, db, wrestlers: Optional[dict[str, dict]] = None) -> "RankHistory":
+        """
+        Build the logs from the rank history of every contestant.
+
+        Args:
+            db (mmrDB): The database.
+            wrestlers (Optional[dict[str, dict]]): `wrestler_histories(db)`, computed if not given.
+
+        Returns:
+            RankHistory: The rating logs.
+        """
+        start = time.perf_counter()
+        names, name_index, divisions, contestant_division = [], {}, [], []
+        entries: dict[str, list[tuple[int, int, float]]] = {key: [] for key in MMR_KEYS}
+        if wrestlers is None:
+            wrestlers = wrestler_histories(db)
+
+        for division in db.divisions:
+            divisions.append(division.abr)
+            for contestant in division.contestants:
+                name = str(contestant)
+                if name in name_index:
+                    continue
+                index = name_index[name] = len(names)
+                names.append(name)
+                contestant_division.append(len(divisions) - 1)
+
+                for date_key, entry in wrestlers[name].get("rank_history", {}).items():
+                    day = day_number(date_key)
+                    for key in MMR_KEYS:
+                        if entry.get(key):
+                            entries[key].append((day, index, float(entry[key]["mmr"])))
+
+        logs = {key: RatingLog.from_entries(key_entries, len(names))
+                for key, key_entries in entries.items() if key_entries}
+        return cls(
+            names=names,
+            name_index=name_index,
+            divisions=divisions,
+            contestant_division=np.array(contestant_division, dtype=np.int16),
+            logs=logs,
+            build_seconds=time.perf_counter() - start,
+        )
+
+    @property
+    def default_key(self) -> Optional[str]:
+        """The first key of MMR_KEYS that has entries."""
+        return next((key for key in MMR_KEYS if key in self.logs), None)
+
+    def log(self, mmr_key: Optional[str] = None) -> RatingLog:
+        """
+        Get the log of an MMR key.
+
+        Args:
+            mmr_key (Optional[str]): The key, `default_key` if None.
+
+        Returns:
+            RatingLog: The log.
+
+        Raises:
+            KeyError: If there is no log for the key.
+        """
+        key = mmr_key or self.default_key
+        if key not in self.logs:
+            raise KeyError(f"no rank history for {key}, available: {', '.join(self.logs)}")
+        return self.logs[key]
+
+    def rankings(self, date: datetime.date, division: Optional[str] = None, mmr_key: Optional[str] = None,
+                 limit: Optional[int] = 10) -> list[dict[str, Any]]:
+        """
+        Rankings as of the end of a date.
+
+        Args:
+            date (date): The date.
+            division (Optional[str]): Division abbreviation, all contestants if None.
+            mmr_key (Optional[str]): MMR key, `default_key` if None.
+            limit (Optional[int]): Number of ranks to return, all if None. Defaults to 10.
+
+        Returns:
+            list[dict[str, Any]]: rank, name and mmr, best first.
+
+        Raises:
+            KeyError: If the division or MMR key does not exist.
+            ValueError: If `limit` is negative.
+        """
+        _check_limit(limit)
+        ratings = self.log(mmr_key).ratings_at(date.toordinal())
+        ranked = self._ranked(ratings, division)[:limit]
+        return [{"rank": rank, "name": self.names[i], "mmr": round(float(ratings[i]), 1)}
+                for rank, i in enumerate(ranked.tolist(), 1)]
+
+    def rank_changes(self, start: datetime.date, end: datetime.date, division: Optional[str] = None,
+                     mmr_key: Optional[str] = None, limit: Optional[int] = None) -> list[dict[str, Any]]:
+        """
+        Rank and MMR changes between the end of two dates.
+
+        Args:
+            start (date): The earlier date.
+            end (date): The later date.
+            division (Optional[str]): Division abbreviation, all contestants if None.
+            mmr_key (Optional[str]): MMR key, `default_key` if None.
+            limit (Optional[int]): Number of ranks at `end` to return, all if None.
+
+        Returns:
+            list[dict[str, Any]]: name, rank and mmr at both dates and their changes, ordered by the rank at `end`.
+                Ranks and MMR are None for contestants without an entry yet at a date.
+
+        Raises:
+            KeyError: If the division or MMR key does not exist.
+            ValueError: If `limit` is negative.
+        """
+        _check_limit(limit)
+        log = self.log(mmr_key)
+        before, after = log.ratings_at(start.toordinal()), log.ratings_at(end.toordinal())
+        ranks_before = {i: rank for rank, i in enumerate(self._ranked(before, division).tolist(), 1)}
+
+        rows = []
+        for rank, i in enumerate(self._ranked(after, division)[:limit].tolist(), 1):
+            old_rank = ranks_before.get(i)
+            old_mmr = None if np.isnan(before[i]) else round(float(before[i]), 1)
+            new_mmr = round(float(after[i]), 1)
+            rows.append({
+                "name": self.names[i],
+                "rank_before": old_rank,
+                "rank": rank,
+                "rank_change": None if old_rank is None else old_rank - rank,
+                "mmr_before": old_mmr,
+                "mmr": new_mmr,
+                "mmr_change": None if old_mmr is None else round(new_mmr - old_mmr, 1),
+            })
+        return rows
+
+    def trajectory(self, name: str, mmr_key: Optional[str] = None, points: Optional[int] = None) -> dict[str, Any]:
+        """
+        MMR over time of one contestant.
+
+        Args:
+            name (str): Contestant name.
+            mmr_key (Optional[str]): MMR key, `default_key` if None.
+            points (Optional[int]): Downsample to at most this many points with `lttb`, all points if None.
+
+        Returns:
+            dict[str, Any]: name, entries (count before downsampling), dates (ISO) and mmr.
+
+        Raises:
+            KeyError: If the contestant or MMR key does not exist.
+        """
+        if name not in self.name_index:
+            raise KeyError(f"{name} not found")
+        day, mmr = self.log(mmr_key).trajectory(self.name_index[name])
+        keep = lttb(day, mmr, points) if points is not None else slice(None)
+        return {
+            "name": name,
+            "entries": len(day),
+            "dates": [datetime.date.fromordinal(value).isoformat() for value in day[keep].tolist()],
+            "mmr": [round(value, 1) for value in mmr[keep].tolist()],
+        }
+
+    def _ranked(self, ratings: np.ndarray, division: Optional[str]) -> np.ndarray:
+        """Indices of the rated contestants of a division, best first, ties in the order of `names` (division order)."""
+        mask = ~np.isnan(ratings)
+        if division is not None:
+            if division not in self.divisions:
+                raise KeyError(f"{division} not found")
+            mask &= self.contestant_division == self.divisions.index(division)
+        candidates = np.flatnonzero(mask)
+        return candidates[np.argsort(-ratings[candidates], kind="stable")]
+
+
+def _check_limit(limit: Optional[int]):
+    # A negative slice end would drop ranks from the bottom instead of limiting from the top
+    if limit is not None and limit < 0:
+        raise ValueError(f"limit must be 0 or more, got {limit}")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Pick the points of a line to keep with Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept, the points between are split into `points - 2` buckets and
+    from each bucket the point forming the largest triangle with the previously kept point and the
+    average of the next bucket is kept.
+
+    Args:
+        x (np.ndarray): X values, ascending.
+        y (np.ndarray): Y values.
+        points (int): Number of points to keep, at least 3.
+
+    Returns:
+        np.ndarray: Indices of the kept points, ascending.
+    """
+    n = len(x)
+    points = max(points, 3)
+    if n <= points:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket == points - 3:
+            next_x, next_y = x[-1], y[-1]
+        else:
+            next_x, next_y = x[end:edges[bucket + 2]].mean(), y[end:edges[bucket + 2]].mean()
+        # Twice the triangle area, the constant factor does not change the maximum
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = kept[bucket + 1] = start + int(np.argmax(area))
+    return kept
@@ -0,0 +1,133 @@
+"""
+rankings_card.py
+
+This module draws the top 10 rankings as a shareable PNG with Matplotlib.
+
+One panel per division shows the columns of `mmrDB.api_rankings_top_10()`, with any HTML in the
+cells (links, line breaks) reduced to text. Drawing takes a few hundred milliseconds, so the image
+is rendered once per rankings version (`rankings_updated`) and kept until the rankings change.
+
+Classes:
+    - RankingsCard: Rendered rankings image, cached per rankings version.
+
+Functions:
+    - render_rankings_card: Draw the rankings as a PNG.
+
+Dependencies:
+    - matplotlib
+    - Local modules: website.timing
+"""
+import hashlib
+import html
+import re
+import threading
+from io import BytesIO
+from typing import Any, Optional
+
+from website.timing import timed
+
+BG_COLOR = "#000000"
+PANEL_COLOR = "#1e1e1e"
+HEADER_COLOR = "#003300"
+TEXT_COLOR = "#ffffff"
+ROW_HEIGHT = 0.3
+PANEL_WIDTH = 6.5
+COLUMNS_PER_ROW = 2
+
+_TAG = re.compile(r"<[^>]+>")
+
+
+@timed("graphs")
+def render_rankings_card(rankings: dict[str, list[dict[str, Any]]], updated: dict[str, Any]) -> bytes:
+    """
+    Draw the rankings as a PNG.
+
+    Args:
+        rankings (dict[str, list[dict[str, Any]]]): Division name to its rows, from `api_rankings_top_10()`.
+        updated (dict[str, Any]): `rankings_updated`, with date and event.
+
+    Returns:
+        bytes: The PNG image.
+    """
+    # Matplotlib is slow to import, only load it when the card is rendered
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    divisions = list(rankings.items())
+    grid_rows = max((len(divisions) + COLUMNS_PER_ROW - 1) // COLUMNS_PER_ROW, 1)
+    # Title, header and the rows of the longest division
+    panel_rows = max((len(rows) for _, rows in divisions), default=0) + 2
+    width = PANEL_WIDTH * min(max(len(divisions), 1), COLUMNS_PER_ROW)
+    height = grid_rows * panel_rows * ROW_HEIGHT + 1
+
+    # A Figure without pyplot keeps no global state, so requests can render in parallel
+    fig = Figure(figsize=(width, height), facecolor=BG_COLOR)
+    FigureCanvasAgg(fig)
+    fig.suptitle(f"Top 10 Rankings\n{updated.get('date', '')} {_text(updated.get('event', ''))}",
+                 color=TEXT_COLOR, fontsize=14, y=1 - 0.2 / height)
+
+    top = 1 - 0.9 / height
+    grid = fig.add_gridspec(grid_rows, min(max(len(divisions), 1), COLUMNS_PER_ROW), top=top, bottom=0.01,
+                            left=0.01, right=0.99, hspace=0.15, wspace=0.05)
+    for i, (division, rows) in enumerate(divisions):
+        ax = fig.add_subplot(grid[i // COLUMNS_PER_ROW, i % COLUMNS_PER_ROW])
+        ax.set_axis_off()
+        ax.set_title(_text(division), color=TEXT_COLOR, fontsize=12, fontweight="bold")
+        if not rows:
+            continue
+
+        columns = list(rows[0])
+        cells = [[_text(row.get(column, "")) for column in columns] for row in rows]
+        # Fill the top of the panel, one ROW_HEIGHT per row whatever the division sizes
+        rows_height = (len(rows) + 1) / (panel_rows - 1)
+        table = ax.table(cellText=cells, colLabels=columns, cellLoc="center",
+                         bbox=[0, 1 - rows_height, 1, rows_height])
+        table.auto_set_font_size(False)
+        table.set_fontsize(10)
+        for (row, _), cell in table.get_celld().items():
+            cell.set_edgecolor(BG_COLOR)
+            cell.set_facecolor(HEADER_COLOR if row == 0 else PANEL_COLOR)
+            cell.get_text().set_color(TEXT_COLOR)
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", facecolor=BG_COLOR, dpi=100, bbox_inches="tight", pad_inches=0.3)
+    return buffer.getvalue()
+
+
+class RankingsCard:
+    """
+    Rendered rankings image, cached per rankings version.
+
+    Only the latest version is kept. Concurrent requests for a version that is not rendered yet
+    wait for one rendering instead of each drawing it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (version, png, etag), replaced as a whole so readers never see a mix of versions
+        self._card: tuple[Optional[tuple], bytes, str] = (None, b"", "")
+
+    def get(self, db) -> tuple[bytes, str]:
+        """
+        Get the image for the current rankings of a database, rendering it if they changed.
+
+        Args:
+            db (mmrDB): The database.
+
+        Returns:
+            tuple[bytes, str]: The PNG image and its ETag.
+        """
+        version = (str(db.rankings_updated.get("date")), str(db.rankings_updated.get("event")))
+        card = self._card
+        if card[0] != version:
+            with self._lock:
+                card = self._card
+                if card[0] != version:
+                    png = render_rankings_card(db.api_rankings_top_10(), db.rankings_updated)
+                    card = self._card = (version, png, f'"{hashlib.sha256(png).hexdigest()[:32]}"')
+        return card[1], card[2]
+
+
+def _text(value: Any) -> str:
+    """Cell value as plain text, HTML tags replaced by spaces."""
+    return " ".join(html.unescape(_TAG.sub(" ", str(value))).split())
@@ -0,0 +1,222 @@
+"""
+reload.py
+
+This module holds the loaded database and rebuilds it in the background.
+
+Readers always get a complete database: a new one is built in a background thread while the
+old one keeps serving requests, then a single reference is swapped.
+
+Structures derived from the database (indexes, column stores) are registered with `register`.
+They are built for the new database before it is swapped in and are dropped with the old one.
+A structure can require others, which are built first for the same database and passed to it.
+
+Classes:
+    - DatabaseHolder: Holds the current database and manages background rebuilds.
+
+Usage:
+    holder = DatabaseHolder(lambda: mmrDB(DOWNLOAD_DB=False))
+    holder.load()       # build synchronously
+    holder.reload()     # rebuild in the background, returns immediately
+    db = holder.db      # current snapshot, take it once per request
+    holder.register("matches", MatchStore.from_db)
+    store = holder.derived("matches")  # built for the current snapshot
+    holder.register("histories", wrestler_histories)
+    holder.register("ranks", RankHistory.from_db, requires=("histories",))  # from_db(db, histories)
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+
+class DatabaseHolder:
+    """
+    Holds the current database and swaps in a freshly built one when a rebuild finishes.
+
+    Attributes:
+        db: The current database, None until the first build finishes.
+        generation (int): Number of builds that have been swapped in.
+    """
+
+    def __init__(self, build: Callable[[], Any]):
+        """
+        Args:
+            build (Callable[[], Any]): Function that builds and returns a new database.
+        """
+        self._build = build
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.db = None
+        self.generation = 0
+        self._builders: dict[str, tuple[Callable[..., Any], tuple[str, ...]]] = {}
+        # (database, {name: structure}) swapped as one reference so both always match
+        self._derived: tuple[Any, dict[str, Any]] = (None, {})
+        self._derived_lock = threading.Lock()
+
+        self._state = "empty"
+        self._started: Optional[float] = None
+        self._started_at: Optional[str] = None
+        self._finished_at: Optional[str] = None
+        self._last_duration: Optional[float] = None
+        self._error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        """True once a database has been loaded."""
+        return self.db is not None
+
+    @property
+    def building(self) -> bool:
+        """True while a build is running."""
+        return self._state == "building"
+
+    def load(self, build: Optional[Callable[[], Any]] = None):
+        """
+        Build a database in the calling thread and swap it in.
+
+        Args:
+            build (Optional[Callable[[], Any]]): Build function to use instead of the default one,
+                e.g. one that loads a snapshot first.
+
+        Raises:
+            Exception: Whatever the build function raises, the old database is kept.
+        """
+        with self._lock:
+            self._begin()
+        self._run(build, raise_errors=True)
+
+    def reload(self, build: Optional[Callable[[], Any]] = None) -> bool:
+        """
+        Start building a new database in a background thread.
+
+        Args:
+            build (Optional[Callable[[], Any]]): Build function to use instead of the default one.
+
+        Returns:
+            bool: True if a build was started, False if one is already running.
+        """
+        with self._lock:
+            if self.building:
+                return False
+            self._begin()
+            self._thread = threading.Thread(target=self._run, args=(build,), name="db-reload", daemon=True)
+            self._thread.start()
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for a background build to finish.
+
+        Returns:
+            bool: True if no build is running anymore.
+        """
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return not self.building
+
+    def register(self, name: str, build: Callable[..., Any], requires: tuple[str, ...] = ()):
+        """
+        Register a structure derived from the database.
+
+        Args:
+            name (str): Name to get it with from `derived`.
+            build (Callable[..., Any]): Function that builds it from a database, followed by the
+                structures in `requires`.
+            requires (tuple[str, ...]): Names of registered structures it is built from.
+        """
+        self._builders[name] = (build, tuple(requires))
+
+    def derived(self, name: str) -> Any:
+        """
+        Get a derived structure for the current database, building it if it does not exist yet.
+
+        Args:
+            name (str): The name it was registered with.
+
+        Returns:
+            Any: The structure built from `db`.
+
+        Raises:
+            KeyError: If nothing is registered with this name.
+        """
+        db, derived = self._derived
+        if name not in derived:
+            with self._derived_lock:
+                # The database may have been swapped while waiting for the lock
+                db, derived = self._derived
+                self._build_derived(name, db, derived)
+        return derived[name]
+
+    def built(self) -> dict[str, Any]:
+        """
+        Get the derived structures built so far for the current database, without building others.
+
+        Returns:
+            dict[str, Any]: Registered name to structure.
+        """
+        return dict(self._derived[1])
+
+    def status(self) -> dict[str, Any]:
+        """
+        Get the state of the current or last build.
+
+        Returns:
+            dict[str, Any]: State, timestamps, elapsed time of a running build and duration of the last one.
+        """
+        elapsed = round(time.perf_counter() - self._started, 2) if self.building else None
+        return {
+            "state": self._state,
+            "ready": self.ready,
+            "generation": self.generation,
+            "started_at": self._started_at,
+            "finished_at": self._finished_at,
+            "elapsed_seconds": elapsed,
+            "last_duration_seconds": self._last_duration,
+            "error": self._error,
+        }
+
+    def _begin(self):
+        self._state = "building"
+        self._started = time.perf_counter()
+        self._started_at = datetime.now().strftime("%Y-%m-%d %I:%M:%S %p")
+        self._error = None
+
+    def _run(self, build: Optional[Callable[[], Any]] = None, raise_errors: bool = False):
+        try:
+            new_db = (build or self._build)()
+        except Exception as e:
+            logging.exception("Database build failed")
+            self._error = repr(e)
+            self._finish("failed")
+            if raise_errors:
+                raise
+            return
+
+        derived = {}
+        for name in self._builders:
+            try:
+                self._build_derived(name, new_db, derived)
+            except Exception:
+                # Left to be built on first use
+                logging.exception("Building %s failed", name)
+
+        # Swapping a single reference is atomic, readers see either the old or the new database
+        with self._derived_lock:
+            self._derived = (new_db, derived)
+            self.db = new_db
+        self.generation += 1
+        self._finish("ready")
+
+    def _build_derived(self, name: str, db: Any, derived: dict[str, Any]) -> Any:
+        if name not in derived:
+            build, requires = self._builders[name]
+            derived[name] = build(db, *(self._build_derived(required, db, derived) for required in requires))
+        return derived[name]
+
+    def _finish(self, state: str):
+        self._last_duration = round(time.perf_counter() - self._started, 2)
+        self._finished_at = datetime.now().strftime("%Y-%m-%d %I:%M:%S %p")
+        self._state = state
+        logging.info("Database build %s in %.2fs", state, self._last_duration)
@@ -5,39 +5,49 @@ This module contains resources and utilities needed for the web application,
 such as database initialization, user verification, and configuration settings.
 
 Module Components:
-- load_db: Function to load the database.
+- load_db: Function to load the database, from the snapshot if the source data is unchanged.
+  The application lifespan calls it in the background so the server can bind its port immediately.
+- get_db: Function to get the current database snapshot.
+- get_match_store: Function to get the columnar match history of the current database.
+- get_stats_cube: Function to get the precomputed stats tables of the current database.
+- get_rank_history: Function to get the as-of-date rating logs of the current database.
+- get_title_index: Function to get the title reign indexes and rendered title pages of the current database.
 - return_error: Function to generate an error page.
-- get_current_username: Retrieve the current username if the credentials match or return False.
 - get_current_username2: Retrieve the current username if the credentials match or raise HTTPException.
 
 Global Variables:
-- MY_IP: IP address retrieved from environment variables.
-- SERVER_IP: Public IP address of the server.
+- MY_IP: IP address retrieved from environment variables, compared with `get_public_IP()` to detect a local server.
 - SECRET_KEY: Secret key retrieved from environment variables.
 - DISABLE_RANKINGS: Flag to disable rankings.
+- SNAPSHOT_FILE: File the database snapshot is saved to after every build.
+- MMR_DOWNLOAD_DIR: Directory of the downloaded source data, part of the snapshot fingerprint.
 - ENABLE_LOGGING: Flag to enable logging.
 - templates: Jinja2Templates object for rendering templates.
-- TemplateResponse: Alias for TemplateResponse from starlette.templating.
-- db: Global variable for storing the database instance.
+- TemplateResponse: TemplateResponse from starlette.templating, timed as the "template" Server-Timing span.
+- db_holder: DatabaseHolder that owns the database instance and rebuilds it in the background.
+- rankings_card: RankingsCard holding the rendered rankings image of the current rankings.
 - RANKINGS_USER: Name of the rankings user. This is fanhub and to be moved.
-- security: HTTPBasic object for basic authentication.
 - security2: HTTPBasic object for basic authentication with auto error handling.
+- authenticator: BasicAuthenticator holding the hashed USER_DB credentials.
 - discord_client: CustomDiscordOAuthClient object for Discord OAuth configuration.
+- discord_roles: DiscordRoleCache that revalidates the roles of users logged in through Discord.
 - verifier: BasicVerifier object for user verification.
 
 Dependencies:
-- secrets
 - os
 - fastapi
 - starlette
 - dotenv
 - logging
-- Local modules: mmr_database, website.discord, website.models, website.resources_private,
-  website.session, website.util
+- Local modules: mmr_database, website.auth, website.discord, website.models, website.resources_private,
+  website.match_store, website.rank_history, website.rankings_card, website.reload, website.session,
+  website.snapshot, website.stats_cube, website.timing, website.title_index, website.util
 """
 
 # Standard Library Imports
-import secrets
+import logging
+import sys
+import time
 from typing import Optional
 
 # Third-party Imports
@@ -49,52 +59,197 @@ from starlette.requests import Request
 from starlette.templating import Jinja2Templates
 
 # Local / Custom Imports
+from mmr_database.division import Division
 from mmr_database.mmrDB import mmrDB
-from website.discord import CustomDiscordOAuthClient
+from website.auth import BasicAuthenticator
+from website.discord import CustomDiscordOAuthClient, DiscordRoleCache
+from website.match_store import MatchStore
 from website.models import SessionData
+from website.rank_history import RankHistory
+from website.rankings_card import RankingsCard
+from website.reload import DatabaseHolder
 from website.resources_private import *
-from website.session import BasicVerifier, backend
+from website.session import BasicVerifier, backend, GUEST_SESSION
+from website.snapshot import load_snapshot, save_snapshot, source_fingerprint
+from website.stats_cube import StatsCube
+from website.timing import instrument, timed
+from website.title_index import TitleIndex
 from website.util import *
 
 # Load environment variables
 load_dotenv()
 MY_IP = os.environ.get("MY_IP")
-SERVER_IP = get_public_IP()
 
 # Configuration flags
 DISABLE_RANKINGS = False
 ENABLE_LOGGING = False
+SNAPSHOT_FILE = os.environ.get("DB_SNAPSHOT", "db_snapshot.bin")
+MMR_DOWNLOAD_DIR = os.environ.get("MMR_DOWNLOAD_DIR", "data")
 
 # Constants
 PERMISSION_ERROR = {"error": "User doesn't have permission"}
 
 # Initialize templates
 templates = Jinja2Templates(directory="website/templates")
-TemplateResponse = templates.TemplateResponse
+TemplateResponse = timed("template")(templates.TemplateResponse)
 
+# Server-Timing "db" spans
+instrument(mmrDB, "api_", "db")
+instrument(Division, "api_", "db")
 
-def load_db():
+
+def _snapshot_fingerprint() -> str:
+    """
+    Fingerprint of the database sources.
+
+    `MMR_DATA_PATH` lists them explicitly. Otherwise the mmr_database package directory and the
+    directory downloaded data is kept in (`MMR_DOWNLOAD_DIR`, "data" in the working directory by
+    default) are used, so a new download invalidates the snapshot.
+    """
+    package = os.path.dirname(sys.modules[mmrDB.__module__].__file__)
+    default = os.pathsep.join([package, os.path.abspath(MMR_DOWNLOAD_DIR)])
+    sources = os.environ.get("MMR_DATA_PATH", default).split(os.pathsep)
+    return source_fingerprint(sources, f"DISABLE_RANKINGS={DISABLE_RANKINGS}")
+
+
+def _build_db() -> mmrDB:
     """
-    Load the database into the global variable `db`.
+    Build a new database and save a snapshot of it.
 
     The function makes use of the `mmrDB` class and the `DISABLE_RANKINGS` flag.
     It's crucial to set the appropriate value for `DISABLE_RANKINGS` before invoking this function.
     """
-    global db
-    db = mmrDB(DOWNLOAD_DB=False, DISABLE_RANKINGS=DISABLE_RANKINGS)
+    fingerprint = _snapshot_fingerprint()
+    start = time.perf_counter()
+    new_db = mmrDB(DOWNLOAD_DB=False, DISABLE_RANKINGS=DISABLE_RANKINGS)
+    build_seconds = time.perf_counter() - start
+    logging.info("Built database in %.2fs", build_seconds)
+    save_snapshot(SNAPSHOT_FILE, new_db, fingerprint, build_seconds)
+    return new_db
+
+
+def _load_or_build_db() -> mmrDB:
+    """
+    Load the database from the snapshot if the source data is unchanged, otherwise build it.
+    """
+    snapshot_db = load_snapshot(SNAPSHOT_FILE, _snapshot_fingerprint())
+    if snapshot_db is not None:
+        return snapshot_db
+    return _build_db()
+
+
+db_holder = DatabaseHolder(_build_db)
+# api_wrestlers() of every contestant, read once per load by the structures below
+db_holder.register("wrestler_histories", wrestler_histories)
+db_holder.register("match_store", MatchStore.from_db, requires=("wrestler_histories",))
+db_holder.register("stats_cube", StatsCube.from_db)
+db_holder.register("rank_history", RankHistory.from_db, requires=("wrestler_histories",))
+db_holder.register("title_index", TitleIndex.from_db, requires=("wrestler_histories",))
+
+# Rendered once per rankings version, shared by /rankings/card.png and the memory report
+rankings_card = RankingsCard()
+
+
+def load_db(background: bool = False):
+    """
+    Load the database and swap it into `db_holder`.
+
+    Startup uses the snapshot when it is valid, /admin/reload always rebuilds.
+
+    Parameters:
+    - background (bool): Load in a background thread and return immediately.
+    """
+    if background:
+        db_holder.reload(_load_or_build_db)
+    else:
+        db_holder.load(_load_or_build_db)
+
+
+def get_db() -> mmrDB:
+    """
+    Get the current database.
+
+    Route modules must call this instead of importing the database, so they see the new
+    database after a reload. Take it once per request to use the same snapshot throughout.
+
+    Returns:
+    - mmrDB: The current database.
+
+    Raises:
+    - HTTPException: 503 while the first load after startup is still running.
+    """
+    current = db_holder.db
+    if current is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is loading",
+            headers={"Retry-After": "5"},
+        )
+    return current
+
+
+def get_match_store() -> MatchStore:
+    """
+    Get the columnar match history of the current database.
+
+    Returns:
+    - MatchStore: The match store, built once per database load.
+
+    Raises:
+    - HTTPException: 503 while the first load after startup is still running.
+    """
+    get_db()
+    return db_holder.derived("match_store")
+
+
+def get_stats_cube() -> StatsCube:
+    """
+    Get the precomputed stats tables of the current database.
+
+    Returns:
+    - StatsCube: The stats cube, built once per database load.
+
+    Raises:
+    - HTTPException: 503 while the first load after startup is still running.
+    """
+    get_db()
+    return db_holder.derived("stats_cube")
+
+
+def get_rank_history() -> RankHistory:
+    """
+    Get the as-of-date rating logs of the current database.
 
+    Returns:
+    - RankHistory: The rank history, built once per database load.
+
+    Raises:
+    - HTTPException: 503 while the first load after startup is still running.
+    """
+    get_db()
+    return db_holder.derived("rank_history")
+
+
+def get_title_index() -> TitleIndex:
+    """
+    Get the title reign indexes and rendered title pages of the current database.
+
+    Returns:
+    - TitleIndex: The title index, built once per database load.
 
-# Load database
-db: Union[mmrDB, None] = None
-load_db()
+    Raises:
+    - HTTPException: 503 while the first load after startup is still running.
+    """
+    get_db()
+    return db_holder.derived("title_index")
 
 # TODO: need to move
 # Placeholder variable for fanhub resources
 RANKINGS_USER = "current_rankings"
 
 # Security configuration
-security = HTTPBasic(auto_error=False)
 security2 = HTTPBasic(auto_error=True)
+authenticator = BasicAuthenticator(USER_DB, os.environ.get("SECRET_KEY"))
 
 # Discord OAuth client configuration
 client_id = os.environ.get("CLIENT_ID")
@@ -102,6 +257,7 @@ client_secret = os.environ.get("CLIENT_SECRET")
 callback = os.environ.get("CALLBACK")
 scopes = ("guilds.members.read", "guilds", "email", "identify")
 discord_client = CustomDiscordOAuthClient(client_id, client_secret, callback, scopes)
+discord_roles = DiscordRoleCache(discord_client)
 
 # Initialize verifier
 verifier = BasicVerifier(
@@ -122,54 +278,22 @@ async def return_error(request: Request, error: dict):
     Returns:
     - TemplateResponse: A rendered error page.
     """
-    data = SessionData(
-        username="guest",
-        web_user=False,
-        web_admin=False,
-        fanhub_user=False,
-        fanhub_elite=False,
-        fanhub_admin=False,
-    )
     results = {
         "request": request,
         "current_page": "home",
-        "session": data,
+        "session": GUEST_SESSION,
         "error": error,
     }
     return TemplateResponse("error.html", results)
 
 
-# TODO: Merge these into one function
-async def get_current_username(credentials: Optional[HTTPBasicCredentials] = Depends(security)):
-    """
-    Retrieve the current username if the credentials match or return False.
-
-    Parameters:
-    - credentials (Optional[HTTPBasicCredentials]): The user credentials.
-
-    Returns:
-    - str or bool: The current username if the credentials match, False otherwise.
-
-    Note:
-    - Most pages use this function to get username and redirect to home if fail.
-    """
-    if credentials:
-        current_username_bytes = credentials.username.encode("utf8")
-        current_password_bytes = credentials.password.encode("utf8")
-
-        for saved_user, saved_pass in USER_DB.items():
-            if secrets.compare_digest(current_username_bytes, saved_user):
-                if secrets.compare_digest(current_password_bytes, saved_pass):
-                    return credentials.username
-
-    return False
-
-
-# TODO: Merge these into one function
-async def get_current_username2(credentials: Optional[HTTPBasicCredentials] = Depends(security2)):
+def get_current_username2(credentials: Optional[HTTPBasicCredentials] = Depends(security2)):
     """
     Retrieve the current username if the credentials match or raise an HTTPException.
 
+    A plain function so FastAPI runs it in the threadpool, the password hash takes tens of
+    milliseconds and would block the event loop for every login attempt, failed ones included.
+
     Parameters:
     - credentials (Optional[HTTPBasicCredentials]): The user credentials.
 
@@ -183,13 +307,9 @@ async def get_current_username2(credentials: Optional[HTTPBasicCredentials] = De
     - This function is used on the login page to force the login window to reopen if the credentials fail.
     """
     if credentials:
-        current_username_bytes = credentials.username.encode("utf8")
-        current_password_bytes = credentials.password.encode("utf8")
-
-        for saved_user, saved_pass in USER_DB.items():
-            if secrets.compare_digest(current_username_bytes, saved_user):
-                if secrets.compare_digest(current_password_bytes, saved_pass):
-                    return credentials.username
+        username = authenticator.verify(credentials.username, credentials.password)
+        if username is not None:
+            return username
 
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
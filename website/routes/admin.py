@@ -1,11 +1,20 @@
-from starlette.responses import RedirectResponse
+import html
+import tracemalloc
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, RedirectResponse
 
 from mmr_database.division import Division
 from website import sql_db
-from website.resources import db, Depends, html_table, load_db, return_error, Request, SessionData, TemplateResponse
+from website.resources import (db_holder, Depends, discord_roles, get_db, get_match_store, html_table, rankings_card,
+                               return_error, Request, SessionData, TemplateResponse)
 from fastapi import APIRouter, Form
 
-from website.session import get_session_info
+from website import memory
+from website.prefork import request_reload, worker_memory
+from website.profiler import profiles
+from website.session import backend, get_session_info, revoke_session
+from website.timing import history, SERVER_TIMING_HISTORY, slowest
 
 router = APIRouter()
 
@@ -25,6 +34,7 @@ async def test_page(request: Request, session_info: dict = Depends(get_session_i
 
     # START HERE #
 
+    db = get_db()
     division: Division = db.get_division("M2")
 
     output = {
@@ -59,6 +69,7 @@ async def debug(request: Request, session_info: dict = Depends(get_session_info)
         error = {"error": "user doesnt have permission"}
         return await return_error(request, error)
 
+    db = get_db()
     new_wrestlers = db.api_debug_new_contestants()
     for k, v in new_wrestlers.items():
         new_wrestlers[k] = sorted(v)
@@ -139,6 +150,7 @@ async def rankings_helper(request: Request, session_info: dict = Depends(get_ses
         error = {"error": "user doesnt have permission"}
         return await return_error(request, error)
 
+    db = get_db()
     champions, singles, duos, trios = db.api_rankings_helper()
     champions = html_table(champions, id="champions")
     singles = '\n'.join([f'<option value="{w.name}">{w.name}</option>' for w in singles])
@@ -169,6 +181,7 @@ async def rankings_helper_get_wrestler(request: Request, wrestler_name: str = Fo
         error = {"error": "user doesnt have permission"}
         return await return_error(request, error)
 
+    db = get_db()
     return db.api_rankings_helper_post(wrestler_name)
 
 
@@ -188,27 +201,12 @@ async def get_matches(request: Request, session_info: dict = Depends(get_session
         error = {"error": "user doesnt have permission"}
         return await return_error(request, error)
 
-    match_count = len(db.matches)
-    matches = [match.to_json() for match in reversed(db.matches)]
-
-    # Code for finding what is stretching the table
-    # highest_length = 0
-    # hightest_match = None
-    # for match in matches:
-    #     for line in match["Event"].split("<br>"):
-    #         if len(line) > highest_length:
-    #             highest_length = len(line)
-    #             hightest_match = match
-    #
-    # print(hightest_match)
-
-    matches = html_table(matches, id="match_history")
+    # The table loads its rows from /matches/data
     results = {
         "request": request,
         "current_page": "matches",
         "session": session_data,
-        "matches": matches,
-        "match_count": match_count,
+        "match_count": len(get_match_store()),
     }
     return TemplateResponse("admin/matches.html", results)
 
@@ -218,8 +216,9 @@ async def reload_db(request: Request, session_info: dict = Depends(get_session_i
     """
     Endpoint to reload the database.
 
-    TODO:
-        broken, need to fix
+    The new database is built in the background while the current one keeps serving requests,
+    progress is shown on /admin/reload/status. Under the prefork server the master rebuilds it and
+    replaces every worker, not only the one handling this request.
     """
     if session_info["error"] is not None:
         return await return_error(request, session_info["error"])
@@ -229,7 +228,8 @@ async def reload_db(request: Request, session_info: dict = Depends(get_session_i
         error = {"error": "user doesnt have permission"}
         return await return_error(request, error)
 
-    db.initialize()
+    if not request_reload():
+        db_holder.reload()
 
     url = request.headers["Referer"] if "Referer" in request.headers else "/"
     return RedirectResponse(url=url)
@@ -261,3 +261,280 @@ async def db_debug(request: Request, session_info: dict = Depends(get_session_in
         "output": output,
     }
     return TemplateResponse("admin/debug_db.html", results)
+
+
+@router.get("/admin/reload/status")
+async def reload_db_status(request: Request, session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to show the progress and duration of the current or last database build
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_admin:
+        error = {"error": "user doesnt have permission"}
+        return await return_error(request, error)
+
+    return JSONResponse(db_holder.status())
+
+
+@router.get("/admin/sessions/")
+async def session_stats(request: Request, session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to show the number of live sessions and the expiry/eviction counters
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_admin:
+        error = {"error": "user doesnt have permission"}
+        return await return_error(request, error)
+
+    return JSONResponse(backend.stats())
+
+
+@router.post("/admin/sessions/revoke")
+async def session_revoke(request: Request, session: str = Form(...), session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to end a session before it expires, by session UUID, signed token or token id.
+
+    In signed mode the token id is logged when the session is created.
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_admin:
+        error = {"error": "user doesnt have permission"}
+        return await return_error(request, error)
+
+    revoked = await revoke_session(session.strip())
+    return JSONResponse({"revoked": revoked}, status_code=200 if revoked else 404)
+
+
+@router.get("/admin/timing/")
+async def request_timing(request: Request, limit: int = 50, session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to show the slowest recent requests with their Server-Timing breakdown
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_admin:
+        error = {"error": "user doesnt have permission"}
+        return await return_error(request, error)
+
+    entries = slowest(limit)
+    layers = sorted({name for entry in entries for name in entry["spans"]})
+    rows = []
+    for entry in entries:
+        row = {key: entry[key] for key in ("time", "method", "path", "status", "total_ms")}
+        for name in layers:
+            ms, count = entry["spans"].get(name, (0, 0))
+            row[f"{name}_ms"] = f"{ms} ({count})" if count else ""
+        row["other_ms"] = round(entry["total_ms"] - sum(ms for ms, _ in entry["spans"].values()), 1)
+        rows.append(row)
+
+    results = {
+        "request": request,
+        "current_page": "admin",
+        "session": session_data,
+        "kept": len(history),
+        "capacity": SERVER_TIMING_HISTORY,
+        "timing_table": html_table(rows, id="timing_table") if rows else "",
+        "hide_footer": True,
+    }
+    return TemplateResponse("admin/timing.html", results)
+
+
+@router.get("/admin/profiles/")
+async def profile_list(request: Request, session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to list the stored request profiles, see website.profiler for taking one
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_admin:
+        error = {"error": "user doesnt have permission"}
+        return await return_error(request, error)
+
+    rows = [{
+        "profile": f'<a href="/admin/profiles/{profile.id}">{profile.id}</a>',
+        "time": profile.time,
+        "method": profile.method,
+        "path": html.escape(profile.path),
+        "mode": profile.mode,
+        "status": profile.status,
+        "duration_ms": profile.duration_ms,
+        "samples": profile.samples,
+    } for profile in profiles.list()]
+
+    results = {
+        "request": request,
+        "current_page": "admin",
+        "session": session_data,
+        "profiles_table": html_table(rows, id="profiles_table") if rows else "",
+        "hide_footer": True,
+    }
+    return TemplateResponse("admin/profiles.html", results)
+
+
+@router.get("/admin/profiles/{profile_id}")
+async def profile_get(request: Request, profile_id: int, session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to get a stored request profile, as collapsed stacks or the HTML report
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_admin:
+        error = {"error": "user doesnt have permission"}
+        return await return_error(request, error)
+
+    profile = profiles.get(profile_id)
+    if profile is None:
+        return await return_error(request, {"error": f"profile {profile_id} is no longer stored"})
+    return profile.response()
+
+
+def _memory_structures() -> list[tuple]:
+    """
+    The structures of the memory report, in the order shared objects are attributed to them.
+
+    The lists of matches, titles, contestants and divisions are the boundaries between them, see website.memory.
+    """
+    db = get_db()
+    titles = getattr(db, "titles", [])
+    contestants = [contestant for division in db.divisions for contestant in division.contestants]
+    structures = [
+        ("matches", db.matches, len(db.matches)),
+        ("titles", titles, len(titles)),
+        ("contestants", contestants, len(contestants)),
+        ("divisions", db.divisions, len(db.divisions)),
+        ("database (other)", db, None),
+    ]
+    structures += [(name, structure, None) for name, structure in db_holder.built().items()]
+    structures += [
+        ("sessions", backend, len(backend)),
+        ("discord roles", discord_roles._entries, len(discord_roles._entries)),
+        ("rankings card", rankings_card, None),
+        ("request timing", history, len(history)),
+        ("profiles", profiles, len(profiles.list())),
+    ]
+    return structures
+
+
+def _memory_page(request: Request, session_data: SessionData, tables: list[tuple[str, str]]):
+    snapshot_rows = [{
+        "snapshot": snapshot.id,
+        "time": snapshot.time,
+        "generation": snapshot.generation,
+        "rss_kib": snapshot.memory.get("Rss", ""),
+        "diff": f'<a href="/admin/memory/diff/{previous.id}/{snapshot.id}">against {previous.id}</a>' if previous else "",
+    } for snapshot, previous in zip(memory.snapshots.list(), [*memory.snapshots.list()[1:], None])]
+
+    results = {
+        "request": request,
+        "current_page": "admin",
+        "session": session_data,
+        "tracing": tracemalloc.is_tracing(),
+        "tables": tables,
+        "snapshots_table": html_table(snapshot_rows, id="snapshots_table") if snapshot_rows else "",
+        "hide_footer": True,
+    }
+    return TemplateResponse("admin/memory.html", results)
+
+
+@router.get("/admin/memory/")
+async def memory_report(request: Request, session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to show the RSS, the deep sizes of the database and caches and the top allocators
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_admin:
+        error = {"error": "user doesnt have permission"}
+        return await return_error(request, error)
+
+    structures = await run_in_threadpool(memory.measure, _memory_structures())
+    allocators = await run_in_threadpool(memory.top_allocators)
+    rows = [{"structure": size.name, "kib": size.kib, "objects": size.objects, "items": size.items or "",
+             "per_item_kib": size.per_item_kib or ""} for size in structures]
+    for row in allocators:
+        row["site"] = html.escape(row["site"])
+
+    tables = [("Process (KiB)", html_table(worker_memory() or {"Rss": "unavailable"}, id="process_table"))]
+    tables.append(("Structures", html_table(rows, id="structures_table")))
+    if allocators:
+        tables.append(("Top allocators", html_table(allocators, id="allocators_table")))
+    return _memory_page(request, session_data, tables)
+
+
+@router.get("/admin/memory/snapshot")
+async def memory_snapshot(request: Request, session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to take a memory snapshot, starting tracemalloc if it is not running
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_admin:
+        error = {"error": "user doesnt have permission"}
+        return await return_error(request, error)
+
+    await run_in_threadpool(memory.take_snapshot, _memory_structures(), db_holder.generation)
+    return RedirectResponse(url="/admin/memory/")
+
+
+@router.get("/admin/memory/diff/{first_id}/{second_id}")
+async def memory_diff(request: Request, first_id: int, second_id: int,
+                      session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to show what changed between two memory snapshots
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_admin:
+        error = {"error": "user doesnt have permission"}
+        return await return_error(request, error)
+
+    first, second = memory.snapshots.get(first_id), memory.snapshots.get(second_id)
+    if first is None or second is None:
+        return await return_error(request, {"error": "snapshot is no longer stored"})
+
+    changes = await run_in_threadpool(memory.diff, first, second)
+    for row in changes["allocators"]:
+        row["site"] = html.escape(row["site"])
+    captions = {"memory": "Process (KiB)", "structures": "Structures", "types": "Object types",
+                "allocators": "Allocators"}
+    tables = [(f"{captions[key]}, snapshot {first_id} to {second_id}", html_table(rows, id=f"{key}_table"))
+              for key, rows in changes.items() if rows]
+    return _memory_page(request, session_data, tables)
+
+
+@router.get("/admin/memory/tracing/stop")
+async def memory_tracing_stop(request: Request, session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to stop tracemalloc and drop the snapshots
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_admin:
+        error = {"error": "user doesnt have permission"}
+        return await return_error(request, error)
+
+    memory.stop_tracing()
+    return RedirectResponse(url="/admin/memory/")
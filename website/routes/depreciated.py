@@ -73,35 +73,6 @@ async def matchups_get_wrestlers_stats(request: Request, division: str, name1: s
     return {"wrestlers": table}
 
 
-@app.get("/generate_screenshot")
-async def take_screenshot(request: Request):
-    # Get the server's base URL dynamically
-    base_url = str(request.base_url)
-
-    # Construct the relative route
-    relative_route = "/rankings"
-
-    # Construct the complete URL to load
-    url = base_url + relative_route
-
-    # Configure Selenium WebDriver
-    driver_service = Service("chromedriver.exe")  # Replace with the actual path to your chromedriver executable
-    driver = webdriver.Chrome(service=driver_service)
-
-    # Load the URL in the WebDriver
-    driver.get("http://10.0.30.1/rankings")
-
-    # Take a screenshot
-    screenshot_path = "screenshot.png"  # Replace with the desired path to save the screenshot
-    driver.save_screenshot(screenshot_path)
-
-    # Close the WebDriver
-    driver.quit()
-
-    # Send the screenshot as a download
-    return FileResponse(screenshot_path, filename="screenshot.png")
-
-
 @router.get("/w/{current_wrestler}/{new_wrestler}/")
 async def get_wrestler_matchup(request: Request, current_wrestler: str, new_wrestler: str,
                                session_info: dict = Depends(get_session_info)):
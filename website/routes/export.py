@@ -0,0 +1,119 @@
+"""
+Module: export.py
+
+This module contains API endpoints for downloading match history and stats as CSV, NDJSON or Parquet.
+
+The responses are streamed, see website.export. At most a few downloads run at once per worker,
+see website.admission.
+
+Query Parameters:
+    - format: csv (default), ndjson or parquet. Parquet needs the optional pyarrow package, without it
+      the endpoints answer 501.
+    - columns: Comma separated columns to include, all by default.
+
+API Endpoints:
+    - /export/matches: Download the match history, filtered by `start`, `end` (YYYY-MM-DD) and `division`.
+    - /export/stats/{wrestler_division}/{year_key}/{mmr_key}/{stat_division}: Download a stats table.
+"""
+from datetime import date
+from typing import Iterator, Optional
+
+from fastapi import APIRouter
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
+
+from website import export
+from website.admission import limiters, Slot
+from website.resources import (Depends, get_db, get_stats_cube, HTTPException, PERMISSION_ERROR, Request,
+                               return_error, SessionData)
+from website.session import get_session_info
+
+router = APIRouter()
+
+
+async def _stream(rows: Iterator[dict], columns: Optional[str], fmt: str, filename: str,
+                  types: Optional[dict[str, type]] = None) -> StreamingResponse:
+    """
+    Project and encode the rows into a streaming download.
+
+    The download holds a slot of the exports limiter until it is sent or the client disconnects.
+
+    Args:
+        rows (Iterator[dict]): The rows.
+        columns (Optional[str]): Comma separated columns to include.
+        fmt (str): The export format.
+        filename (str): Download file name without extension.
+        types (Optional[dict[str, type]]): Known column types, see website.export.encode.
+
+    Raises:
+        HTTPException: 400 for an unknown format, column or division, 501 for parquet without pyarrow,
+            429 or 503 when too many downloads are running.
+    """
+    if fmt not in export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"unknown format {fmt}")
+    if fmt == "parquet" and export.pyarrow is None:
+        raise HTTPException(status_code=501, detail="parquet export needs the optional pyarrow package")
+
+    slot = await limiters["exports"].acquire()
+    try:
+        # Reads the first row, errors in the filters surface here instead of halfway through the response
+        column_list, projected = export.project(rows, columns.split(",") if columns else None)
+        chunks = export.encode(projected, column_list, fmt, types)
+    except ValueError as e:
+        slot.release()
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        slot.release()
+        raise
+
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    return StreamingResponse(_holding(slot, chunks), media_type=export.MEDIA_TYPES[fmt], headers=headers,
+                             background=BackgroundTask(slot.release))
+
+
+def _holding(slot: Slot, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Pass the chunks through, releasing the slot if encoding fails or the stream is closed early."""
+    try:
+        yield from chunks
+    finally:
+        slot.release()
+
+
+@router.get("/export/matches")
+async def export_matches(request: Request, format: str = "csv", columns: Optional[str] = None,
+                         start: Optional[date] = None, end: Optional[date] = None, division: Optional[str] = None,
+                         session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to download the match history.
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_admin:
+        return await return_error(request, PERMISSION_ERROR)
+
+    rows = export.match_rows(get_db(), start, end, division)
+    return await _stream(rows, columns, format, "matches", export.MATCH_TYPES)
+
+
+@router.get("/export/stats/{wrestler_division}/{year_key}/{mmr_key}/{stat_division}")
+async def export_stats(request: Request, wrestler_division, year_key, mmr_key, stat_division,
+                       format: str = "csv", columns: Optional[str] = None,
+                       session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to download a stats table.
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_user:
+        return await return_error(request, PERMISSION_ERROR)
+
+    try:
+        rows = get_stats_cube().table(wrestler_division, year_key, mmr_key, stat_division).rows()
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+    filename = f"stats_{wrestler_division}_{year_key}_{mmr_key}_{stat_division}"
+    return await _stream(rows, columns, format, filename)
@@ -27,7 +27,7 @@ from fastapi import APIRouter
 from starlette.responses import RedirectResponse
 
 from website import sql_db
-from website.resources import (db, Depends, html_table, PERMISSION_ERROR, RANKINGS_USER, Request,
+from website.resources import (Depends, get_db, html_table, PERMISSION_ERROR, RANKINGS_USER, Request,
                                return_error, SessionData, TemplateResponse)
 from website.session import get_session_info
 
@@ -77,6 +77,7 @@ async def fanhub_rankings(request: Request, session_info: dict = Depends(get_ses
         return TemplateResponse("fanhub/power_rankings/current.html", results)
 
     # Get wrestler lists
+    db = get_db()
     divisions: dict[str, dict[str, list[Union[str, dict[str, str]]]]] = db.api_fanhub_wrestler_list()
 
     results.update({
@@ -138,6 +139,7 @@ async def fanhub_submit(request: Request, session_info: dict = Depends(get_sessi
         })
     sql.close()
 
+    db = get_db()
     divisions: dict[str, dict[str, list[Union[str, dict[str, str]]]]] = db.api_fanhub_wrestler_list()
 
     results.update({"divisions": divisions})
@@ -181,6 +183,7 @@ async def fanhub_results(request: Request, session_info: dict = Depends(get_sess
     if not session_data.fanhub_elite:
         return await return_error(request, PERMISSION_ERROR)
 
+    db = get_db()
     sql = sql_db.SQLDatabase()
     submissions: dict[str, dict[str, str]] = {}
     total_points: dict[str, dict[str, dict[str, int]]] = {}
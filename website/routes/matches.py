@@ -0,0 +1,71 @@
+"""
+Module: matches.py
+
+This module contains the API endpoint for paging through the match history.
+
+The rows come from the columnar match store (website.match_store), a request only converts the
+matches of the requested page.
+
+API Endpoints:
+    - /matches/data: Filtered page of matches as JSON. Matches of one contestant (`contestant`) need
+      web_user, the full history needs web_admin like /admin/matches/.
+"""
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter
+from starlette.responses import JSONResponse
+
+from website.resources import Depends, get_match_store, PERMISSION_ERROR, Request, return_error, SessionData
+from website.session import get_session_info
+
+router = APIRouter()
+
+MAX_PAGE_SIZE = 500
+
+
+@router.get("/matches/data")
+async def match_data(request: Request, offset: int = 0, limit: int = 50, order: str = "desc",
+                     start: Optional[date] = None, end: Optional[date] = None, contestant: Optional[str] = None,
+                     division: Optional[str] = None, title: Optional[str] = None, q: Optional[str] = None,
+                     draw: Optional[int] = None, session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to get a filtered page of matches.
+
+    Args:
+        request (Request): The request object.
+        offset (int): Rows to skip.
+        limit (int): Rows to return, at most MAX_PAGE_SIZE.
+        order (str): "desc" for newest first, "asc" for oldest first.
+        start (Optional[date]): First date to include.
+        end (Optional[date]): Last date to include.
+        contestant (Optional[str]): Only matches of this contestant, adds their result and MMR change.
+        division (Optional[str]): Only matches with a contestant of this division.
+        title (Optional[str]): Only matches for this title.
+        q (Optional[str]): Text the event or a participant name must contain.
+        draw (Optional[int]): Request counter of the DataTables client, returned unchanged.
+        session_info (dict): Information about the current session.
+
+    Returns:
+        JSONResponse: draw, total and filtered match counts and the rows of the page.
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not (session_data.web_admin or (contestant and session_data.web_user)):
+        return await return_error(request, PERMISSION_ERROR)
+
+    store = get_match_store()
+    indices = store.filter(start, end, contestant, division, title, q)
+    limit = min(max(limit, 0), MAX_PAGE_SIZE)
+    rows = store.page(indices, max(offset, 0), limit, order != "asc", contestant)
+
+    # DataTables shows "filtered from <total>", for one contestant that is their match count
+    total = len(store.filter(contestant=contestant)) if contestant else len(store)
+    return JSONResponse({
+        "draw": draw,
+        "total": total,
+        "filtered": len(indices),
+        "rows": rows,
+    })
@@ -0,0 +1,106 @@
+"""
+Module: metrics.py
+
+This module contains the endpoint exposing the in-process metrics in the Prometheus text format.
+
+Besides the request metrics recorded by website.metrics.MetricsMiddleware, the scrape reads the
+session store, the credential and session token caches, the Discord role cache, the admission
+limiters and the database holder.
+
+Environment Variables:
+    - METRICS_ALLOWED_IPS: Comma separated client IPs that may scrape without a session,
+      defaults to localhost.
+
+API Endpoints:
+    - /metrics: The metrics of this worker, for allowed IPs and web_admin sessions.
+"""
+import os
+
+from fastapi import APIRouter
+from starlette.responses import PlainTextResponse
+
+from website import metrics
+from website.admission import limiters, single_flight
+from website.resources import (authenticator, db_holder, Depends, discord_roles, PERMISSION_ERROR, Request,
+                               return_error, SessionData)
+from website.session import backend, get_session_info, token_signer
+
+router = APIRouter()
+
+METRICS_ALLOWED_IPS = {ip.strip() for ip in os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")}
+# PlainTextResponse appends the charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# Keys of backend.stats() that are levels, the others only grow
+SESSION_GAUGES = {"live", "max_entries", "pending_renewals"}
+
+
+def _sessions() -> list[metrics.Family]:
+    return [
+        (f"sessions_{key}" if key in SESSION_GAUGES else f"sessions_{key}_total",
+         "gauge" if key in SESSION_GAUGES else "counter", f"Session store {key.replace('_', ' ')}.", [({}, value)])
+        for key, value in backend.stats().items()
+    ]
+
+
+def _caches() -> list[metrics.Family]:
+    lookups = [
+        ({"cache": "basic_auth", "result": "hit"}, authenticator.cache_hits),
+        ({"cache": "basic_auth", "result": "miss"}, authenticator.cache_misses),
+    ]
+    if token_signer is not None:
+        info = token_signer.cache_info()
+        lookups += [
+            ({"cache": "session_token", "result": "hit"}, info.hits),
+            ({"cache": "session_token", "result": "miss"}, info.misses),
+        ]
+    return [
+        ("cache_lookups_total", "counter", "Cache lookups by cache and result.", lookups),
+        ("discord_role_cache_entries", "gauge", "Discord users with cached roles.", [({}, len(discord_roles))]),
+    ]
+
+
+def _admission() -> list[metrics.Family]:
+    groups = list(limiters.values())
+    return [
+        ("admission_running", "gauge", "Requests holding a slot, by group.",
+         [({"group": limiter.name}, limiter.running) for limiter in groups]),
+        ("admission_waiting", "gauge", "Requests waiting for a slot, by group.",
+         [({"group": limiter.name}, limiter.waiting) for limiter in groups]),
+        ("admission_requests_total", "counter", "Requests by group and outcome.",
+         [({"group": limiter.name, "outcome": outcome}, getattr(limiter, outcome))
+          for limiter in groups for outcome in ("admitted", "rejected", "timed_out")]),
+        ("single_flight_calls_total", "counter", "Expensive computations started or joined.",
+         [({"result": "started"}, single_flight.started), ({"result": "coalesced"}, single_flight.coalesced)]),
+    ]
+
+
+def _database() -> list[metrics.Family]:
+    status = db_holder.status()
+    return [
+        ("database_ready", "gauge", "1 once the database is loaded.", [({}, int(status["ready"]))]),
+        ("database_generation", "counter", "Database loads since startup.", [({}, status["generation"])]),
+        ("database_build_seconds", "gauge", "Duration of the last database build.",
+         [({}, status["last_duration_seconds"] or 0)]),
+    ]
+
+
+for collector in (_sessions, _caches, _admission, _database):
+    metrics.registry.add_collector(collector)
+
+
+@router.get("/metrics")
+async def get_metrics(request: Request, session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to scrape the metrics of this worker.
+
+    Clients from METRICS_ALLOWED_IPS need no session, everyone else needs web_admin.
+    """
+    if request.client is None or request.client.host not in METRICS_ALLOWED_IPS:
+        if session_info["error"] is not None:
+            return await return_error(request, session_info["error"])
+
+        session_data: SessionData = session_info["data"]
+        if not session_data.web_admin:
+            return await return_error(request, PERMISSION_ERROR)
+
+    return PlainTextResponse(metrics.registry.render(), media_type=CONTENT_TYPE)
@@ -7,23 +7,42 @@ API Endpoints:
     - /rankings: Retrieve and display the top 10 rankings.
     - /rankings/cards: Retrieve and display rankings for recently wrestled cards.
     - /rankings/extended: Retrieve and display extended rankings.
+    - /rankings/card.png: Retrieve the top 10 rankings as a shareable PNG.
+    - /api/rankings: Retrieve the rankings as of a date as JSON.
+    - /api/rankings/diff: Retrieve the rank and MMR changes between two dates as JSON.
+    - /api/mmr_history: Retrieve the MMR over time of one or more contestants as JSON, downsampled.
     - /stats: Retrieve and display stats selector.
     - /stats/{wrestler_division}/{year_key}/{mmr_key}/{stat_division}:
         Retrieve and display stats for specific parameters.
+    - /stats/data/{wrestler_division}/{year_key}/{mmr_key}/{stat_division}:
+        Retrieve stats for specific parameters as JSON, sorted and filtered.
     - /graphs: Retrieve and display graph selector.
     - /graphs_stat/{wrestler_division}/{stat_key}/{division_key}/{winless}: Retrieve and display stat graphs.
     - /graphs_mmr/{wrestler_division}/{mmr_type}/{division_key}/{stat_key}/{winless}: Retrieve and display mmr graphs.
+
+Graphs and stats queries run in the thread pool under the limits of website.admission, identical
+concurrent requests share one computation.
 """
-from fastapi import APIRouter
+import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Query
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
 
-from website.resources import (Any, db, Depends, HTTPException, PERMISSION_ERROR, Request,
-                               return_error, SessionData, TemplateResponse)
+from website.resources import (Any, Depends, get_db, get_rank_history, get_stats_cube, HTTPException, PERMISSION_ERROR, Request,
+                               rankings_card, return_error, SessionData, TemplateResponse)
+from website.admission import request_key, run_expensive
 from website.session import get_session_info
 from website.util import html_table
-import website.util_matlib as matlib
 
 router = APIRouter()
 
+CHART_POINTS = 500
+MAX_CHART_POINTS = 2000
+MAX_CHART_CONTESTANTS = 10
+CARD_MAX_AGE = 300
+
 
 @router.get("/rankings")
 async def top_10_rankings(request: Request, session_info: dict = Depends(get_session_info)):
@@ -32,6 +51,7 @@ async def top_10_rankings(request: Request, session_info: dict = Depends(get_ses
     """
     session_data: SessionData = session_info["data"]
 
+    db = get_db()
     output: dict[str, Any] = db.api_rankings_top_10()
     for key, value in output.items():
         output[key] = html_table(value)
@@ -49,6 +69,20 @@ async def top_10_rankings(request: Request, session_info: dict = Depends(get_ses
     return TemplateResponse("stats/rankings.html", results)
 
 
+@router.get("/rankings/card.png")
+async def top_10_rankings_card(request: Request):
+    """
+    Endpoint to retrieve the top 10 rankings as a PNG.
+
+    The image is rendered once per rankings update, clients revalidate it with its ETag.
+    """
+    png, etag = await run_in_threadpool(rankings_card.get, get_db())
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={CARD_MAX_AGE}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(png, media_type="image/png", headers=headers)
+
+
 @router.get("/rankings/cards")
 async def recently_wrestled(request: Request, session_info: dict = Depends(get_session_info)):
     """
@@ -61,6 +95,7 @@ async def recently_wrestled(request: Request, session_info: dict = Depends(get_s
     if not session_data.web_user:
         return await return_error(request, PERMISSION_ERROR)
 
+    db = get_db()
     output: dict[str, Any] = db.api_rankings_recent_cards()
     for event, wrestlers in output.items():
         wrestlers_api = [{**wrestler.api_ranking_cards()} for wrestler in wrestlers]
@@ -93,6 +128,7 @@ async def extended_rankings(request: Request, session_info: dict = Depends(get_s
     if not session_data.web_user:
         return await return_error(request, PERMISSION_ERROR)
 
+    db = get_db()
     divisions = db.api_rankings_extended()
 
     results = {
@@ -105,6 +141,120 @@ async def extended_rankings(request: Request, session_info: dict = Depends(get_s
     return TemplateResponse("stats/rankings_extended.html", results)
 
 
+@router.get("/api/rankings")
+async def rankings_as_of(request: Request, date: Optional[datetime.date] = None, division: Optional[str] = None,
+                         mmr: Optional[str] = None, limit: int = Query(10, ge=0),
+                         session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to retrieve the rankings as of a date.
+
+    Args:
+        request (Request): The request object.
+        date (Optional[date]): Date (YYYY-MM-DD) to rank at the end of, today if None.
+        division (Optional[str]): Division abbreviation, all contestants if None.
+        mmr (Optional[str]): Rank history MMR key, e.g. solo_mmr, the first available if None.
+        limit (int): Number of ranks to return.
+        session_info (dict): Information about the current session.
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_user:
+        return await return_error(request, PERMISSION_ERROR)
+
+    history = get_rank_history()
+    date = date or datetime.date.today()
+    try:
+        rankings = history.rankings(date, division, mmr, limit)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+
+    return JSONResponse({
+        "date": date.isoformat(),
+        "division": division,
+        "mmr": mmr or history.default_key,
+        "rankings": rankings,
+    })
+
+
+@router.get("/api/rankings/diff")
+async def rankings_diff(request: Request, start: datetime.date, end: Optional[datetime.date] = None,
+                        division: Optional[str] = None, mmr: Optional[str] = None,
+                        limit: Optional[int] = Query(None, ge=0), session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to retrieve the rank and MMR changes between two dates.
+
+    Args:
+        request (Request): The request object.
+        start (date): Earlier date (YYYY-MM-DD).
+        end (Optional[date]): Later date (YYYY-MM-DD), today if None.
+        division (Optional[str]): Division abbreviation, all contestants if None.
+        mmr (Optional[str]): Rank history MMR key, e.g. solo_mmr, the first available if None.
+        limit (Optional[int]): Number of ranks at `end` to return, all if None.
+        session_info (dict): Information about the current session.
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_user:
+        return await return_error(request, PERMISSION_ERROR)
+
+    history = get_rank_history()
+    end = end or datetime.date.today()
+    try:
+        changes = history.rank_changes(start, end, division, mmr, limit)
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+
+    return JSONResponse({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "division": division,
+        "mmr": mmr or history.default_key,
+        "changes": changes,
+    })
+
+
+@router.get("/api/mmr_history")
+async def mmr_history(request: Request, contestant: list[str] = Query([]), mmr: Optional[str] = None,
+                      points: int = CHART_POINTS, session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to retrieve the MMR over time of contestants for the MMR chart.
+
+    Args:
+        request (Request): The request object.
+        contestant (list[str]): Contestant names, repeat the parameter to overlay several, at most
+            MAX_CHART_CONTESTANTS.
+        mmr (Optional[str]): Rank history MMR key, e.g. solo_mmr, the first available if None.
+        points (int): Point budget per contestant, at most MAX_CHART_POINTS.
+        session_info (dict): Information about the current session.
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_user:
+        return await return_error(request, PERMISSION_ERROR)
+
+    if not 0 < len(contestant) <= MAX_CHART_CONTESTANTS:
+        raise HTTPException(status_code=400, detail=f"give 1 to {MAX_CHART_CONTESTANTS} contestants")
+
+    history = get_rank_history()
+    points = min(max(points, 3), MAX_CHART_POINTS)
+    try:
+        series = [history.trajectory(name, mmr, points) for name in dict.fromkeys(contestant)]
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+
+    return JSONResponse({
+        "mmr": mmr or history.default_key,
+        "points": points,
+        "series": series,
+    })
+
+
 @router.get("/stats/")
 async def stats_selector(request: Request, session_info: dict = Depends(get_session_info)):
     """
@@ -117,11 +267,11 @@ async def stats_selector(request: Request, session_info: dict = Depends(get_sess
     if not session_data.web_user:
         return await return_error(request, PERMISSION_ERROR)
 
-    divisions, years, mmr_keys, division_keys = db.api_stats_keys()
-
-    initial = await get_stats(request, divisions[0], years[0], mmr_keys[0], division_keys[0], session_info)
-    initial = initial.body.decode('utf-8')
+    cube = get_stats_cube()
+    divisions, years, mmr_keys, division_keys = cube.keys
+    initial = cube.initial()
 
+    # The initial table is rendered while the cube is built, stats.html includes stats_get.html with it
     results = {
         "request": request,
         "current_page": "stats",
@@ -130,7 +280,8 @@ async def stats_selector(request: Request, session_info: dict = Depends(get_sess
         "years": years,
         "mmr_keys": mmr_keys,
         "division_keys": division_keys,
-        "initial": initial,
+        "division": get_db().get_division(divisions[0]),
+        "output": initial.html if initial is not None else "",
     }
     return TemplateResponse("stats/stats.html", results)
 
@@ -156,23 +307,83 @@ async def get_stats(request: Request, wrestler_division, year_key, mmr_key, stat
     if not session_data.web_user:
         return await return_error(request, PERMISSION_ERROR)
 
-    division = db.get_division(wrestler_division)
+    division = get_db().get_division(wrestler_division)
     if not division:
         raise HTTPException(status_code=404, detail=f"{wrestler_division} not found")
 
-    stats = db.api_stats_get(wrestler_division, year_key, mmr_key, stat_division)
-    stats = html_table(stats, "stats_table")
+    try:
+        table = get_stats_cube().table(wrestler_division, year_key, mmr_key, stat_division)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
 
     results = {
         "request": request,
         "current_page": "stats",
         "session": session_data,
         "division": division,
-        "output": stats,
+        "output": table.html,
     }
     return TemplateResponse("stats/stats_get.html", results)
 
 
+@router.get("/stats/data/{wrestler_division}/{year_key}/{mmr_key}/{stat_division}")
+async def get_stats_data(request: Request, wrestler_division, year_key, mmr_key, stat_division,
+                         sort: Optional[str] = None, order: str = "desc", q: Optional[str] = None,
+                         range_filters: list[str] = Query([], alias="range"), offset: int = Query(0, ge=0),
+                         limit: Optional[int] = Query(None, ge=0),
+                         session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to retrieve a sorted and filtered stats table as JSON.
+
+    Args:
+        request (Request): The request object.
+        wrestler_division: Division of the wrestler.
+        year_key: Specific year key.
+        mmr_key: Specific mmr key.
+        stat_division: Specific stat division.
+        sort (Optional[str]): Column to sort by.
+        order (str): "desc" or "asc".
+        q (Optional[str]): Text any text column must contain.
+        range_filters (list[str]): `range` query parameters, numeric filters as column:min:max,
+            either bound may be empty.
+        offset (int): Rows to skip.
+        limit (Optional[int]): Maximum number of rows.
+        session_info (dict): Information about the current session.
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_user:
+        return await return_error(request, PERMISSION_ERROR)
+
+    try:
+        table = get_stats_cube().table(wrestler_division, year_key, mmr_key, stat_division)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+    def select() -> dict[str, Any]:
+        ranges = {}
+        for value in range_filters:
+            column, low, high = value.rsplit(":", 2)
+            ranges[column] = (float(low) if low else None, float(high) if high else None)
+        indices = table.select(sort, order != "asc", q, ranges)
+        page = indices[offset:offset + limit if limit is not None else None]
+        return {
+            "columns": table.columns,
+            "total": len(table),
+            "filtered": len(indices),
+            "rows": list(table.rows(page)),
+        }
+
+    try:
+        # Identical queries share one selection, the table of a reload is a different table
+        output = await run_expensive("stats", (request_key(request), id(table)), select)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(output)
+
+
 @router.get("/graphs/")
 async def graph_selector(request: Request, session_info: dict = Depends(get_session_info)):
     """
@@ -192,7 +403,7 @@ async def graph_selector(request: Request, session_info: dict = Depends(get_sess
      mmr_divisions,
      mmr_graph_keys,
      mmr_division_keys
-     ) = db.api_graphs_keys()
+     ) = get_db().api_graphs_keys()
 
     results = {
         "request": request,
@@ -230,12 +441,17 @@ async def get_stat_graphs(request: Request, wrestler_division, stat_key, divisio
     if not session_data.web_user:
         return await return_error(request, PERMISSION_ERROR)
 
+    db = get_db()
     division = db.get_division(wrestler_division)
     if not division:
         raise HTTPException(status_code=404, detail=f"{wrestler_division} not found")
 
+    # Matplotlib is slow to import, only load it when a graph is requested
+    import website.util_matlib as matlib
+
     include_winless = True if winless == "on" else False
-    graphs = matlib.api_graphs(division, division_key, stat_key, include_winless)
+    graphs = await run_expensive("graphs", request_key(request), matlib.api_graphs,
+                                 division, division_key, stat_key, include_winless)
 
     results = {
         "request": request,
@@ -268,12 +484,17 @@ async def get_mmr_graphs(request: Request, wrestler_division, mmr_type, division
     if not session_data.web_user:
         return await return_error(request, PERMISSION_ERROR)
 
+    db = get_db()
     division = db.get_division(wrestler_division)
     if not division:
         raise HTTPException(status_code=404, detail=f"{wrestler_division} not found")
 
+    # Matplotlib is slow to import, only load it when a graph is requested
+    import website.util_matlib as matlib
+
     include_winless = True if winless == "on" else False
-    graphs_html = matlib.api_mmr_graphs(division, mmr_type, division_key, stat_key, include_winless)
+    graphs_html = await run_expensive("graphs", request_key(request), matlib.api_mmr_graphs,
+                                      division, mmr_type, division_key, stat_key, include_winless)
 
     results = {
         "request": request,
@@ -6,11 +6,19 @@ This module contains endpoints for displaying titles and information about speci
 API Endpoints:
     - /titles: Retrieve and display a list of titles.
     - /titles/{title_name}: Retrieve and display information for a specific title.
+    - /api/titles/{title_name}/holder: Retrieve the champion on a date as JSON.
+    - /api/titles/{title_name}/days: Retrieve the days every holder held a title in a date range as JSON.
+
+The pages are rendered once per database load and the point-in-time queries use the reign index,
+see website.title_index.
 """
+import datetime
+from typing import Optional
 
 from fastapi import APIRouter
+from starlette.responses import JSONResponse
 
-from website.resources import (db, Depends, HTTPException, html_table, PERMISSION_ERROR, Request,
+from website.resources import (Depends, get_db, get_title_index, HTTPException, PERMISSION_ERROR, Request,
                                return_error, SessionData, TemplateResponse)
 from website.session import get_session_info
 
@@ -29,18 +37,11 @@ async def get_titles(request: Request, session_info: dict = Depends(get_session_
     if not session_data.web_user:
         return await return_error(request, PERMISSION_ERROR)
 
-    titles, reigns, owners = db.api_titles()
-    titles = html_table(titles, id="titles_table")
-    reigns = html_table(reigns, id="reigns_table")
-    owners = html_table(owners, id="owners_table")
-
     results = {
         "request": request,
         "current_page": "titles",
         "session": session_data,
-        "titles": titles,
-        "reigns": reigns,
-        "owners": owners,
+        **get_title_index().titles_html,
     }
     return TemplateResponse("titles/titles.html", results)
 
@@ -62,21 +63,73 @@ async def get_title(request: Request, title_name, session_info: dict = Depends(g
     if not session_data.web_user:
         return await return_error(request, PERMISSION_ERROR)
 
-    title = db.get_title(title_name)
-    if title is None:
+    db = get_db()
+    page = get_title_index().page(db, title_name)
+    if page is None:
         raise HTTPException(status_code=404, detail=f"{title_name} not found")
 
-    owners, matches = title.api_title()
-    owners = html_table(owners, id="owners_table")
-    matches = html_table(matches, id="matches_table")
-
     results = {
         "request": request,
         "current_page": "titles",
         "session": session_data,
-        "name": title.name,
-        "championship": title.championship,
-        "owners": owners,
-        "matches": matches,
+        **page,
     }
     return TemplateResponse("titles/title.html", results)
+
+
+@router.get("/api/titles/{title_name}/holder")
+async def title_holder(request: Request, title_name, date: Optional[datetime.date] = None,
+                       session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to retrieve the champion on a date.
+
+    Args:
+        request (Request): The request object.
+        title_name (str): The title.
+        date (Optional[date]): The date (YYYY-MM-DD), today if None.
+        session_info (dict): Information about the current session.
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_user:
+        return await return_error(request, PERMISSION_ERROR)
+
+    date = date or datetime.date.today()
+    try:
+        reign = get_title_index().reigns(title_name).holder_on(date)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+
+    return JSONResponse({"title": title_name, "date": date.isoformat(), "reign": reign})
+
+
+@router.get("/api/titles/{title_name}/days")
+async def title_days(request: Request, title_name, start: datetime.date, end: Optional[datetime.date] = None,
+                     session_info: dict = Depends(get_session_info)):
+    """
+    Endpoint to retrieve the days every holder held a title in a date range.
+
+    Args:
+        request (Request): The request object.
+        title_name (str): The title.
+        start (date): First date (YYYY-MM-DD).
+        end (Optional[date]): Last date (YYYY-MM-DD), today if None.
+        session_info (dict): Information about the current session.
+    """
+    if session_info["error"] is not None:
+        return await return_error(request, session_info["error"])
+
+    session_data: SessionData = session_info["data"]
+    if not session_data.web_user:
+        return await return_error(request, PERMISSION_ERROR)
+
+    end = end or datetime.date.today()
+    try:
+        holders = get_title_index().reigns(title_name).days_held(start, end)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+
+    return JSONResponse({"title": title_name, "start": start.isoformat(), "end": end.isoformat(),
+                         "holders": holders})
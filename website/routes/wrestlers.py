@@ -15,7 +15,8 @@ from datetime import datetime
 from urllib.parse import unquote
 from mmr_database.division import Division
 
-from website.resources import db, Depends, PERMISSION_ERROR, Request, return_error, SessionData, TemplateResponse
+from website.resources import (db_holder, Depends, get_db, PERMISSION_ERROR, Request, return_error, SessionData,
+                               TemplateResponse)
 from fastapi import APIRouter
 
 from website.session import get_session_info
@@ -41,6 +42,7 @@ async def get_wrestlers(request: Request, abr: str, session_info: dict = Depends
     if not session_data.web_user:
         return await return_error(request, PERMISSION_ERROR)
 
+    db = get_db()
     division: Division = db.get_division(abr)
 
     output = {
@@ -85,6 +87,7 @@ async def get_wrestler(request: Request, name, session_info: dict = Depends(get_
         name = name + "? " + str(query_params)
 
     contestant, division = None, None
+    db = get_db()
     for d in db.divisions:
         contestant = db.get_contestant(d, name)
         if contestant:
@@ -95,17 +98,17 @@ async def get_wrestler(request: Request, name, session_info: dict = Depends(get_
 
     all_contestants = sorted(division.contestants, key=lambda c: c.mmr_dict[c.main_mmr_keys[0]], reverse=True)
 
-    api_stats = contestant.api_wrestlers()
+    # Shared by every request of this load, read without modifying it. The match history table
+    # loads its rows from /matches/data, so match_history is left out.
+    history = db_holder.derived("wrestler_histories")[str(contestant)]
+    api_stats = {key: value for key, value in history.items() if key != "match_history"}
     stats_html = []
     for year, stat_block in api_stats["stats"].items():
-        if "name" in stat_block:
-            del stat_block["name"]
         stats = {"year": year}
-        stats.update(stat_block)
+        stats.update({key: value for key, value in stat_block.items() if key != "name"})
         # stats_html.append(util.html_table(stats))
         stats_html.append(stats)
     api_stats["stats_html"] = html_table(stats_html)  # stats_html
-    api_stats["match_history"] = html_table(api_stats["match_history"], id="match_history")
 
     record = ""
     if datetime.today().year in api_stats["stats"]:
@@ -120,6 +123,7 @@ async def get_wrestler(request: Request, name, session_info: dict = Depends(get_
         "datetime": datetime,
         "record": record,
         "all_time_record": all_time_record,
+        "contestant_name": str(contestant),
     }
     results.update(api_stats)
 
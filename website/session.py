@@ -7,12 +7,24 @@ It provides functions and classes to handle session information and verification
 
 Functions:
     - get_session_info: Get session information from the request.
+    - create_session: Store a new session and get the cookie value for it.
+    - revoke_session: End a session before it expires.
+    - session_cookie: Build the Set-Cookie header for a cookie value.
+    - restore_local_sessions: Load the sessions saved by /login on a local development server.
 
 Classes:
     - BasicVerifier: A session verifier implementation for basic session verification.
 
 Constants:
     - COOKIE_NAME: The name of the session cookie.
+    - COOKIE_MAX_AGE: Lifetime of the session cookie in seconds.
+    - SESSION_MODE: "backend" stores sessions in the backend and puts their UUID in the cookie,
+      "signed" puts the session data itself in a signed cookie (see website.session_tokens).
+      Revoked tokens are shared between workers through SESSION_DB, like the SQLite backend.
+    - GUEST_SESSION: Session data used for requests without a valid session.
+
+Global Variables:
+    - backend: The session backend, TTLBackend or SQLiteBackend depending on SESSION_BACKEND.
 
 Dependencies:
     - os
@@ -20,31 +32,47 @@ Dependencies:
     - dotenv
     - fastapi
     - fastapi_sessions
-    - Local modules: website.util, website.models
+    - Local modules: website.util, website.models, website.session_backends, website.session_tokens
 """
+import logging
 import os
+import re
 import uuid
 from typing import Union
 from uuid import UUID
 
 from dotenv import load_dotenv
 from fastapi import HTTPException, Request, Response
-from fastapi_sessions.backends.implementations import InMemoryBackend
+from fastapi_sessions.backends.session_backend import SessionBackend
 from fastapi_sessions.session_verifier import SessionVerifier
 from fastapi_sessions.frontends.implementations import SessionCookie, CookieParameters
+from starlette.concurrency import run_in_threadpool
 
 from website import util
 from website.models import SessionData
+from website.session_backends import create_backend, TTLBackend
+from website.session_tokens import SessionTokenSigner
 
 
 # Load environment variables
 load_dotenv()
 my_ip = os.environ.get("MY_IP")
-server_ip = util.get_public_IP()
 SECRET_KEY = os.environ.get("SECRET_KEY")
 
 # Constants
 COOKIE_NAME = "session_id"
+COOKIE_MAX_AGE = 1209600
+SESSION_MODE = os.environ.get("SESSION_MODE", "backend").lower()
+# Ids of signed tokens, see SessionTokenSigner.encode
+TOKEN_ID = re.compile(r"[A-Za-z0-9_-]{8}")
+GUEST_SESSION = SessionData(
+    username="guest",
+    web_user=False,
+    web_admin=False,
+    fanhub_user=False,
+    fanhub_elite=False,
+    fanhub_admin=False,
+)
 
 # Configuration for session cookie parameters
 cookie_params = CookieParameters()
@@ -59,12 +87,29 @@ cookie = SessionCookie(
 )
 
 # Initialize session backend
-backend = False
-# Load backend if local for development purposes
-if server_ip == my_ip:
-    backend = util.pickle_load("backend")
-if not backend:
-    backend = InMemoryBackend[UUID, SessionData]()
+backend = create_backend(SessionData)
+
+# Signer for SESSION_MODE=signed
+token_signer = (SessionTokenSigner(SECRET_KEY, max_age=COOKIE_MAX_AGE,
+                                   revocation_db=os.environ.get("SESSION_DB", "sessions.db"))
+                if SESSION_MODE == "signed" else None)
+
+
+def restore_local_sessions():
+    """
+    Load the in-memory sessions saved by /login if this is a local development server.
+
+    Called from the application lifespan rather than at import, finding out whether the server is
+    local probes the public IP. The SQLite backend persists on its own.
+    """
+    if not isinstance(backend, TTLBackend) or not my_ip or util.get_public_IP() != my_ip:
+        return
+    try:
+        saved_backend = util.pickle_load("backend")
+    except FileNotFoundError:
+        return
+    if isinstance(saved_backend, TTLBackend):
+        backend.merge(saved_backend)
 
 
 async def get_session_info(request: Request, response: Response) -> dict[str, Union[str, SessionData]]:
@@ -80,34 +125,94 @@ async def get_session_info(request: Request, response: Response) -> dict[str, Un
     """
     session = request.cookies.get(COOKIE_NAME)
 
-    error_data = SessionData(
-        username="guest",
-        web_user=False,
-        web_admin=False,
-        fanhub_user=False,
-        fanhub_elite=False,
-        fanhub_admin=False,
-    )
-
     if not session:
         return {
             "error": "no cookie found",
-            "data": error_data,
+            "data": GUEST_SESSION,
         }
 
-    if uuid.UUID(session) not in backend.data:
+    if token_signer is not None:
+        session_data = token_signer.decode(session)
+    else:
+        try:
+            session_data = await backend.lookup(uuid.UUID(session))
+        except ValueError:
+            session_data = None
+
+    if session_data is None:
         response.delete_cookie(COOKIE_NAME)
         return {
             "error": "no session found for cookie",
-            "data": error_data,
+            "data": GUEST_SESSION,
         }
 
     return {
         "error": None,
-        "data": backend.data[uuid.UUID(session)],
+        "data": session_data,
     }
 
 
+async def create_session(session_data: SessionData) -> str:
+    """
+    Store a new session and get the cookie value for it.
+
+    Args:
+        session_data (SessionData): The session data.
+
+    Returns:
+        str: The session UUID, or the signed token in signed mode.
+    """
+    if token_signer is not None:
+        token = token_signer.encode(session_data)
+        # The id is what /admin/sessions/revoke takes, the token itself is not logged
+        logging.info("Signed session %s created for %s", token_signer.token_id(token), session_data.username)
+        return token
+
+    session_id = uuid.uuid4()
+    await backend.create(session_id, session_data)
+    return str(session_id)
+
+
+async def revoke_session(value: str) -> bool:
+    """
+    End a session before it expires.
+
+    Args:
+        value (str): The session UUID, or in signed mode the token or its id.
+
+    Returns:
+        bool: True if a session was revoked, False if the value is not a session.
+    """
+    if token_signer is not None:
+        token_id = token_signer.token_id(value) if "." in value else value
+        if not token_id or not TOKEN_ID.fullmatch(token_id):
+            return False
+        await run_in_threadpool(token_signer.revoke, token_id)
+        return True
+
+    try:
+        session_id = uuid.UUID(value)
+    except ValueError:
+        return False
+    if backend.peek(session_id) is None:
+        return False
+    await backend.delete(session_id)
+    return True
+
+
+def session_cookie(value: str) -> str:
+    """
+    Build the Set-Cookie header for a session cookie.
+
+    Args:
+        value (str): The cookie value from `create_session`.
+
+    Returns:
+        str: The value of the Set-Cookie header.
+    """
+    return f"{COOKIE_NAME}={value}; HttpOnly; Max-Age={COOKIE_MAX_AGE}; Path=/; SameSite=Lax"
+
+
 class BasicVerifier(SessionVerifier[UUID, SessionData]):
     """
     A session verifier implementation for basic session verification.
@@ -115,7 +220,7 @@ class BasicVerifier(SessionVerifier[UUID, SessionData]):
     Attributes:
         identifier (str): The identifier for the verifier.
         auto_error (bool): Flag indicating whether to raise an error automatically.
-        memory_backend (InMemoryBackend[UUID, SessionData]): The in-memory session backend.
+        memory_backend (SessionBackend[UUID, SessionData]): The session backend.
         auth_http_exception (HTTPException): The HTTPException to raise for authentication errors.
     """
     def __init__(
@@ -123,7 +228,7 @@ class BasicVerifier(SessionVerifier[UUID, SessionData]):
             *,
             identifier: str,
             auto_error: bool,
-            memory_backend: InMemoryBackend[UUID, SessionData],
+            memory_backend: SessionBackend[UUID, SessionData],
             auth_http_exception: HTTPException,
     ):
         self._identifier = identifier
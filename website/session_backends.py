@@ -0,0 +1,473 @@
+"""
+session_backends.py
+
+This module contains session backends for the website.
+
+Classes:
+    - SessionStore: Interface every session backend implements.
+    - TTLBackend: In-memory session backend with sliding expiry, a size cap with LRU eviction and
+      a background sweeper. Sessions live in one process.
+    - SQLiteBackend: Session backend in a SQLite database in WAL mode, shared by every worker
+      process on the host and kept across restarts.
+
+Functions:
+    - create_backend: Create the backend selected by the SESSION_BACKEND environment variable.
+
+`SessionStore` is the fastapi_sessions `SessionBackend` interface plus a synchronous `get`, its
+awaitable `lookup` used by `get_session_info`, a non-renewing `peek`, `sweep` and `stats`. Only `get` (and `read`) renew a
+session, `update` replaces its data and keeps its expiry, so a background job rewriting sessions
+does not keep the sessions of users who left alive. A networked store (e.g. Redis) only has to implement it,
+`SQLiteBackend` behaves the same way on one host and can stand in for it in tests.
+
+Dependencies:
+    - fastapi_sessions
+    - pydantic
+    - starlette
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import abstractmethod
+from collections import OrderedDict
+from typing import Generic, Optional, Type
+
+from fastapi_sessions.backends.session_backend import BackendError, SessionBackend, SessionModel
+from fastapi_sessions.frontends.session_frontend import ID
+from starlette.concurrency import run_in_threadpool
+
+# Matches the Max-Age of the session cookie
+DEFAULT_TTL = 1209600
+
+
+class SessionStore(SessionBackend[ID, SessionModel]):
+    """
+    Interface every session backend implements.
+    """
+
+    @abstractmethod
+    def get(self, session_id: ID) -> Optional[SessionModel]:
+        """Look up a live session and renew it, None if there is none."""
+        raise NotImplementedError()
+
+    async def lookup(self, session_id: ID) -> Optional[SessionModel]:
+        """
+        Look up a live session and renew it from async code, see `get`.
+
+        Backends that block on I/O override it to keep that off the event loop.
+        """
+        return self.get(session_id)
+
+    @abstractmethod
+    def peek(self, session_id: ID) -> Optional[SessionModel]:
+        """Look up a live session without renewing it, None if there is none."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Drop every expired session and return how many were dropped."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def stats(self) -> dict[str, int]:
+        """Get the backend counters."""
+        raise NotImplementedError()
+
+    async def run_sweeper(self, interval: float = 600) -> None:
+        """
+        Sweep expired sessions every `interval` seconds until cancelled.
+
+        Args:
+            interval (float, optional): Seconds between sweeps. Defaults to 600.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            dropped = self.sweep()
+            if dropped:
+                logging.info("Session sweeper dropped %d expired sessions", dropped)
+
+
+class TTLBackend(Generic[ID, SessionModel], SessionStore[ID, SessionModel]):
+    """
+    In-memory session backend with per-entry expiry.
+
+    Every successful lookup renews the entry (sliding expiry) and marks it as recently used.
+    When more than `max_entries` sessions are live the least recently used one is evicted.
+    Expired entries are dropped when they are looked up, and by `sweep` for entries nobody looks up again.
+
+    Attributes:
+        ttl (float): Seconds a session stays valid after its last use.
+        max_entries (int): Maximum number of live sessions.
+        created (int): Number of sessions created.
+        expired (int): Number of sessions dropped because they expired.
+        evicted (int): Number of sessions evicted to stay under `max_entries`.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = 10000) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[ID, tuple[float, SessionModel]] = OrderedDict()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, session_id: ID) -> Optional[SessionModel]:
+        """
+        Look up a session and renew it.
+
+        Args:
+            session_id (ID): The session id.
+
+        Returns:
+            Optional[SessionModel]: The session data, or None if there is no live session.
+        """
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+
+        now = time.monotonic()
+        expires, data = entry
+        if expires <= now:
+            del self._entries[session_id]
+            self.expired += 1
+            return None
+
+        self._entries[session_id] = (now + self.ttl, data)
+        self._entries.move_to_end(session_id)
+        return data
+
+    def peek(self, session_id: ID) -> Optional[SessionModel]:
+        """Look up a live session without renewing it."""
+        entry = self._entries.get(session_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    async def create(self, session_id: ID, data: SessionModel) -> None:
+        """Create a new session entry, evicting the least recently used ones if the store is full."""
+        if self.get(session_id) is not None:
+            raise BackendError("create can't overwrite an existing session")
+
+        self._entries[session_id] = (time.monotonic() + self.ttl, data.copy(deep=True))
+        self.created += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    async def read(self, session_id: ID) -> Optional[SessionModel]:
+        """Read an existing session."""
+        data = self.get(session_id)
+        if data is None:
+            return None
+        return data.copy(deep=True)
+
+    async def update(self, session_id: ID, data: SessionModel) -> None:
+        """Replace the data of an existing session, keeping its expiry and its place in the LRU order."""
+        entry = self._entries.get(session_id)
+        if entry is None or entry[0] <= time.monotonic():
+            raise BackendError("session does not exist, cannot update")
+        self._entries[session_id] = (entry[0], data)
+
+    async def delete(self, session_id: ID) -> None:
+        """Delete a session."""
+        self._entries.pop(session_id, None)
+
+    def merge(self, other: "TTLBackend[ID, SessionModel]") -> None:
+        """
+        Add the sessions of another backend, e.g. one saved with pickle, keeping their expiry.
+
+        Args:
+            other (TTLBackend): The backend to copy the sessions from.
+        """
+        for session_id, entry in other._entries.items():
+            self._entries.setdefault(session_id, entry)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def sweep(self) -> int:
+        """
+        Drop every expired session.
+
+        Returns:
+            int: Number of sessions dropped.
+        """
+        now = time.monotonic()
+        expired = [session_id for session_id, (expires, _) in self._entries.items() if expires <= now]
+        for session_id in expired:
+            del self._entries[session_id]
+        self.expired += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get the session counters.
+
+        Returns:
+            dict[str, int]: Live sessions and the created, expired and evicted counters.
+        """
+        return {
+            "live": len(self._entries),
+            "max_entries": self.max_entries,
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+class SQLiteBackend(Generic[ID, SessionModel], SessionStore[ID, SessionModel]):
+    """
+    Session backend in a SQLite database in WAL mode, shared by every worker process on the host.
+
+    Sessions are keyed by the 16 raw bytes of their UUID (primary key, WITHOUT ROWID table).
+    Creates, updates and deletes are written immediately so other workers see them on the next request.
+    Expiry renewals happen on nearly every request, so they are queued and written in one transaction
+    once `batch_size` are pending or every `flush_interval` seconds.
+    Lookups are cached per process for `cache_ttl` seconds, a session deleted by another worker can
+    stay valid here for at most that long.
+
+    sqlite3 calls block, and a write can wait up to `timeout` seconds for another worker's lock.
+    The async methods (`lookup`, `create`, `update`, `delete` and the sweeper) run them in the
+    threadpool, only a `lookup` answered from the cache stays on the event loop.
+
+    Attributes:
+        path (str): The SQLite database file.
+        model (Type[SessionModel]): The pydantic model sessions are stored as.
+        ttl (float): Seconds a session stays valid after its last use.
+        cache_ttl (float): Seconds a lookup is cached in this process.
+    """
+
+    def __init__(self, path: str, model: Type[SessionModel], ttl: float = DEFAULT_TTL, cache_ttl: float = 5.0,
+                 flush_interval: float = 1.0, batch_size: int = 100, timeout: float = 2.0) -> None:
+        self.path = path
+        self.model = model
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._cache: dict[ID, tuple[float, SessionModel]] = {}
+        self._renewals: dict[bytes, float] = {}
+
+        self.created = 0
+        self.expired = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """
+        The connection of this process, opened lazily so forked workers never share one.
+        """
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS sessions "
+                               "(id BLOB PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL) WITHOUT ROWID")
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+            self._connection, self._pid = connection, os.getpid()
+            self._cache.clear()
+            self._renewals.clear()
+        return self._connection
+
+    def get(self, session_id: ID) -> Optional[SessionModel]:
+        """
+        Look up a session and queue its renewal.
+
+        Args:
+            session_id (ID): The session id.
+
+        Returns:
+            Optional[SessionModel]: The session data, or None if there is no live session.
+        """
+        data = self._cached(session_id)
+        if data is None:
+            data = self._read(session_id)
+            if data is None:
+                return None
+        if self._renew(session_id):
+            self.flush()
+        return data
+
+    async def lookup(self, session_id: ID) -> Optional[SessionModel]:
+        """
+        Look up a session and queue its renewal, reading SQLite in the threadpool on a cache miss.
+        """
+        data = self._cached(session_id)
+        if data is None:
+            data = await run_in_threadpool(self._read, session_id)
+            if data is None:
+                return None
+        if self._renew(session_id):
+            await run_in_threadpool(self.flush)
+        return data
+
+    def _cached(self, session_id: ID) -> Optional[SessionModel]:
+        cached = self._cache.get(session_id)
+        if cached is not None and cached[0] > time.time():
+            self.cache_hits += 1
+            return cached[1]
+        return None
+
+    def _read(self, session_id: ID) -> Optional[SessionModel]:
+        self.cache_misses += 1
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT data, expires FROM sessions WHERE id = ?", (session_id.bytes,)).fetchone()
+        if row is None or row[1] <= now:
+            self._cache.pop(session_id, None)
+            return None
+        data = self.model.parse_raw(row[0])
+        self._cache[session_id] = (now + self.cache_ttl, data)
+        return data
+
+    def _renew(self, session_id: ID) -> bool:
+        """
+        Queue the renewal of a session, True once enough are queued to flush them.
+        """
+        self._renewals[session_id.bytes] = time.time() + self.ttl
+        return len(self._renewals) >= self.batch_size
+
+    def peek(self, session_id: ID) -> Optional[SessionModel]:
+        """Look up a live session without renewing it."""
+        with self._lock:
+            row = self._db.execute("SELECT data FROM sessions WHERE id = ? AND expires > ?",
+                                   (session_id.bytes, time.time())).fetchone()
+        return None if row is None else self.model.parse_raw(row[0])
+
+    def flush(self) -> int:
+        """
+        Write the queued expiry renewals in one transaction.
+
+        Returns:
+            int: Number of renewals written.
+        """
+        if not self._renewals:
+            return 0
+        renewals, self._renewals = self._renewals, {}
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN")
+            db.executemany("UPDATE sessions SET expires = ? WHERE id = ? AND expires < ?",
+                           [(expires, key, expires) for key, expires in renewals.items()])
+            db.execute("COMMIT")
+        return len(renewals)
+
+    async def create(self, session_id: ID, data: SessionModel) -> None:
+        """Create a new session entry."""
+        await run_in_threadpool(self._execute, "INSERT INTO sessions (id, data, expires) VALUES (?, ?, ?)",
+                                (session_id.bytes, data.json(), time.time() + self.ttl))
+        self.created += 1
+
+    async def read(self, session_id: ID) -> Optional[SessionModel]:
+        """Read an existing session."""
+        data = await self.lookup(session_id)
+        if data is None:
+            return None
+        return data.copy(deep=True)
+
+    async def update(self, session_id: ID, data: SessionModel) -> None:
+        """Replace the data of an existing session, keeping its expiry."""
+        updated = await run_in_threadpool(self._execute, "UPDATE sessions SET data = ? WHERE id = ? AND expires > ?",
+                                          (data.json(), session_id.bytes, time.time()))
+        if updated == 0:
+            raise BackendError("session does not exist, cannot update")
+        self._cache.pop(session_id, None)
+
+    async def delete(self, session_id: ID) -> None:
+        """Delete a session."""
+        await run_in_threadpool(self._execute, "DELETE FROM sessions WHERE id = ?", (session_id.bytes,))
+        self._cache.pop(session_id, None)
+        self._renewals.pop(session_id.bytes, None)
+
+    def _execute(self, query: str, parameters: tuple) -> int:
+        """
+        Run one write statement and return the number of rows it changed.
+        """
+        with self._lock:
+            try:
+                return self._db.execute(query, parameters).rowcount
+            except sqlite3.IntegrityError:
+                raise BackendError("create can't overwrite an existing session")
+
+    def sweep(self) -> int:
+        """
+        Drop every expired session.
+
+        Returns:
+            int: Number of sessions dropped.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+        self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+        self.expired += cursor.rowcount
+        return cursor.rowcount
+
+    async def run_sweeper(self, interval: float = 600) -> None:
+        """
+        Flush queued renewals every `flush_interval` seconds and sweep expired sessions every
+        `interval` seconds until cancelled.
+
+        Args:
+            interval (float, optional): Seconds between sweeps. Defaults to 600.
+        """
+        last_sweep = time.monotonic()
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await run_in_threadpool(self.flush)
+                if time.monotonic() - last_sweep >= interval:
+                    last_sweep = time.monotonic()
+                    dropped = await run_in_threadpool(self.sweep)
+                    if dropped:
+                        logging.info("Session sweeper dropped %d expired sessions", dropped)
+        finally:
+            self.flush()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get the session counters. `created`, `expired` and the cache counters are for this process only.
+
+        Returns:
+            dict[str, int]: Live sessions on the host and the counters.
+        """
+        with self._lock:
+            live = self._db.execute("SELECT COUNT(*) FROM sessions WHERE expires > ?", (time.time(),)).fetchone()[0]
+        return {
+            "live": live,
+            "created": self.created,
+            "expired": self.expired,
+            "pending_renewals": len(self._renewals),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+
+def create_backend(model: Type[SessionModel]) -> SessionStore:
+    """
+    Create the session backend selected by the environment.
+
+    SESSION_BACKEND=sqlite uses SQLiteBackend with the file in SESSION_DB (default "sessions.db"),
+    anything else uses TTLBackend.
+
+    Args:
+        model (Type[SessionModel]): The pydantic model sessions are stored as.
+
+    Returns:
+        SessionStore: The backend.
+    """
+    if os.environ.get("SESSION_BACKEND", "memory").lower() == "sqlite":
+        return SQLiteBackend(os.environ.get("SESSION_DB", "sessions.db"), model)
+    return TTLBackend()
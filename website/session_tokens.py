@@ -0,0 +1,200 @@
+"""
+session_tokens.py
+
+This module packs session data into a compact signed cookie, so resolving a session is a
+signature check instead of a backend lookup and workers share no state.
+
+Token format:
+    <flags hex>.<token id>.<base64 username>.<timestamp>.<signature>
+
+The five role flags of `SessionData` are packed into one bitmask. The timestamp and signature are
+added by an itsdangerous `TimestampSigner`, tokens older than `max_age` are rejected.
+
+Revocation:
+    Tokens can be revoked by token id, e.g. through /admin/sessions/revoke. With a `revocation_db`
+    the revoked ids are written to a SQLite table. Every worker on the host runs `run_refresher`,
+    which reads the table again every `refresh_interval` seconds in the threadpool, so a revocation
+    reaches all workers within that time and survives restarts. `decode` only checks the set in
+    memory and never waits on SQLite. Without one, `revoke` only applies to the current process. Ids in the
+    REVOKED_SESSIONS environment variable (comma separated) always apply. Ids are only kept until
+    the revoked tokens would have expired anyway.
+
+Classes:
+    - SessionTokenSigner: Encodes and verifies session tokens.
+"""
+import asyncio
+import base64
+import functools
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from itsdangerous import BadSignature, TimestampSigner
+from starlette.concurrency import run_in_threadpool
+
+from website.models import SessionData
+
+# Order of the flags in the bitmask, never reorder or existing tokens decode to the wrong roles
+FLAGS = ("web_user", "web_admin", "fanhub_user", "fanhub_elite", "fanhub_admin")
+
+
+class SessionTokenSigner:
+    """
+    Encodes session data into signed tokens and verifies them.
+
+    Attributes:
+        max_age (int): Seconds a token stays valid.
+    """
+
+    def __init__(self, secret_key: str, max_age: int = 1209600, revocation_db: Optional[str] = None,
+                 refresh_interval: float = 5.0):
+        """
+        Args:
+            secret_key (str): Key used to sign the tokens.
+            max_age (int, optional): Seconds a token stays valid, defaults to the cookie Max-Age.
+            revocation_db (Optional[str], optional): SQLite file shared by the workers to store revoked ids in.
+            refresh_interval (float, optional): Seconds between reads of the shared revoked ids by `run_refresher`.
+        """
+        self.max_age = max_age
+        self.revocation_db = revocation_db
+        self.refresh_interval = refresh_interval
+        self._signer = TimestampSigner(secret_key, salt="session-token")
+        self._configured: dict[str, float] = {
+            token_id: float("inf") for token_id in os.environ.get("REVOKED_SESSIONS", "").split(",") if token_id
+        }
+        self._revoked = dict(self._configured)
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        # Verifying the signature is the expensive part and a client sends the same token on every request
+        self._unsign = functools.lru_cache(maxsize=4096)(self._unsign_uncached)
+
+    def cache_info(self):
+        """
+        Statistics of the signature cache.
+
+        Returns:
+            functools._CacheInfo: hits, misses, maxsize and currsize.
+        """
+        return self._unsign.cache_info()
+
+    def encode(self, data: SessionData) -> str:
+        """
+        Create a signed token for the session data.
+
+        Args:
+            data (SessionData): The session data.
+
+        Returns:
+            str: The token.
+        """
+        flags = sum(1 << i for i, flag in enumerate(FLAGS) if getattr(data, flag))
+        username = base64.urlsafe_b64encode(data.username.encode()).decode().rstrip("=")
+        payload = f"{flags:x}.{secrets.token_urlsafe(6)}.{username}"
+        return self._signer.sign(payload).decode()
+
+    def decode(self, token: str) -> Optional[SessionData]:
+        """
+        Verify a token and unpack its session data.
+
+        Args:
+            token (str): The token from the cookie.
+
+        Returns:
+            Optional[SessionData]: The session data, or None if the token is invalid, expired or revoked.
+        """
+        unsigned = self._unsign(token)
+        if unsigned is None:
+            return None
+
+        data, token_id, timestamp = unsigned
+        if time.time() - timestamp > self.max_age:
+            return None
+        if token_id in self._revoked:
+            return None
+        return data
+
+    def token_id(self, token: str) -> Optional[str]:
+        """
+        Get the id of a validly signed token, e.g. to revoke it.
+
+        Args:
+            token (str): The token.
+
+        Returns:
+            Optional[str]: The token id, or None if the signature is invalid.
+        """
+        unsigned = self._unsign(token)
+        return unsigned[1] if unsigned else None
+
+    def revoke(self, token_id: str):
+        """
+        Revoke a token until it would have expired, in every worker if there is a `revocation_db`.
+
+        Writes to SQLite with a `revocation_db`, call it from a thread in async code.
+
+        Args:
+            token_id (str): The token id.
+        """
+        now = time.time()
+        if self.revocation_db is not None:
+            with self._lock:
+                self._db.execute("INSERT OR REPLACE INTO revoked_tokens VALUES (?, ?)", (token_id, now + self.max_age))
+        self._revoked = {k: v for k, v in self._revoked.items() if v > now}
+        self._revoked[token_id] = now + self.max_age
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """
+        The connection of this process, opened lazily so forked workers never share one.
+        """
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.revocation_db, timeout=10, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS revoked_tokens "
+                               "(token_id TEXT PRIMARY KEY, expires REAL NOT NULL) WITHOUT ROWID")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def refresh(self):
+        """
+        Read the revoked ids of all workers from the `revocation_db`, dropping the ones whose tokens have expired.
+        """
+        if self.revocation_db is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute("DELETE FROM revoked_tokens WHERE expires < ?", (now,))
+            rows = self._db.execute("SELECT token_id, expires FROM revoked_tokens").fetchall()
+        self._revoked = {**self._configured, **dict(rows)}
+
+    async def run_refresher(self):
+        """
+        Read the shared revoked ids now and then every `refresh_interval` seconds until cancelled.
+        Returns at once without a `revocation_db`.
+        """
+        if self.revocation_db is None:
+            return
+        while True:
+            try:
+                await run_in_threadpool(self.refresh)
+            except sqlite3.Error:
+                logging.exception("Reading the revoked session tokens failed")
+            await asyncio.sleep(self.refresh_interval)
+
+    def _unsign_uncached(self, token: str) -> Optional[tuple[SessionData, str, int]]:
+        try:
+            payload, timestamp = self._signer.unsign(token, return_timestamp=True)
+            flags, token_id, username = payload.decode().split(".")
+            flags = int(flags, 16)
+            username = base64.urlsafe_b64decode(username + "=" * (-len(username) % 4)).decode()
+        except (BadSignature, ValueError):
+            return None
+
+        data = SessionData(username=username, **{flag: bool(flags >> i & 1) for i, flag in enumerate(FLAGS)})
+        return data, token_id, int(timestamp.timestamp())
@@ -0,0 +1,188 @@
+"""
+snapshot.py
+
+This module saves the loaded database to a versioned binary snapshot and loads it back on
+startup, so a restart doesn't have to rebuild every division, contestant, match and title.
+
+File layout:
+    8 bytes   magic b"AEWMMRDB"
+    4 bytes   schema version (little endian uint32)
+    4 bytes   header length (little endian uint32)
+    n bytes   JSON header: payload sha256, source fingerprint, build time, creation date
+    rest      pickle protocol 5 payload
+
+Contestants, matches and titles reference each other, so pickling recurses deeply. It runs on a
+thread of its own with a large stack, a deep pickle on a small thread stack (the background
+reload thread) would crash the process instead of raising RecursionError. A snapshot that cannot
+be pickled or written is logged and skipped, the database is used either way.
+
+The file is read through mmap and the checksum is verified before unpickling. Unpickling copies
+every object into the private memory of the loading process, so each worker that loads the
+snapshot holds its own copy of the database. To share one copy, load it once and fork the
+workers (see website.prefork).
+
+Functions:
+    - source_fingerprint: Fingerprint of the files the database is built from.
+    - save_snapshot: Write a snapshot of a database.
+    - load_snapshot: Load a snapshot if it is valid for the given fingerprint.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Iterable, Optional
+
+MAGIC = b"AEWMMRDB"
+SCHEMA_VERSION = 1
+_PREFIX = struct.Struct("<8sII")
+# Recursion limit and C stack of the pickling thread, the stack is only committed as it is used
+PICKLE_RECURSION_LIMIT = 100_000
+PICKLE_STACK_SIZE = 512 * 1024 * 1024
+
+
+def source_fingerprint(paths: Iterable[str], *extra: str) -> str:
+    """
+    Fingerprint the files the database is built from.
+
+    Only file names, sizes and modification times are hashed, so this stays cheap for large data directories.
+
+    Args:
+        paths (Iterable[str]): Files or directories to include, missing paths are skipped.
+        *extra (str): Extra values that change the build, e.g. configuration flags.
+
+    Returns:
+        str: Hex digest of the sources.
+    """
+    digest = hashlib.sha256(f"schema={SCHEMA_VERSION}".encode())
+    for value in extra:
+        digest.update(b"\0" + value.encode())
+    for path in sorted(paths):
+        if os.path.isfile(path):
+            files = [path]
+        else:
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+                           if "__pycache__" not in root)
+        for file in files:
+            stat = os.stat(file)
+            digest.update(f"\0{file}\0{stat.st_size}\0{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def save_snapshot(file_name: str, db: Any, fingerprint: str, build_seconds: float) -> bool:
+    """
+    Write a snapshot of a database. The file is replaced atomically.
+
+    Args:
+        file_name (str): The snapshot file.
+        db (Any): The database to save.
+        fingerprint (str): Fingerprint of the sources the database was built from.
+        build_seconds (float): How long the build took, reported when the snapshot is loaded.
+
+    Returns:
+        bool: True if the snapshot was written.
+    """
+    try:
+        payload = _dumps(db)
+    except Exception as e:
+        logging.warning("Snapshot not saved, database could not be pickled: %r", e)
+        return False
+
+    header = json.dumps({
+        "sha256": hashlib.sha256(payload).hexdigest(),
+        "fingerprint": fingerprint,
+        "build_seconds": round(build_seconds, 3),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }).encode()
+
+    temp_name = f"{file_name}.tmp"
+    try:
+        with open(temp_name, "wb") as file:
+            file.write(_PREFIX.pack(MAGIC, SCHEMA_VERSION, len(header)))
+            file.write(header)
+            file.write(payload)
+        os.replace(temp_name, file_name)
+    except OSError as e:
+        logging.warning("Snapshot not saved, %s could not be written: %r", file_name, e)
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def load_snapshot(file_name: str, fingerprint: str) -> Optional[Any]:
+    """
+    Load a snapshot if it exists, has the current schema version, matches the fingerprint and
+    passes the checksum.
+
+    Args:
+        file_name (str): The snapshot file.
+        fingerprint (str): Fingerprint of the current sources.
+
+    Returns:
+        Optional[Any]: The database, or None if there is no usable snapshot.
+    """
+    if not os.path.exists(file_name):
+        return None
+
+    start = time.perf_counter()
+    with open(file_name, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        if len(view) < _PREFIX.size:
+            return _reject(file_name, "truncated")
+        magic, schema, header_length = _PREFIX.unpack_from(view)
+        if magic != MAGIC:
+            return _reject(file_name, "not a snapshot")
+        if schema != SCHEMA_VERSION:
+            return _reject(file_name, f"schema {schema}, expected {SCHEMA_VERSION}")
+
+        header = json.loads(view[_PREFIX.size:_PREFIX.size + header_length])
+        if header["fingerprint"] != fingerprint:
+            return _reject(file_name, "source data changed")
+
+        with memoryview(view)[_PREFIX.size + header_length:] as payload:
+            if hashlib.sha256(payload).hexdigest() != header["sha256"]:
+                return _reject(file_name, "checksum mismatch")
+            db = pickle.loads(payload)
+
+    logging.info("Loaded snapshot %s in %.2fs (full build took %.2fs)",
+                 file_name, time.perf_counter() - start, header["build_seconds"])
+    return db
+
+
+def _dumps(db: Any) -> bytes:
+    """Pickle on a thread with a stack large enough for PICKLE_RECURSION_LIMIT."""
+    result = {}
+
+    def run():
+        limit = sys.getrecursionlimit()
+        try:
+            sys.setrecursionlimit(max(limit, PICKLE_RECURSION_LIMIT))
+            result["payload"] = pickle.dumps(db, protocol=5)
+        except BaseException as e:
+            result["error"] = e
+        finally:
+            sys.setrecursionlimit(limit)
+
+    previous = threading.stack_size(PICKLE_STACK_SIZE)
+    try:
+        thread = threading.Thread(target=run, name="snapshot-pickle")
+        thread.start()
+    finally:
+        threading.stack_size(previous)
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["payload"]
+
+
+def _reject(file_name: str, reason: str) -> None:
+    logging.info("Ignoring snapshot %s: %s", file_name, reason)
+    return None
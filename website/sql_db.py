@@ -14,6 +14,10 @@ Example:
     db = SQLDatabase()
     db.create_table("my_table", [("column1", "INT"), ("column2", "VARCHAR(255)")])
     db.close()
+
+Every public method, and connecting in __init__, is recorded in the sql_duration_seconds and
+sql_errors_total metrics by method name, also for the methods subclasses override. Open
+connections are counted in sql_connections_open.
 """
 
 import os
@@ -21,6 +25,8 @@ import os
 import pymssql
 from dotenv import load_dotenv
 
+from website import metrics
+
 
 class SQLDatabase:
     """
@@ -71,6 +77,37 @@ class SQLDatabase:
         Retrieve all rankings submissions in HTML format.
     """
 
+    rcv_cols = [
+        # Columns for the RCV_submissions table
+        ("datetime", "DATETIME"),
+        ("username", "VARCHAR(255)"),
+        ("AEW_World_Title_1", "VARCHAR(255)"),
+        ("AEW_World_Title_2", "VARCHAR(255)"),
+        ("AEW_World_Title_3", "VARCHAR(255)"),
+        ("AEW_TNT_Title_1", "VARCHAR(255)"),
+        ("AEW_TNT_Title_2", "VARCHAR(255)"),
+        ("AEW_TNT_Title_3", "VARCHAR(255)"),
+        ("AEW_International_Title_1", "VARCHAR(255)"),
+        ("AEW_International_Title_2", "VARCHAR(255)"),
+        ("AEW_International_Title_3", "VARCHAR(255)"),
+        ("AEW_World_Tag_Team_Titles_1", "VARCHAR(255)"),
+        ("AEW_World_Tag_Team_Titles_2", "VARCHAR(255)"),
+        ("AEW_World_Tag_Team_Titles_3", "VARCHAR(255)"),
+        ("AEW_World_Trios_Titles_1", "VARCHAR(255)"),
+        ("AEW_World_Trios_Titles_2", "VARCHAR(255)"),
+        ("AEW_World_Trios_Titles_3", "VARCHAR(255)"),
+        ("AEW_Womens_World_Title_1", "VARCHAR(255)"),
+        ("AEW_Womens_World_Title_2", "VARCHAR(255)"),
+        ("AEW_Womens_World_Title_3", "VARCHAR(255)"),
+        ("AEW_TBS_Title_1", "VARCHAR(255)"),
+        ("AEW_TBS_Title_2", "VARCHAR(255)"),
+        ("AEW_TBS_Title_3", "VARCHAR(255)")
+    ]
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _instrument(cls)
+
     def __init__(self):
         """
         Initialize the database connection using environment variables.
@@ -91,42 +128,17 @@ class SQLDatabase:
 
         # Establish database connection
         self.cnxn = pymssql.connect(server=server_name, user=username, password=password, database=database_name)
+        metrics.sql_connections_open.inc()
 
         # Create a cursor for executing SQL queries
         self.cursor = self.cnxn.cursor()
 
-        self.rcv_cols = [
-            # Columns for the RCV_submissions table
-            ("datetime", "DATETIME"),
-            ("username", "VARCHAR(255)"),
-            ("AEW_World_Title_1", "VARCHAR(255)"),
-            ("AEW_World_Title_2", "VARCHAR(255)"),
-            ("AEW_World_Title_3", "VARCHAR(255)"),
-            ("AEW_TNT_Title_1", "VARCHAR(255)"),
-            ("AEW_TNT_Title_2", "VARCHAR(255)"),
-            ("AEW_TNT_Title_3", "VARCHAR(255)"),
-            ("AEW_International_Title_1", "VARCHAR(255)"),
-            ("AEW_International_Title_2", "VARCHAR(255)"),
-            ("AEW_International_Title_3", "VARCHAR(255)"),
-            ("AEW_World_Tag_Team_Titles_1", "VARCHAR(255)"),
-            ("AEW_World_Tag_Team_Titles_2", "VARCHAR(255)"),
-            ("AEW_World_Tag_Team_Titles_3", "VARCHAR(255)"),
-            ("AEW_World_Trios_Titles_1", "VARCHAR(255)"),
-            ("AEW_World_Trios_Titles_2", "VARCHAR(255)"),
-            ("AEW_World_Trios_Titles_3", "VARCHAR(255)"),
-            ("AEW_Womens_World_Title_1", "VARCHAR(255)"),
-            ("AEW_Womens_World_Title_2", "VARCHAR(255)"),
-            ("AEW_Womens_World_Title_3", "VARCHAR(255)"),
-            ("AEW_TBS_Title_1", "VARCHAR(255)"),
-            ("AEW_TBS_Title_2", "VARCHAR(255)"),
-            ("AEW_TBS_Title_3", "VARCHAR(255)")
-        ]
-
     def close(self):
         """
         Close the database connection.
         """
         self.cnxn.close()
+        metrics.sql_connections_open.dec()
 
     def delete_all_tables(self):
         """
@@ -455,3 +467,10 @@ class SQLDatabase:
 
         # Return the generated HTML string
         return table
+
+
+def _instrument(cls: type):
+    metrics.instrument(cls, metrics.sql_seconds, metrics.sql_errors_total, {"__init__": "connect"})
+
+
+_instrument(SQLDatabase)
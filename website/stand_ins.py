@@ -0,0 +1,225 @@
+"""
+stand_ins.py
+
+This module provides local stand-ins for SQL Server and Discord, so the fan hub and admin flows
+can be load-tested offline.
+
+SQLiteDatabase is a SQLDatabase on a SQLite file. It inherits the query methods and only replaces
+the connection and the few statements that are specific to SQL Server, pymssql's %s parameters
+are translated for SQLite by the cursor. Like SQLDatabase, every instance opens its own connection.
+
+FakeDiscordOAuthClient has the methods of CustomDiscordOAuthClient the website calls. The OAuth
+code names the user and role (`name:role`, with role one of elite, mod, admin or member) and the
+session returns the SessionData the real one would build from those roles, after a configurable
+delay standing in for the Discord round trips.
+
+Classes:
+    - SQLiteDatabase: SQLDatabase on a local SQLite file.
+    - FakeDiscordOAuthSession: OAuth session answering from the code instead of Discord.
+    - FakeDiscordOAuthClient: Client creating FakeDiscordOAuthSessions.
+
+Functions:
+    - install: Swap the stand-ins into the website modules.
+
+Dependencies:
+    - starlette
+    - Local modules: website.metrics, website.models, website.sql_db
+"""
+import asyncio
+import sqlite3
+import threading
+from typing import Optional, Union
+
+from starlette.responses import RedirectResponse
+
+from website import metrics, sql_db
+from website.models import SessionData
+
+ROLES = ("elite", "mod", "admin", "member")
+
+_created: set[str] = set()
+_created_lock = threading.Lock()
+
+
+class _Cursor:
+    """sqlite3 cursor accepting the %s parameters of pymssql."""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def execute(self, query: str, params: tuple = ()):
+        return self._cursor.execute(query.replace("%s", "?"), params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+
+class SQLiteDatabase(sql_db.SQLDatabase):
+    """
+    SQLDatabase on a local SQLite file.
+
+    Attributes:
+        path (str): The database file.
+    """
+    path = "loadtest.db"
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Open the database and create the tables on first use.
+
+        Args:
+            path (Optional[str]): The database file, defaults to the class attribute `path`.
+        """
+        self.path = path or self.path
+        self.cnxn = sqlite3.connect(self.path, timeout=30)
+        metrics.sql_connections_open.inc()
+        self.cursor = _Cursor(self.cnxn.cursor())
+
+        with _created_lock:
+            if self.path not in _created:
+                self.cnxn.execute("PRAGMA journal_mode=WAL")
+                if "UserActivity" not in self.list_tables():
+                    self.remake_user_activity_table()
+                if "RCV_submissions" not in self.list_tables():
+                    self.remake_rankings_submissions_table()
+                _created.add(self.path)
+
+    def delete_all_tables(self):
+        for table_name in self.list_tables():
+            self.cursor.execute(f"DROP TABLE {table_name}")
+        self.cnxn.commit()
+
+    def create_table(self, table_name, columns, drop=False):
+        if drop:
+            self.cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+        definition = ", ".join(f"{name} {column_type}" for name, column_type in columns)
+        self.cursor.execute(f"CREATE TABLE {table_name} ({definition})")
+        self.cnxn.commit()
+
+    def list_tables(self) -> list:
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def remake_user_activity_table(self):
+        cols = [
+            ("id", "INTEGER PRIMARY KEY AUTOINCREMENT"),
+            ("SERVER_IP", "VARCHAR(255)"),
+            ("activity_date", "VARCHAR(255)"),
+            ("username", "VARCHAR(255)"),
+            ("page", "VARCHAR(255)"),
+        ]
+        self.create_table("UserActivity", cols, True)
+
+
+class _FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeDiscordOAuthSession:
+    """
+    OAuth session answering from the code instead of Discord.
+
+    Attributes:
+        token (Optional[dict]): The fake token, set after the code exchange.
+        cached_user (Optional[_FakeUser]): The user, set by `identify`.
+    """
+
+    def __init__(self, code: Optional[str], token: Optional[dict], latency: float):
+        self.token = token
+        self.cached_user: Optional[_FakeUser] = None
+        self._code = code if code is not None else (token or {}).get("access_token", "")
+        self._latency = latency
+
+    async def ensure_token(self):
+        if not self.token:
+            await asyncio.sleep(self._latency)
+            self.token = {"access_token": self._code, "token_type": "Bearer", "expires_in": 604800}
+
+    async def refresh(self) -> dict:
+        return self.token
+
+    async def identify(self) -> _FakeUser:
+        await self.ensure_token()
+        await asyncio.sleep(self._latency)
+        name = self._code.partition(":")[0]
+        self.cached_user = _FakeUser(abs(hash(name)) % 10 ** 18, name)
+        return self.cached_user
+
+    async def get_fanhub_roles(self) -> Union[SessionData, bool]:
+        """
+        Get the session data for the user and role in the code.
+
+        Returns:
+            Union[SessionData, bool]: Like CustomDiscordOAuthSession, False unless the role is elite, mod or admin.
+        """
+        await self.ensure_token()
+        # Member and guilds requests, concurrently with identify
+        user = (await asyncio.gather(self.identify(), asyncio.sleep(self._latency)))[0]
+        role = self._code.partition(":")[2]
+        if role not in ("elite", "mod", "admin"):
+            return False
+        return SessionData(
+            username=user.name,
+            web_user=True,
+            web_admin=role == "admin",
+            fanhub_user=True,
+            fanhub_elite=True,
+            fanhub_admin=role in ("mod", "admin"),
+        )
+
+    async def close(self):
+        pass
+
+
+class FakeDiscordOAuthClient:
+    """
+    Client creating FakeDiscordOAuthSessions.
+
+    Attributes:
+        latency (float): Seconds one Discord request takes.
+    """
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+
+    def redirect(self) -> RedirectResponse:
+        """Skip the Discord login page and call back with a member code."""
+        return RedirectResponse("/discord/callback?code=guest:member")
+
+    def session(self, code: str) -> FakeDiscordOAuthSession:
+        return FakeDiscordOAuthSession(code, None, self.latency)
+
+    def session_from_token(self, token: dict) -> FakeDiscordOAuthSession:
+        return FakeDiscordOAuthSession(None, token, self.latency)
+
+    async def close(self):
+        pass
+
+
+def install(sqlite_path: str = "loadtest.db", discord_latency: float = 0.05):
+    """
+    Swap the stand-ins into the website modules.
+
+    Routes create `sql_db.SQLDatabase()` on every request and the Discord client is read from the
+    modules that imported it, so this must run after `website.api` is imported.
+
+    Args:
+        sqlite_path (str): The SQLite file for the SQL Server tables.
+        discord_latency (float): Seconds one fake Discord request takes.
+    """
+    from website import api, resources
+
+    SQLiteDatabase.path = sqlite_path
+    sql_db.SQLDatabase = SQLiteDatabase
+
+    client = FakeDiscordOAuthClient(discord_latency)
+    api.discord_client = resources.discord_client = client
+    resources.discord_roles._client = client
@@ -0,0 +1,213 @@
+"""
+stats_cube.py
+
+This module precomputes every stats table of /stats once per database load.
+
+`mmrDB.api_stats_keys()` spans a small key space of (division, year, mmr key, stat division).
+The cube calls `api_stats_get` once for every combination and keeps each result as NumPy columns,
+so requests only sort, filter and slice arrays. The rendered HTML table of a combination is
+cached the first time it is requested, the initial table of /stats/ is rendered while building.
+
+Classes:
+    - StatsTable: One stats table as NumPy columns.
+    - StatsCube: Every stats table, indexed by (division, year, mmr key, stat division).
+
+Dependencies:
+    - numpy
+    - Local modules: website.util
+"""
+import itertools
+import logging
+import time
+from typing import Any, Iterator, Optional
+
+import numpy as np
+
+from website.util import html_table
+
+
+class StatsTable:
+    """
+    One stats table as NumPy columns.
+
+    Integer columns are int64, other numeric columns float64 and everything else object arrays.
+
+    Attributes:
+        columns (list[str]): Column names in their original order.
+        data (dict[str, np.ndarray]): Column name to values.
+    """
+
+    def __init__(self, rows: list[dict[str, Any]]):
+        """
+        Args:
+            rows (list[dict[str, Any]]): Rows from `api_stats_get`.
+        """
+        self.columns: list[str] = list(rows[0]) if rows else []
+        self.data: dict[str, np.ndarray] = {column: _column([row.get(column) for row in rows])
+                                            for column in self.columns}
+        self._html: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.data[self.columns[0]]) if self.columns else 0
+
+    @property
+    def html(self) -> str:
+        """The table rendered like /stats/ shows it, rendered once."""
+        if self._html is None:
+            self._html = html_table(list(self.rows()), "stats_table")
+        return self._html
+
+    def select(self, sort: Optional[str] = None, descending: bool = True, search: Optional[str] = None,
+               ranges: Optional[dict[str, tuple[Optional[float], Optional[float]]]] = None) -> np.ndarray:
+        """
+        Find the rows that pass the filters, in the requested order.
+
+        Args:
+            sort (Optional[str]): Column to sort by, original order if None.
+            descending (bool, optional): Sort descending. Defaults to True.
+            search (Optional[str]): Case-insensitive text any text column must contain.
+            ranges (Optional[dict]): Numeric column to an inclusive (min, max), either may be None.
+
+        Returns:
+            np.ndarray: Row indices.
+
+        Raises:
+            ValueError: If a column does not exist or a range column is not numeric.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for column, (low, high) in (ranges or {}).items():
+            values = self._numeric(column)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+
+        if search:
+            search = search.lower()
+            found = np.zeros(len(self), dtype=bool)
+            for values in self.data.values():
+                if values.dtype == object:
+                    found |= np.fromiter((search in str(value).lower() for value in values), bool, len(values))
+            mask &= found
+
+        indices = np.flatnonzero(mask)
+        if sort is not None:
+            if sort not in self.data:
+                raise ValueError(f"unknown column {sort}")
+            values = self.data[sort][indices]
+            if values.dtype == object:
+                values = np.array([str(value) for value in values])
+            order = np.argsort(values, kind="stable")
+            indices = indices[order[::-1] if descending else order]
+        return indices
+
+    def rows(self, indices: Optional[np.ndarray] = None) -> Iterator[dict[str, Any]]:
+        """
+        Rows as dicts with Python values.
+
+        Args:
+            indices (Optional[np.ndarray]): Rows to return, all in original order if None.
+
+        Yields:
+            dict[str, Any]: One row.
+        """
+        columns = {column: values.tolist() if indices is None else values[indices].tolist()
+                   for column, values in self.data.items()}
+        for values in zip(*columns.values()):
+            yield dict(zip(self.columns, values))
+
+    def _numeric(self, column: str) -> np.ndarray:
+        if column not in self.data:
+            raise ValueError(f"unknown column {column}")
+        values = self.data[column]
+        if values.dtype == object:
+            raise ValueError(f"column {column} is not numeric")
+        return values
+
+
+class StatsCube:
+    """
+    Every stats table, indexed by (division, year, mmr key, stat division).
+
+    Attributes:
+        keys (tuple[list, list, list, list]): The result of `api_stats_keys()`.
+        build_seconds (float): Time it took to build the cube.
+    """
+
+    def __init__(self, keys: tuple[list, list, list, list], tables: dict[tuple[int, int, int, int], StatsTable],
+                 build_seconds: float = 0.0):
+        self.keys = keys
+        self.build_seconds = build_seconds
+        self._tables = tables
+        # Keys arrive as path strings, years may be ints in api_stats_keys
+        self._index = [{str(key): i for i, key in enumerate(axis)} for axis in keys]
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    @classmethod
+    def from_db(cls, db) -> "StatsCube":
+        """
+        Compute every stats table of a loaded database.
+
+        Combinations `api_stats_get` fails for are left out.
+
+        Args:
+            db (mmrDB): The database.
+
+        Returns:
+            StatsCube: The cube, with the HTML of the initial table already rendered.
+        """
+        start = time.perf_counter()
+        keys = tuple(list(axis) for axis in db.api_stats_keys())
+        tables = {}
+        for index in itertools.product(*(range(len(axis)) for axis in keys)):
+            try:
+                rows = db.api_stats_get(*(axis[i] for axis, i in zip(keys, index)))
+            except Exception:
+                logging.exception("Stats table %s failed", index)
+                continue
+            tables[index] = StatsTable(list(rows))
+
+        cube = cls(keys, tables, time.perf_counter() - start)
+        initial = cube.initial()
+        if initial is not None:
+            initial.html
+        return cube
+
+    def table(self, division, year, mmr_key, stat_division) -> StatsTable:
+        """
+        Get one table.
+
+        Args:
+            division: Wrestler division.
+            year: Year key.
+            mmr_key: MMR key.
+            stat_division: Stat division.
+
+        Returns:
+            StatsTable: The table.
+
+        Raises:
+            KeyError: If the combination is not in the cube.
+        """
+        try:
+            index = tuple(axis[str(key)] for axis, key in zip(self._index, (division, year, mmr_key, stat_division)))
+            return self._tables[index]
+        except KeyError:
+            raise KeyError(f"no stats for {division}/{year}/{mmr_key}/{stat_division}")
+
+    def initial(self) -> Optional[StatsTable]:
+        """The table /stats/ opens with, the first key of every axis."""
+        return self._tables.get((0, 0, 0, 0))
+
+
+def _column(values: list) -> np.ndarray:
+    """Pack column values into the narrowest fitting array type."""
+    if values and all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        return np.array(values, dtype=np.int64)
+    if values and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        return np.array(values, dtype=np.float64)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
@@ -0,0 +1,419 @@
+"""
+synthetic_db.py
+
+This module builds a synthetic database with the interface of `mmrDB` that the routes and the
+derived structures use, for benchmarks and load tests that should not depend on the real data.
+
+The size is set by the number of divisions, contestants per division, matches and titles, and
+the content is reproducible from a seed. Matches are played every week between random
+contestants of one division and move their MMR with an Elo update, so the rank histories,
+title reigns and stats tables have the same shape as the real ones.
+
+Classes:
+    - SyntheticContestant: A wrestler, with stats, rank history and title history.
+    - SyntheticTitle: A title and its matches.
+    - SyntheticMatch: A match between contestants of one division.
+    - SyntheticDivision: A division and its contestants.
+    - SyntheticDB: The database.
+
+Functions:
+    - build_synthetic_db: Build a database of the given size.
+"""
+import datetime
+import random
+from collections import defaultdict
+from typing import Any, Optional
+
+DIVISIONS = [("M1", "Men's Solo"), ("M2", "Men's Duos"), ("M3", "Men's Trios"),
+             ("W1", "Women's Solo"), ("W2", "Women's Duos"), ("W3", "Women's Trios")]
+MMR_KEYS = ["mmr", "mmr_noreset"]
+STAT_KEYS = ["wins", "losses", "draws", "win_percent", "matches"]
+DIVISION_KEYS = ["singles", "tag", "total"]
+EVENTS = ["Dynamite", "Rampage", "Collision", "Dark", "PPV"]
+START_DATE = datetime.date(2019, 10, 2)
+START_MMR = 1000.0
+K_FACTOR = 32
+
+
+class SyntheticMatch:
+    """
+    A match between contestants of one division.
+    """
+
+    def __init__(self, date: datetime.date, event: str, winners: list, losers: list, draw: bool,
+                 title: Optional["SyntheticTitle"], match_type: str):
+        self.date = date
+        self.event = event
+        self.winners = winners
+        self.losers = losers
+        self.draw = draw
+        self.title = title
+        self.match_type = match_type
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "date": self.date.isoformat(),
+            "event": self.event,
+            "winner": ", ".join(map(str, self.winners)),
+            "loser": ", ".join(map(str, self.losers)),
+            "draw": self.draw,
+            "title": self.title.name if self.title else "",
+            "match_type": self.match_type,
+        }
+
+
+class SyntheticContestant:
+    """
+    A wrestler, with stats, rank history and title history.
+    """
+
+    def __init__(self, name: str, division: "SyntheticDivision"):
+        self.name = name
+        self.full_name = name
+        self.wrestlers = name
+        self.is_team = False
+        self.division = division
+        self.mmr_dict = {key: START_MMR for key in MMR_KEYS}
+        self.main_mmr_keys = ["mmr"]
+        self.main_division_key = "singles"
+        self.matches: list[SyntheticMatch] = []
+        self.records: dict[Any, list[int]] = defaultdict(lambda: [0, 0, 0])
+        # (date, event, rank, mmr) after every match
+        self.history: list[tuple[str, str, int, float]] = []
+        self.reigns: list[dict[str, Any]] = []
+
+    def __str__(self) -> str:
+        return self.name
+
+    @property
+    def name_link(self) -> str:
+        return f'<a href="/wrestlers/{self.name}">{self.name}</a>'
+
+    def api_wrestlers(self) -> dict[str, Any]:
+        stats = {}
+        for year, (wins, losses, draws) in self.records.items():
+            record = f"{wins}-{losses}-{draws}"
+            stats[year] = {"name": self.name, "record": {key: record for key in DIVISION_KEYS},
+                           "main_mmr": round(self.mmr_dict["mmr"])}
+        stats.setdefault("alltime", {"name": self.name, "record": {key: "0-0-0" for key in DIVISION_KEYS},
+                                     "main_mmr": round(self.mmr_dict["mmr"])})
+        return {
+            "name": self.name,
+            "is_team": self.is_team,
+            "aliases": "",
+            "stats": stats,
+            "match_history": [match.to_json() for match in self.matches],
+            "rank_history": {
+                date: {"event": event, "solo_mmr": {"rank": rank, "mmr": mmr, "division": self.division.abr}}
+                for date, event, rank, mmr in self.history
+            },
+            "titles": [reign for reign in self.reigns if reign["reign"] is None],
+            "title_history": list(self.reigns),
+            "title_match_history": [],
+        }
+
+    def api_ranking_cards(self) -> dict[str, Any]:
+        wins, losses, draws = self.records["alltime"]
+        return {"Name": self.name_link, "MMR": round(self.mmr_dict["mmr"]), "Record": f"{wins}-{losses}-{draws}"}
+
+
+class SyntheticTitle:
+    """
+    A title and its matches.
+    """
+
+    def __init__(self, name: str, division: "SyntheticDivision"):
+        self.name = name
+        self.championship = name
+        self.division = division
+        self.matches: list[SyntheticMatch] = []
+        # (holder, start, end) with end None while running
+        self.reigns: list[tuple[SyntheticContestant, datetime.date, Optional[datetime.date]]] = []
+
+    def api_title(self) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        owners = [{"owner": holder.name_link, "won": start.isoformat(), "lost": end.isoformat() if end else ""}
+                  for holder, start, end in self.reigns]
+        return owners, [match.to_json() for match in self.matches]
+
+
+class SyntheticDivision:
+    """
+    A division and its contestants.
+    """
+
+    def __init__(self, name: str, abr: str):
+        self.name = name
+        self.abr = abr
+        self.contestants: list[SyntheticContestant] = []
+        self.duos = abr.endswith("2")
+
+    def api_divisions(self) -> list[dict[str, Any]]:
+        rows = []
+        for rank, contestant in enumerate(sorted(self.contestants, key=lambda c: -c.mmr_dict["mmr"]), 1):
+            wins, losses, draws = contestant.records["alltime"]
+            rows.append({"Rank": rank, "Name": contestant.name_link, "MMR": round(contestant.mmr_dict["mmr"]),
+                         "Record": f"{wins}-{losses}-{draws}", "Matches": len(contestant.matches)})
+        return rows
+
+    def api_test(self) -> list[dict[str, Any]]:
+        return self.api_divisions()
+
+    def api_list_wrestlers(self, key: str) -> list[str]:
+        return [getattr(contestant, key) for contestant in self.contestants]
+
+    def api_graphs_mmrs(self, year, division_key, stat_key, mmr_key, include_winless) -> list[float]:
+        return [float(contestant.mmr_dict.get(mmr_key, START_MMR)) for contestant in self._contestants(include_winless)]
+
+    def api_graphs_mmrs_allyears(self, division_key, stat_key, mmr_key, include_winless) -> dict[str, list[float]]:
+        return {str(year): self.api_graphs_mmrs(year, division_key, stat_key, mmr_key, include_winless)
+                for year in self._years()}
+
+    def api_graphs_generic(self, year, division_key, stat_key, include_winless) -> list[float]:
+        return [float(_stat(contestant, year, stat_key)) for contestant in self._contestants(include_winless)]
+
+    def api_graphs_generic_allyears(self, division_key, stat_key, include_winless) -> dict[str, list[float]]:
+        return {str(year): self.api_graphs_generic(year, division_key, stat_key, include_winless)
+                for year in self._years()}
+
+    def _contestants(self, include_winless) -> list[SyntheticContestant]:
+        if include_winless:
+            return self.contestants
+        return [contestant for contestant in self.contestants if contestant.records["alltime"][0]]
+
+    def _years(self) -> list[int]:
+        return sorted({year for contestant in self.contestants for year in contestant.records if year != "alltime"})
+
+
+class SyntheticDB:
+    """
+    The database, with the attributes and `api_*` methods of `mmrDB` the website uses.
+    """
+
+    def __init__(self, divisions: list[SyntheticDivision], titles: list[SyntheticTitle],
+                 matches: list[SyntheticMatch]):
+        self.divisions = divisions
+        self.titles = titles
+        self.matches = matches
+        last = matches[-1] if matches else None
+        self.date_last_updated = last.date.isoformat() if last else START_DATE.isoformat()
+        self.rankings_updated = {"date": self.date_last_updated, "event": last.event if last else ""}
+        self.current_year = last.date.year if last else START_DATE.year
+        self.new_broadcasts: list[str] = []
+        self.new_events: list[str] = []
+        self._contestants = {(division.abr, contestant.name): contestant
+                             for division in divisions for contestant in division.contestants}
+
+    def get_division(self, abr: str) -> Optional[SyntheticDivision]:
+        return next((division for division in self.divisions if division.abr == abr), None)
+
+    def get_contestant(self, division: SyntheticDivision, name: str) -> Optional[SyntheticContestant]:
+        return self._contestants.get((division.abr, name))
+
+    def get_title(self, name: str) -> Optional[SyntheticTitle]:
+        return next((title for title in self.titles if title.name == name), None)
+
+    def api_titles(self) -> tuple[list, list, list]:
+        titles = [{"Title": title.name, "Division": title.division.name,
+                   "Champion": title.reigns[-1][0].name_link if title.reigns and title.reigns[-1][2] is None else ""}
+                  for title in self.titles]
+        reigns = [{"Title": title.name, "Holder": holder.name_link, "Won": start.isoformat(),
+                   "Lost": end.isoformat() if end else ""}
+                  for title in self.titles for holder, start, end in title.reigns]
+        counts: dict[str, int] = defaultdict(int)
+        for title in self.titles:
+            for holder, _, _ in title.reigns:
+                counts[holder.name] += 1
+        owners = [{"Owner": name, "Reigns": count} for name, count in sorted(counts.items(), key=lambda i: -i[1])]
+        return titles, reigns, owners
+
+    def api_rankings_top_10(self) -> dict[str, list[dict[str, Any]]]:
+        return {division.name: [contestant.api_ranking_cards() for contestant in self._ranked(division)[:10]]
+                for division in self.divisions}
+
+    def api_rankings_extended(self) -> list[dict[str, Any]]:
+        divisions = []
+        for division in self.divisions:
+            mmr_keys = {}
+            for key in MMR_KEYS:
+                ranked = sorted(division.contestants, key=lambda contestant: -contestant.mmr_dict[key])
+                mmr_keys[key] = {
+                    "wrestlers": [{"name": contestant.name_link, "mmr": round(contestant.mmr_dict[key])}
+                                  for contestant in ranked[:15]],
+                    "max_mmrs": [{"year": year, "name": ranked[0].name_link, "rating": round(ranked[0].mmr_dict[key])}
+                                 for year in division._years()],
+                }
+            divisions.append({"name": division.name, "mmr_keys": mmr_keys})
+        return divisions
+
+    def api_rankings_recent_cards(self) -> dict[str, list[SyntheticContestant]]:
+        recent: dict[str, list[SyntheticContestant]] = {}
+        for match in self.matches[-10:]:
+            recent.setdefault(match.event, []).extend(match.winners + match.losers)
+        return recent
+
+    def api_stats_keys(self) -> tuple[list, list, list, list]:
+        years = sorted({match.date.year for match in self.matches})
+        return [division.abr for division in self.divisions], ["alltime", *years], list(MMR_KEYS), list(DIVISION_KEYS)
+
+    def api_stats_get(self, division: str, year, mmr_key: str, stat_division: str) -> list[dict[str, Any]]:
+        found = self.get_division(division)
+        if found is None:
+            return []
+        key = year if year == "alltime" else int(year)
+        return [{"Name": contestant.name_link, "MMR": round(contestant.mmr_dict.get(mmr_key, START_MMR)),
+                 **{stat: _stat(contestant, key, stat) for stat in STAT_KEYS}}
+                for contestant in found.contestants]
+
+    def api_graphs_keys(self) -> tuple[list, list, list, list, list, list, list]:
+        abrs = [division.abr for division in self.divisions]
+        return abrs, list(STAT_KEYS), list(DIVISION_KEYS), list(MMR_KEYS), abrs, list(STAT_KEYS), list(DIVISION_KEYS)
+
+    def api_fanhub_wrestler_list(self) -> dict[str, dict[str, Any]]:
+        lists = {}
+        for division in self.divisions:
+            ranked = self._ranked(division)
+            titles = [{"name": title.name, "owner": title.reigns[-1][0].name if title.reigns else ""}
+                      for title in self.titles if title.division is division]
+            lists[division.name] = {
+                "titles": titles,
+                "wrestlers": [contestant.name for contestant in ranked],
+                "wrestlers_html": "".join(f'<option value="{c.name}">{c.name}</option>' for c in ranked),
+            }
+        return lists
+
+    def api_rankings_helper(self) -> tuple[list, list, list, list]:
+        champions = [{"Title": title.name, "Champion": title.reigns[-1][0].name}
+                     for title in self.titles if title.reigns and title.reigns[-1][2] is None]
+        by_size: dict[str, list[SyntheticContestant]] = {"1": [], "2": [], "3": []}
+        for division in self.divisions:
+            by_size.setdefault(division.abr[-1], []).extend(division.contestants)
+        return champions, by_size["1"], by_size["2"], by_size["3"]
+
+    def api_rankings_helper_post(self, name: str) -> dict[str, Any]:
+        for division in self.divisions:
+            contestant = self.get_contestant(division, name)
+            if contestant is not None:
+                return contestant.api_ranking_cards()
+        return {}
+
+    def api_debug_new_contestants(self) -> dict[str, list[str]]:
+        return {}
+
+    def api_debug_team_errors(self) -> list:
+        return []
+
+    def api_debug_placement_points(self) -> list:
+        return []
+
+    @staticmethod
+    def _ranked(division: SyntheticDivision) -> list[SyntheticContestant]:
+        return sorted(division.contestants, key=lambda contestant: -contestant.mmr_dict["mmr"])
+
+
+def build_synthetic_db(divisions: int = 6, contestants: int = 40, matches: int = 5000, titles: int = 6,
+                       seed: int = 1) -> SyntheticDB:
+    """
+    Build a database of the given size.
+
+    Args:
+        divisions (int): Number of divisions.
+        contestants (int): Contestants per division, at least 2.
+        matches (int): Number of matches, six per week.
+        titles (int): Number of titles, spread over the divisions.
+        seed (int): Seed of the random matchups and results.
+
+    Returns:
+        SyntheticDB: The database.
+    """
+    rng = random.Random(seed)
+    division_list = []
+    for i in range(divisions):
+        abr, name = DIVISIONS[i] if i < len(DIVISIONS) else (f"X{i}", f"Division {i}")
+        division = SyntheticDivision(name, abr)
+        division.contestants = [SyntheticContestant(f"{abr} Wrestler {j}", division) for j in range(max(contestants, 2))]
+        division_list.append(division)
+    title_list = [SyntheticTitle(f"{division_list[i % divisions].name} Title {i}", division_list[i % divisions])
+                  for i in range(titles if divisions else 0)]
+    titles_by_division = defaultdict(list)
+    for title in title_list:
+        titles_by_division[title.division.abr].append(title)
+
+    match_list = []
+    day = START_DATE
+    for i in range(matches if divisions else 0):
+        if i % 6 == 0:
+            day += datetime.timedelta(days=7)
+        division = rng.choice(division_list)
+        winner, loser = rng.sample(division.contestants, 2)
+        draw = rng.random() < 0.02
+        division_titles = titles_by_division[division.abr]
+        title = rng.choice(division_titles) if division_titles and rng.random() < 0.05 else None
+        match = SyntheticMatch(day, f"{rng.choice(EVENTS)} {day.isoformat()}", [winner], [loser], draw, title,
+                               DIVISION_KEYS[0])
+        _play(match, day)
+        if title is not None:
+            title.matches.append(match)
+            _change_title(title, match)
+        match_list.append(match)
+
+    for division in division_list:
+        # Ranks of the latest history entry, within the division
+        for rank, contestant in enumerate(SyntheticDB._ranked(division), 1):
+            if contestant.history:
+                date, event, _, mmr = contestant.history[-1]
+                contestant.history[-1] = (date, event, rank, mmr)
+    for title in title_list:
+        for holder, start, end in title.reigns:
+            days = ((end or day) - start).days
+            holder.reigns.append({
+                "title": title.name, "date": start.isoformat(), "reign": None if end is None else f"{days} days",
+                "defenses": 0, "prestidge": 1, "mmr": round(holder.mmr_dict["mmr"]),
+                "owner": {"name": holder.name, "is_team": holder.is_team, "full_name": holder.full_name},
+                "matches": [], "reign_int": days,
+            })
+    return SyntheticDB(division_list, title_list, match_list)
+
+
+def _play(match: SyntheticMatch, day: datetime.date):
+    """Update records, MMRs and rank histories with the result of a match."""
+    winner, loser = match.winners[0], match.losers[0]
+    for contestant in (winner, loser):
+        contestant.matches.append(match)
+    for key in ("alltime", day.year):
+        if match.draw:
+            winner.records[key][2] += 1
+            loser.records[key][2] += 1
+        else:
+            winner.records[key][0] += 1
+            loser.records[key][1] += 1
+    for mmr_key in MMR_KEYS:
+        expected = 1 / (1 + 10 ** ((loser.mmr_dict[mmr_key] - winner.mmr_dict[mmr_key]) / 400))
+        change = K_FACTOR * ((0.5 if match.draw else 1) - expected)
+        winner.mmr_dict[mmr_key] += change
+        loser.mmr_dict[mmr_key] -= change
+    for contestant in (winner, loser):
+        # Ranks are filled in for the latest entry only, the history keeps the order of the matches
+        contestant.history.append((day.isoformat(), match.event, 0, round(contestant.mmr_dict["mmr"], 2)))
+
+
+def _change_title(title: SyntheticTitle, match: SyntheticMatch):
+    """Start a new reign when the champion lost or the title was vacant."""
+    winner = match.winners[0]
+    if match.draw or (title.reigns and title.reigns[-1][0] is winner):
+        return
+    if title.reigns:
+        holder, start, _ = title.reigns[-1]
+        title.reigns[-1] = (holder, start, match.date)
+    title.reigns.append((winner, match.date, None))
+
+
+def _stat(contestant: SyntheticContestant, year, stat_key: str) -> float:
+    wins, losses, draws = contestant.records.get(year, (0, 0, 0))
+    played = wins + losses + draws
+    return {
+        "wins": wins,
+        "losses": losses,
+        "draws": draws,
+        "matches": played,
+        "win_percent": round(100 * wins / played, 1) if played else 0.0,
+    }.get(stat_key, 0)
@@ -0,0 +1,209 @@
+"""
+timing.py
+
+This module breaks the time of a request down by layer and reports it in a Server-Timing header.
+
+Code that belongs to a layer runs in a span (`with span("db"):` or the `@timed("db")` decorator).
+The durations of the spans of a request are added up per layer, so a page that builds five
+tables reports one `table` entry with their total time. The request is found through a context
+variable, which the thread pool and the single-flight tasks inherit, so spans in worker threads
+count towards the request that started them. Outside of a request a span does nothing.
+
+A span inside a span of the same layer is not counted again, e.g. a `db.api_*` method calling a
+`Division.api_*` method.
+
+Layers:
+    - db: `api_*` methods of mmrDB and Division.
+    - table: html_table (json2html).
+    - graphs: Matplotlib drawing in util_matlib and the rankings card.
+    - template: Rendering a TemplateResponse.
+
+The header is sent with the response start, so for streaming responses it only holds the spans
+that finished before the first chunk. Finished requests with all their spans are kept in a ring
+buffer for the admin page.
+
+Classes:
+    - RequestTiming: Span totals of one request.
+    - ServerTimingMiddleware: ASGI middleware adding the Server-Timing header and filling the ring buffer.
+
+Functions:
+    - span: Context manager timing a block as part of a layer.
+    - timed: Decorator timing a function as part of a layer.
+    - instrument: Time the methods of a class with a given prefix.
+    - slowest: The slowest requests in the ring buffer.
+
+Environment Variables:
+    - SERVER_TIMING_HISTORY: Finished requests kept for the admin page, 0 to keep none. Defaults to 500.
+
+Global Variables:
+    - history: Ring buffer of finished requests.
+
+Dependencies:
+    - starlette
+"""
+import collections
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+SERVER_TIMING_HISTORY = int(os.environ.get("SERVER_TIMING_HISTORY", "500"))
+
+history: collections.deque = collections.deque(maxlen=SERVER_TIMING_HISTORY)
+
+
+class RequestTiming:
+    """
+    Span totals of one request.
+
+    Attributes:
+        start (float): perf_counter when the request started.
+        spans (dict[str, list]): Layer name to [total seconds, count].
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            total = self.spans.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+
+    def header(self) -> str:
+        """
+        The Server-Timing header value, with the total time so far.
+
+        Returns:
+            str: e.g. `db;dur=12.3, template;dur=4.0, total;dur=18.9`.
+        """
+        with self._lock:
+            entries = [f"{name};dur={seconds * 1000:.1f}" for name, (seconds, _) in self.spans.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar("request_timing", default=None)
+# Layers with a span open in this context
+_open: contextvars.ContextVar[frozenset] = contextvars.ContextVar("open_spans", default=frozenset())
+
+
+@contextlib.contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Time a block as part of a layer of the current request.
+
+    Args:
+        name (str): The layer, a Server-Timing metric name (no spaces or commas).
+    """
+    timing = _current.get()
+    open_spans = _open.get()
+    if timing is None or name in open_spans:
+        yield
+        return
+
+    token = _open.set(open_spans | {name})
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+        _open.reset(token)
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator timing a function as part of a layer of the current request.
+
+    Args:
+        name (str): The layer.
+
+    Returns:
+        Callable[[Callable], Callable]: The decorator.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument(cls: type, prefix: str, name: str):
+    """
+    Time every method of a class whose name starts with a prefix.
+
+    Args:
+        cls (type): The class, patched in place.
+        prefix (str): Method name prefix, e.g. "api_".
+        name (str): The layer.
+    """
+    for attribute, value in list(vars(cls).items()):
+        if attribute.startswith(prefix) and callable(value) and not hasattr(value, "__wrapped__"):
+            setattr(cls, attribute, timed(name)(value))
+
+
+def slowest(limit: int = 50) -> list[dict[str, Any]]:
+    """
+    The slowest requests in the ring buffer.
+
+    Args:
+        limit (int): Requests returned at most.
+
+    Returns:
+        list[dict[str, Any]]: time, method, path, status, total_ms and the milliseconds and count of
+            every layer, slowest first.
+    """
+    return sorted(list(history), key=lambda entry: -entry["total_ms"])[:limit]
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware adding the Server-Timing header and filling the ring buffer.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+        status = 500
+
+        async def send_timing(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("Server-Timing", timing.header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timing)
+        finally:
+            _current.reset(token)
+            if SERVER_TIMING_HISTORY:
+                history.append({
+                    "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "total_ms": round((time.perf_counter() - timing.start) * 1000, 1),
+                    "spans": {name: (round(seconds * 1000, 1), count)
+                              for name, (seconds, count) in timing.spans.items()},
+                })
@@ -0,0 +1,249 @@
+"""
+title_index.py
+
+This module indexes the reigns of every title for point-in-time questions and caches the
+rendered /titles/ pages.
+
+The reigns of a title are kept as arrays sorted by start date, so the champion on a date is one
+bisect and the reigns overlapping a date range are a bisect on the start dates plus one on the
+running maximum of the end dates. Reigns come from the title history of every contestant, a reign
+ends `reign_int` days after it started or is still running when its `reign` is None.
+
+The tables of /titles/ and of every title with a reign are rendered once per database load, the
+page of any other title the first time it is requested, under a lock since requests run in threads.
+
+Classes:
+    - ReignIndex: Reigns of one title with point and range queries.
+    - TitleIndex: Reign indexes of every title and the rendered title pages.
+
+Dependencies:
+    - numpy
+    - Local modules: website.util
+"""
+import datetime
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+from website.util import day_number, html_table, wrestler_histories
+
+# End of a reign that is still running
+OPEN_END = np.iinfo(np.int32).max
+
+
+@dataclass
+class ReignIndex:
+    """
+    Reigns of one title, sorted by start date.
+
+    Attributes:
+        title (str): The title name.
+        holders (list[str]): Holder of each reign.
+        start (np.ndarray): First day of each reign as days since 0001-01-01 (int32).
+        end (np.ndarray): Day after the last day of each reign, OPEN_END if still running (int32).
+        end_max (np.ndarray): Running maximum of `end`, sorted for bisecting (int32).
+    """
+    title: str
+    holders: list[str]
+    start: np.ndarray
+    end: np.ndarray
+    end_max: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.holders)
+
+    @classmethod
+    def from_reigns(cls, title: str, reigns: list[tuple[int, int, str]]) -> "ReignIndex":
+        """
+        Build the index from (start, end, holder) reigns.
+
+        Args:
+            title (str): The title name.
+            reigns (list[tuple[int, int, str]]): The reigns, in any order.
+
+        Returns:
+            ReignIndex: The index.
+        """
+        reigns = sorted(reigns)
+        end = np.array([reign[1] for reign in reigns], dtype=np.int32)
+        return cls(
+            title=title,
+            holders=[reign[2] for reign in reigns],
+            start=np.array([reign[0] for reign in reigns], dtype=np.int32),
+            end=end,
+            end_max=np.maximum.accumulate(end) if len(end) else end,
+        )
+
+    def holder_on(self, date: datetime.date) -> Optional[dict[str, Any]]:
+        """
+        The champion on a date.
+
+        Args:
+            date (date): The date.
+
+        Returns:
+            Optional[dict[str, Any]]: holder, reign (1 for the first reign of the title), start and end
+                (None while running) of the reign, None if the title was vacant or not created yet.
+        """
+        day = date.toordinal()
+        i = int(np.searchsorted(self.start, day, "right")) - 1
+        if i < 0 or self.end[i] <= day:
+            return None
+        return self._reign(i)
+
+    def days_held(self, start: datetime.date, end: datetime.date) -> list[dict[str, Any]]:
+        """
+        Days every holder held the title between two dates, both included.
+
+        Running reigns count until today.
+
+        Args:
+            start (date): First date.
+            end (date): Last date.
+
+        Returns:
+            list[dict[str, Any]]: holder, days and reigns (count overlapping the range), most days first.
+        """
+        first, stop = start.toordinal(), min(end.toordinal(), datetime.date.today().toordinal()) + 1
+        # Reigns ending after `first` and starting before `stop`
+        low = int(np.searchsorted(self.end_max, first, "right"))
+        high = int(np.searchsorted(self.start, stop, "left"))
+
+        held: dict[str, list[int]] = {}
+        for i in range(low, high):
+            days = min(int(self.end[i]), stop) - max(int(self.start[i]), first)
+            if days > 0:
+                total = held.setdefault(self.holders[i], [0, 0])
+                total[0] += days
+                total[1] += 1
+        return [{"holder": holder, "days": days, "reigns": reigns}
+                for holder, (days, reigns) in sorted(held.items(), key=lambda item: -item[1][0])]
+
+    def _reign(self, i: int) -> dict[str, Any]:
+        return {
+            "holder": self.holders[i],
+            "reign": i + 1,
+            "start": datetime.date.fromordinal(int(self.start[i])).isoformat(),
+            "end": None if self.end[i] == OPEN_END else datetime.date.fromordinal(int(self.end[i])).isoformat(),
+        }
+
+
+class TitleIndex:
+    """
+    Reign indexes of every title and the rendered title pages.
+
+    Attributes:
+        titles_html (dict[str, str]): The titles, reigns and owners tables of /titles/.
+        build_seconds (float): Time it took to build the index.
+    """
+
+    def __init__(self, reigns: dict[str, ReignIndex], titles_html: dict[str, str],
+                 pages: dict[str, dict[str, str]], build_seconds: float = 0.0):
+        self.titles_html = titles_html
+        self.build_seconds = build_seconds
+        self._reigns = reigns
+        self._pages = pages
+        self._pages_lock = threading.Lock()
+
+    @classmethod
+    def from_db(cls, db, wrestlers: Optional[dict[str, dict]] = None) -> "TitleIndex":
+        """
+        Index the reigns and render the title pages of a loaded database.
+
+        Args:
+            db (mmrDB): The database.
+            wrestlers (Optional[dict[str, dict]]): `wrestler_histories(db)`, computed if not given.
+
+        Returns:
+            TitleIndex: The index.
+        """
+        start = time.perf_counter()
+        reigns: dict[str, set[tuple[int, int, str]]] = {}
+        if wrestlers is None:
+            wrestlers = wrestler_histories(db)
+        for name, data in wrestlers.items():
+            for entry in data.get("title_history", []):
+                first = day_number(entry["date"])
+                end = OPEN_END if entry.get("reign") is None else first + int(entry.get("reign_int") or 0)
+                holder = _owner_name(entry.get("owner"), name)
+                # Team reigns show up in the history of the team and of its members
+                reigns.setdefault(str(entry["title"]), set()).add((first, end, holder))
+
+        titles, title_reigns, owners = db.api_titles()
+        titles_html = {
+            "titles": html_table(titles, id="titles_table"),
+            "reigns": html_table(title_reigns, id="reigns_table"),
+            "owners": html_table(owners, id="owners_table"),
+        }
+
+        index = cls({title: ReignIndex.from_reigns(title, list(title_reigns))
+                     for title, title_reigns in reigns.items()}, titles_html, {})
+        for title in reigns:
+            try:
+                index.page(db, title)
+            except Exception:
+                logging.exception("Rendering title %s failed", title)
+        index.build_seconds = time.perf_counter() - start
+        return index
+
+    def reigns(self, title: str) -> ReignIndex:
+        """
+        Get the reign index of a title.
+
+        Args:
+            title (str): The title name.
+
+        Returns:
+            ReignIndex: The index.
+
+        Raises:
+            KeyError: If the title has no reigns.
+        """
+        if title not in self._reigns:
+            raise KeyError(f"{title} not found")
+        return self._reigns[title]
+
+    def page(self, db, title: str) -> Optional[dict[str, str]]:
+        """
+        Get the rendered page of a title, rendering it the first time it is requested.
+
+        Args:
+            db (mmrDB): The database the index was built from.
+            title (str): The title name.
+
+        Returns:
+            Optional[dict[str, str]]: name, championship and the owners and matches tables, None if
+                the title does not exist.
+        """
+        page = self._pages.get(title)
+        if page is not None:
+            return page
+        with self._pages_lock:
+            if title not in self._pages:
+                found = db.get_title(title)
+                # Unknown names are not cached, they come from the URL
+                if found is None:
+                    return None
+                owners, matches = found.api_title()
+                self._pages[title] = {
+                    "name": found.name,
+                    "championship": found.championship,
+                    "owners": html_table(owners, id="owners_table"),
+                    "matches": html_table(matches, id="matches_table"),
+                }
+            return self._pages[title]
+
+
+def _owner_name(owner, default: str) -> str:
+    """Name of a title history owner, the full name for teams."""
+    if owner is None:
+        return default
+    if not isinstance(owner, dict):
+        return str(owner)
+    if owner.get("is_team"):
+        return owner.get("full_name") or default
+    return owner.get("name") or default
@@ -5,10 +5,14 @@ This module provides utility functions for various webapp tasks.
 
 Module Components:
 - get_public_IP: Function to retrieve the public IP address of the machine.
+- day_number: Function to turn a date, datetime or ISO date string into a day number.
+- wrestler_histories: Function to get the rank and title history of every contestant once.
 - html_table: Function to generate an HTML table from JSON data.
 - pickle_load: Function to load an object from a pickle file.
 - pickle_save: Function to save an object to a pickle file.
 """
+import datetime
+import functools
 import logging
 import os
 import pickle
@@ -17,12 +21,16 @@ from typing import Union, Any
 
 from json2html import json2html
 
+from website.timing import timed
 
+
+@functools.lru_cache(maxsize=None)
 def get_public_IP() -> str:
     """
     Get public IP address without relying on a web service.
 
     Returns the public IP address of the machine by connecting to a remote server.
+    The result is cached, the probe only runs once per process.
 
     Returns:
     - str: The public IP address as a string if it can be retrieved successfully.
@@ -40,6 +48,42 @@ def get_public_IP() -> str:
         return ""
 
 
+def day_number(value: Union[datetime.date, str]) -> int:
+    """
+    Days since 0001-01-01 of a date, datetime or ISO date string.
+
+    Parameters:
+    - value (Union[datetime.date, str]): The date, only the first 10 characters of a string are read.
+
+    Returns:
+    - int: The proleptic Gregorian ordinal of the date.
+    """
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value[:10])
+    return value.toordinal()
+
+
+def wrestler_histories(db) -> dict[str, dict]:
+    """
+    Get `api_wrestlers()` of every contestant, so the structures built from it share one call per load.
+
+    Parameters:
+    - db (mmrDB): The database.
+
+    Returns:
+    - dict[str, dict]: Contestant name to its data, with "rank_history" and "title_history",
+      in division order. A contestant in several divisions is included once.
+    """
+    histories = {}
+    for division in db.divisions:
+        for contestant in division.contestants:
+            name = str(contestant)
+            if name not in histories:
+                histories[name] = contestant.api_wrestlers()
+    return histories
+
+
+@timed("table")
 def html_table(data: Union[list, dict], id: str = "temp_id", classes: str = "") -> str:
     """
     Generate an HTML table from JSON data.
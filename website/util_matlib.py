@@ -17,6 +17,7 @@ from typing import Union
 from matplotlib import pyplot as plt
 
 from mmr_database.division import Division
+from website.timing import timed
 
 
 def api_mmr_graphs(division: Division, mmr_type, division_key, stat_key, include_winless: bool) -> list[str]:
@@ -58,6 +59,7 @@ def api_graphs(division, division_key, stat_key, include_winless) -> list[str]:
     ]
 
 
+@timed("graphs")
 def _histogram_create_image_html(data: list[list[float]], size: tuple[float, float], title: str) -> str:
     """
     Creates an HTML image tag for a histogram graph.
@@ -110,6 +112,7 @@ def _boxplot_create_image_html(data: Union[list[float], list[list[float]]], labe
            f'data-fullsize="data:image/png;base64,{full_base64}" />'
 
 
+@timed("graphs")
 def _get_image(size, data, label, title) -> str:
     """
     Creates an image file from the given data.